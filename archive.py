@@ -0,0 +1,244 @@
+import asyncio
+import errno
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from metrics import get_metrics, Stopwatch, STAGE_ARCHIVE
+from utils import logger
+
+#  Ограничения архива по умолчанию
+ARCHIVE_RETENTION_DAYS = 30
+ARCHIVE_MAX_SIZE_MB = 5120
+#  Как часто проверять срок хранения и размер архива, секунд
+ARCHIVE_EVICT_INTERVAL_SECONDS = 600
+ARCHIVE_DIR_SUFFIX = "_archive"
+
+
+def is_enabled(settings):
+    return str(settings.get("ARCHIVE_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
+
+
+def archive_dir_for(settings):
+    """
+    Папка архива: ARCHIVE_DIR или соседняя с FOLDER_PATH папка "<имя>_archive".
+    Соседняя папка лежит на том же диске (перенос - переименование) и не попадает в сканирование.
+    """
+    archive_dir = str(settings.get("ARCHIVE_DIR", "") or "").strip()
+    if archive_dir:
+        return archive_dir
+    root = os.path.normpath(settings.get("FOLDER_PATH", ""))
+    return os.path.join(os.path.dirname(root), os.path.basename(root) + ARCHIVE_DIR_SUFFIX)
+
+
+class _ArchiveJob:
+    """Файлы одного отправленного поста и куда их девать."""
+
+    def __init__(self, file_paths, settings, events):
+        self.file_paths = list(file_paths)
+        self.root = os.path.normpath(settings.get("FOLDER_PATH", ""))
+        self.archive_dir = archive_dir_for(settings) if is_enabled(settings) else None  #  None - удалить
+        self.retention_days = int(settings.get("ARCHIVE_RETENTION_DAYS", ARCHIVE_RETENTION_DAYS))
+        self.max_bytes = int(settings.get("ARCHIVE_MAX_SIZE_MB", ARCHIVE_MAX_SIZE_MB)) * 1024 * 1024
+        self.events = events
+        self.done = 0
+        self.errors = []
+
+
+def _unique_path(path):
+    """Путь, не занятый другим файлом: file.jpg -> file_1.jpg -> file_2.jpg ..."""
+    if not os.path.exists(path):
+        return path
+    base, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(f"{base}_{n}{ext}"):
+        n += 1
+    return f"{base}_{n}{ext}"
+
+
+def _move(src, dst):
+    """Переименование; если архив на другом диске - копирование с удалением."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
+def _relative_to(path, root):
+    """Путь относительно root или None, если файл лежит вне root."""
+    try:
+        relative = os.path.relpath(path, root)
+    except ValueError:
+        return None  #  Другой диск (Windows)
+    if relative.startswith(os.pardir) or os.path.isabs(relative):
+        return None
+    return relative
+
+
+def _remove_empty_parents(path, root):
+    """Удаляет опустевшие подпапки внутри root (сам root остаётся)."""
+    if _relative_to(path, root) is None:
+        return
+    parent = os.path.dirname(path)
+    while os.path.normpath(parent) != root and os.path.dirname(parent) != parent:
+        try:
+            os.rmdir(parent)
+        except OSError:
+            return  #  Не пустая или занята
+        parent = os.path.dirname(parent)
+
+
+def _archive_job(job, day):
+    """Переносит (или удаляет) файлы поста. Блокирующая функция."""
+    for path in job.file_paths:
+        try:
+            if job.archive_dir is None:
+                os.remove(path)
+            else:
+                relative = _relative_to(path, job.root) or os.path.basename(path)
+                target = _unique_path(os.path.join(job.archive_dir, day, relative))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _move(path, target)
+                #  Срок хранения в архиве считается по mtime - отсчёт с момента архивации, а не создания файла
+                os.utime(target)
+            job.done += 1
+            _remove_empty_parents(path, job.root)
+        except FileNotFoundError:
+            job.errors.append(f"файл {path} уже удалён")
+        except OSError as e:
+            job.errors.append(f"{path}: {e}")
+
+
+def evict_archive(archive_dir, retention_days, max_bytes):
+    """
+    Чистит архив: сначала файлы старше retention_days (0 - хранить всегда),
+    затем самые старые, пока архив больше max_bytes (0 - без ограничения).
+    Возвращает (число удалённых файлов, освобождено байт). Блокирующая функция.
+    """
+    if not os.path.isdir(archive_dir):
+        return 0, 0
+    files = []  #  (mtime, путь, размер)
+    for dir_path, _, names in os.walk(archive_dir):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, path, st.st_size))
+    files.sort()  #  Самые старые - первыми
+
+    deadline = time.time() - retention_days * 86400 if retention_days > 0 else None
+    total = sum(size for _, _, size in files)
+    removed = freed = 0
+    for mtime, path, size in files:
+        expired = deadline is not None and mtime < deadline
+        over_size = max_bytes > 0 and total > max_bytes
+        if not expired and not over_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        freed += size
+        _remove_empty_parents(path, os.path.normpath(archive_dir))
+    return removed, freed
+
+
+class Archiver:
+    """
+    Фоновая стадия архивации: отправленные посты переносятся в архив по датам
+    (archive/ГГГГ-ММ-ДД/...) без ожидания на пути отправки.
+    Задания копятся в очереди и обрабатываются пачками одним вызовом в потоке;
+    время от времени архив чистится по сроку хранения и размеру (старые - первыми).
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._worker = None
+        self._pending = set()  #  Файлы, которые ещё ждут переноса
+        self._pending_lock = threading.Lock()
+        self._last_evicted = {}  #  папка архива -> время последней чистки
+
+    def submit(self, file_paths, settings, events):
+        """Ставит файлы поста в очередь на архивацию. Вызывается из event loop, не ждёт диска."""
+        job = _ArchiveJob(file_paths, settings, events)
+        with self._pending_lock:
+            self._pending.update(job.file_paths)
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._queue.put_nowait(job)
+
+    def is_pending(self, path):
+        """True, если файл отправлен, но ещё не перенесён (его нельзя ставить в очередь постов заново)."""
+        with self._pending_lock:
+            return path in self._pending
+
+    async def flush(self):
+        """Дожидается переноса всех поставленных файлов (перед остановкой)."""
+        if self._queue is not None and self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.to_thread(self._process, batch)
+            except Exception as e:
+                logger.error(f"Ошибка архивации: {e}")
+            finally:
+                with self._pending_lock:
+                    for job in batch:
+                        self._pending.difference_update(job.file_paths)
+                for job in batch:
+                    self._report(job)
+                    self._queue.task_done()
+
+    def _process(self, batch):
+        """Обрабатывает пачку заданий и при необходимости чистит архив. Блокирующая функция."""
+        day = datetime.now().strftime("%Y-%m-%d")
+        with Stopwatch() as sw:
+            for job in batch:
+                _archive_job(job, day)
+        get_metrics().observe(STAGE_ARCHIVE, sw.seconds)
+
+        now = time.monotonic()
+        for job in batch:
+            archive_dir = job.archive_dir
+            if archive_dir is None:
+                continue
+            last = self._last_evicted.get(archive_dir)
+            if last is not None and now - last < ARCHIVE_EVICT_INTERVAL_SECONDS:
+                continue
+            self._last_evicted[archive_dir] = now
+            removed, freed = evict_archive(archive_dir, job.retention_days, job.max_bytes)
+            if removed:
+                job.events.log(f"🧹 Архив: удалено старых файлов {removed} ({freed / 1024 / 1024:.1f} МБ).")
+
+    @staticmethod
+    def _report(job):
+        if job.done:
+            if job.archive_dir is None:
+                job.events.log(f"🗑️ Удалено файлов: {job.done}.")
+            else:
+                job.events.log(f"📦 В архив перенесено файлов: {job.done} ({job.archive_dir}).")
+        for error in job.errors:
+            job.events.log(f"⚠️ Архивация: {error}")
+
+
+_archiver = Archiver()
+
+
+def get_archiver():
+    """Общая на процесс стадия архивации."""
+    return _archiver
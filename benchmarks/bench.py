@@ -0,0 +1,243 @@
+"""
+Бенчмарк сканирования и отправки без сети.
+
+Создаёт синтетическое дерево медиафайлов, прогоняет scan_folder / FolderIndex и
+send_telegram_post через локальную заглушку Bot API (fake_bot_api.FakeBotApi)
+и печатает отчёт: время сканирования, постов в минуту, p50/p95 поста, пиковый RSS
+и байты "на проводе".
+
+    python benchmarks/bench.py --files 100000 --group-size 5 --posts 50
+    python benchmarks/bench.py --files 1000000 --posts 0                  # только сканирование
+    python benchmarks/bench.py --latency 0.2 --bandwidth-mb 5 --timeout-rate 0.02 --flood-rate 0.05
+
+Все файлы бота (кеши, журналы) пишутся во временную папку, настройки пользователя не трогаются.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fake_bot_api import FakeBotApi  # noqa: E402
+
+BENCH_TOKEN = "123456:BENCH"
+BENCH_CHANNEL = "-1001000000001"
+#  Минимальный заголовок JPEG: сигнатуру проверяет MediaClassifier
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+
+def generate_tree(root, files, group_size, file_size):
+    """
+    Синтетическое дерево: подпапки по group_size файлов (group_size=1 - все файлы в корне).
+    Содержимое каждого файла уникально, чтобы кеш file_id не подменял загрузку.
+    """
+    os.makedirs(root, exist_ok=True)
+    payload = os.urandom(max(0, file_size - len(JPEG_HEADER) - 8))
+    for i in range(files):
+        if group_size > 1:
+            dir_path = os.path.join(root, f"g{i // group_size:07d}")
+            if i % group_size == 0:
+                os.makedirs(dir_path, exist_ok=True)
+        else:
+            dir_path = root
+        with open(os.path.join(dir_path, f"{i:07d}.jpg"), "wb") as f:
+            f.write(JPEG_HEADER + i.to_bytes(8, "big") + payload)
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (None, если платформа не даёт узнать)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss) / 1024 / 1024
+        except ImportError:
+            return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+class BenchEvents:
+    def __init__(self, verbose):
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            print("   ", message)
+
+    def progress(self, value):
+        pass
+
+
+def bench_scan(root):
+    from scanner import scan_folder, FolderIndex, MEDIA_EXTENSIONS
+
+    report = {}
+    started = time.perf_counter()
+    groups = scan_folder(root)
+    report["scan_folder_seconds"] = time.perf_counter() - started
+
+    index = FolderIndex(root, MEDIA_EXTENSIONS)
+    started = time.perf_counter()
+    drained = index.drain()
+    report["index_drain_seconds"] = time.perf_counter() - started
+    started = time.perf_counter()
+    index.refresh()
+    report["index_refresh_seconds"] = time.perf_counter() - started  #  Папка не менялась
+    #  Фактический объём: при повторном --work-dir дерево могло быть создано с другим --files
+    report["files"] = sum(len(group) for group in groups)
+    report["groups"] = len(groups)
+    return report, drained
+
+
+async def bench_send(groups, settings, posts, verbose):
+    from archive import get_archiver
+    from metrics import percentile
+    from telegram_bot import send_telegram_post, start_telegram_bot, stop_telegram_bot
+
+    events = BenchEvents(verbose)
+    if not await start_telegram_bot(BENCH_TOKEN, settings, events):
+        raise RuntimeError("заглушка Bot API не ответила на getMe")
+    durations = []
+    sent = failed = 0
+    started = time.perf_counter()
+    for _, group, _, _ in groups[:posts]:
+        post_started = time.perf_counter()
+        results = await send_telegram_post(BENCH_TOKEN, settings["CHANNEL_ID"], group, settings, events)
+        durations.append(time.perf_counter() - post_started)
+        if results:
+            sent += 1
+        else:
+            failed += 1
+    elapsed = time.perf_counter() - started
+    await get_archiver().flush()
+    await stop_telegram_bot(BENCH_TOKEN, events)
+    return {
+        "posts_sent": sent,
+        "posts_failed": failed,
+        "send_seconds": elapsed,
+        "posts_per_min": sent / elapsed * 60 if elapsed > 0 else 0.0,
+        "post_p50_seconds": percentile(durations, 0.5),
+        "post_p95_seconds": percentile(durations, 0.95),
+    }
+
+
+def bench_settings(root, api, args):
+    return {
+        "BOT_TOKEN": BENCH_TOKEN,
+        "CHANNEL_ID": BENCH_CHANNEL,
+        "FOLDER_PATH": root,
+        "BOT_API_URL": api.url,
+        "READ_TIMEOUT": args.client_timeout,
+        "WRITE_TIMEOUT": args.client_timeout,
+        #  Без --real-limits ограничитель не тормозит: меряем сам конвейер
+        "RATE_LIMIT_CHAT_PER_MINUTE": 20 if args.real_limits else 1_000_000,
+        "RATE_LIMIT_GLOBAL_PER_SECOND": 30 if args.real_limits else 1_000_000,
+        "BACKOFF_BASE_SECONDS": args.backoff_base,
+        "IMAGE_PREP_ENABLED": "0",
+        "VIDEO_FASTSTART_ENABLED": "0",
+        "DUPLICATE_CHECK_ENABLED": "0",  #  Синтетические файлы - не настоящие картинки
+        "METRICS_EXPORT": "off",
+    }
+
+
+def print_report(report):
+    print("\nРезультаты:")
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f"{value:.4f}"
+        print(f"  {key.ljust(width)}  {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сканирования и отправки с заглушкой Bot API")
+    parser.add_argument("--files", type=int, default=10_000, help="файлов в синтетическом дереве")
+    parser.add_argument("--group-size", type=int, default=5, help="файлов в подпапке-группе (1 - плоская папка)")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="размер файла, байт")
+    parser.add_argument("--posts", type=int, default=20, help="сколько постов отправить (0 - только сканирование)")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки, с")
+    parser.add_argument("--bandwidth-mb", type=float, default=0, help="полоса приёма заглушки, МБ/с (0 - без ограничения)")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="доля запросов с имитацией таймаута")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля запросов с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument("--client-timeout", type=float, default=3.0, help="таймаут чтения/записи клиента, с")
+    parser.add_argument("--backoff-base", type=float, default=0.5, help="база экспоненциальной паузы после таймаута, с")
+    parser.add_argument("--real-limits", action="store_true", help="оставить лимиты Telegram (20 сообщений/мин в канал)")
+    parser.add_argument("--work-dir", help="рабочая папка (по умолчанию временная; существующее дерево используется повторно)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочую папку")
+    parser.add_argument("--seed", type=int, default=None, help="seed для инъекции ошибок")
+    parser.add_argument("--json", help="записать отчёт в JSON-файл")
+    parser.add_argument("--verbose", action="store_true", help="показывать лог отправки")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="tgbot-bench-")
+    root = os.path.join(work_dir, "media")
+    #  Кеши и журналы бота (AppData) - внутри рабочей папки
+    os.environ["HOME"] = os.environ["USERPROFILE"] = work_dir
+    from utils import get_app_data_path
+    with open(get_app_data_path("phrases.txt"), "w", encoding="utf-8") as f:
+        f.write("Бенчмарк\n")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = {"files": args.files}  #  Уточняется по результату сканирования
+    try:
+        if os.path.isdir(root) and os.listdir(root):
+            print(f"Используется готовое дерево (--files не учитывается): {root}")
+            report["generate_seconds"] = 0.0
+        else:
+            print(f"Создаём {args.files} файлов в {root} ...")
+            started = time.perf_counter()
+            generate_tree(root, args.files, args.group_size, args.file_size)
+            report["generate_seconds"] = time.perf_counter() - started
+
+        print("Сканирование ...")
+        scan_report, groups = bench_scan(root)
+        report.update(scan_report)
+
+        if args.posts > 0:
+            api = FakeBotApi(
+                latency=args.latency,
+                bandwidth=args.bandwidth_mb * 1024 * 1024,
+                timeout_rate=args.timeout_rate,
+                flood_rate=args.flood_rate,
+                retry_after=args.retry_after,
+                hang_seconds=args.client_timeout + 1,
+                seed=args.seed,
+            ).start()
+            try:
+                print(f"Отправка {min(args.posts, len(groups))} постов через {api.url} ...")
+                report.update(asyncio.run(bench_send(groups, bench_settings(root, api, args), args.posts, args.verbose)))
+            finally:
+                api.stop()
+            stats = api.stats
+            report.update({
+                "requests": stats.requests,
+                "bytes_on_wire": stats.bytes_received + stats.bytes_sent,
+                "bytes_received": stats.bytes_received,
+                "injected_timeouts": stats.injected_timeouts,
+                "injected_429": stats.injected_429,
+            })
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report.get("posts_failed", 0) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Локальная замена Telegram Bot API для бенчмарков.
+
+Понимает методы, которыми пользуется бот (getMe, sendMediaGroup, sendPhoto, sendVideo,
+sendAnimation, sendDocument), отвечает правдоподобными Message и умеет имитировать
+задержку сети, ограниченную полосу, таймауты и 429 Too Many Requests.
+Только стандартная библиотека: HTTP/1.1 с keep-alive поверх asyncio streams.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+
+#  Поле multipart/form-data: заголовки части, пустая строка, значение до границы
+_FIELD = r'name="{}"\r\n(?:[^\r\n]+\r\n)*?\r\n(.*?)\r\n--'
+#  Сколько байт тела запроса держать для разбора полей (сами файлы не сохраняются)
+_PARSE_PREFIX_BYTES = 64 * 1024
+_READ_CHUNK = 64 * 1024
+
+
+class FakeBotApiStats:
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.methods = {}
+        self.injected_timeouts = 0
+        self.injected_429 = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class FakeBotApi:
+    """
+    Сервер в отдельном потоке со своим event loop.
+    latency - задержка ответа (секунды), bandwidth - полоса приёма (байт/с, 0 - без ограничения),
+    timeout_rate / flood_rate - доля запросов, на которые имитируется таймаут / 429.
+    """
+
+    def __init__(self, latency=0.05, bandwidth=0, timeout_rate=0.0, flood_rate=0.0,
+                 retry_after=1, hang_seconds=5.0, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.timeout_rate = timeout_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.hang_seconds = hang_seconds
+        self.stats = FakeBotApiStats()
+        self._random = random.Random(seed)
+        self._message_id = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.port = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="fake-bot-api", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._server.close()
+        #  Зависшие соединения (имитация таймаута) закрываем до остановки loop
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    async def _read_body(self, reader, headers):
+        """Читает тело запроса (Content-Length или chunked) с учётом полосы. Возвращает (начало тела, байт всего)."""
+        prefix = bytearray()
+        received = 0
+
+        async def consume(data):
+            nonlocal received
+            received += len(data)
+            if len(prefix) < _PARSE_PREFIX_BYTES:
+                prefix.extend(data[:_PARSE_PREFIX_BYTES - len(prefix)])
+            if self.bandwidth:
+                await asyncio.sleep(len(data) / self.bandwidth)
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await reader.readline()
+                received += len(size_line)
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    received += len(await reader.readline())
+                    break
+                remaining = size
+                while remaining:
+                    data = await reader.readexactly(min(_READ_CHUNK, remaining))
+                    remaining -= len(data)
+                    await consume(data)
+                received += len(await reader.readexactly(2))
+        else:
+            remaining = int(headers.get("content-length", 0))
+            while remaining:
+                data = await reader.readexactly(min(_READ_CHUNK, remaining))
+                remaining -= len(data)
+                await consume(data)
+        return bytes(prefix), received
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                received = len(request_line)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    received += len(line)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body, body_size = await self._read_body(reader, headers)
+                self.stats.bytes_received += received + body_size
+                self.stats.requests += 1
+
+                path = request_line.split()[1].decode()
+                method = path.rstrip("/").rsplit("/", 1)[-1]
+                self.stats.methods[method] = self.stats.methods.get(method, 0) + 1
+
+                if method != "getMe" and self._random.random() < self.timeout_rate:
+                    self.stats.injected_timeouts += 1
+                    await asyncio.sleep(self.hang_seconds)  #  Клиент не дождётся ответа
+                    break
+                await asyncio.sleep(self.latency)
+                if method != "getMe" and self._random.random() < self.flood_rate:
+                    self.stats.injected_429 += 1
+                    status, payload = 429, {
+                        "ok": False, "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    }
+                else:
+                    status, payload = 200, {"ok": True, "result": self._result(method, headers, body)}
+
+                data = json.dumps(payload).encode()
+                response = (
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Too Many Requests'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n"
+                ).encode() + data
+                writer.write(response)
+                await writer.drain()
+                self.stats.bytes_sent += len(response)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _field(self, headers, body, name):
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            try:
+                return json.loads(body).get(name)
+            except ValueError:
+                return None
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            value = parse_qs(body.decode("utf-8", "replace")).get(name, [None])[0]
+        else:
+            match = re.search(_FIELD.format(name).encode(), body, re.S)
+            if not match:
+                return None
+            value = match.group(1).decode("utf-8", "replace")
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    def _message(self, chat_id, kind):
+        self._message_id += 1
+        n = self._message_id
+        message = {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else -1001, "type": "channel"},
+        }
+        media = {"file_id": f"fake-{kind}-{n}", "file_unique_id": f"u{n}"}
+        if kind == "photo":
+            message["photo"] = [dict(media, width=1280, height=720)]
+        elif kind == "video":
+            message["video"] = dict(media, width=1280, height=720, duration=1)
+        elif kind == "animation":
+            message["animation"] = dict(media, width=320, height=240, duration=1)
+        else:
+            message["document"] = media
+        return message
+
+    def _result(self, method, headers, body):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        chat_id = self._field(headers, body, "chat_id") or -1001
+        if method == "sendMediaGroup":
+            media = self._field(headers, body, "media") or []
+            return [self._message(chat_id, entry.get("type", "photo")) for entry in media]
+        kinds = {"sendPhoto": "photo", "sendVideo": "video", "sendAnimation": "animation", "sendDocument": "document"}
+        if method in kinds:
+            return self._message(chat_id, kinds[method])
+        return True
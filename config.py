@@ -1,15 +1,118 @@
 import configparser
 import os
+from collections.abc import Mapping
+
+from media_types import MediaClassifier
+from scheduler import Schedule, ScheduleError
 from utils import check_disk_space, resource_path, get_app_data_path, logger #  Импортируем
 # from utils import check_disk_space #  Удалить, если импортировали выше
 
 CONFIG_FILE_NAME = "config.ini"  #  Имя файла (без пути)
 
-def load_config(filename=CONFIG_FILE_NAME):
+#  Секции профилей: [Profile:Имя]. Каждый профиль - своя папка, каналы, задержки, фильтры и фразы;
+#  токен, пул соединений и прочие общие настройки берутся из [Telegram].
+PROFILE_SECTION_PREFIX = "Profile:"
+DEFAULT_PROFILE_NAME = "default"
+PROFILE_KEYS = (
+    "FOLDER_PATH", "CHANNEL_ID", "DEFAULT_HASHTAGS", "PHRASES_FILE", "PHRASES_MODE",
+    "WHITELIST_EXTENSIONS", "BLACKLIST_EXTENSIONS", "ARCHIVE_DIR", "POST_WINDOWS", "POST_SLOTS",
+)
+PROFILE_INT_KEYS = ("MIN_DELAY_MINUTES", "MAX_DELAY_MINUTES")
+#  Как часто проверять, не изменился ли config.ini (0 - не следить: опрос будил бы процесс между постами)
+CONFIG_WATCH_SECONDS = 0
+
+
+def parse_channel_ids(value):
+    """CHANNEL_ID может содержать несколько каналов через запятую/пробел. Возвращает список."""
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [part for part in str(value or "").replace(",", " ").split() if part]
+
+
+class Settings(Mapping):
     """
-    Загружает настройки.
-    Сначала пытается загрузить измененный файл из AppData,
-    если не находит - загружает из ресурсов.
+    Неизменяемые настройки профиля. Читаются как словарь (settings.get(...) работает как раньше),
+    а то, что нужно на каждом посте и каждом файле, разобрано один раз при создании:
+    задержки, список каналов, фильтр расширений и расписание.
+    Изменить объект нельзя - при изменении config.ini движок получает новый (PostEngine.apply_settings).
+    Ошибки разбора не бросаются, а складываются в errors; вместо ошибочного значения берётся запасное.
+    """
+
+    def __init__(self, values):
+        self._values = dict(values)
+        self.errors = []
+        try:
+            self.min_delay = int(self._values.get("MIN_DELAY_MINUTES", 10))
+            self.max_delay = int(self._values.get("MAX_DELAY_MINUTES", 120))
+        except (TypeError, ValueError):
+            self.errors.append("задержки должны быть целыми числами (минуты)")
+            self.min_delay, self.max_delay = 10, 120
+        if self.min_delay > self.max_delay:
+            self.errors.append("минимальная задержка больше максимальной")
+            self.min_delay, self.max_delay = self.max_delay, self.min_delay
+        self.channels = tuple(parse_channel_ids(self._values.get("CHANNEL_ID")))
+        self.classifier = MediaClassifier.from_settings(self._values)
+        try:
+            self.schedule = Schedule.from_settings(self._values)
+        except ScheduleError as e:
+            self.errors.append(f"POST_WINDOWS/POST_SLOTS: {e}")
+            self.schedule = Schedule(self.min_delay, self.max_delay)
+
+    @classmethod
+    def coerce(cls, values):
+        """Settings из словаря (или тот же объект, если это уже Settings)."""
+        return values if isinstance(values, cls) else cls(values)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Settings({self._values!r})"
+
+    def replace(self, **changes):
+        """Копия с изменёнными ключами."""
+        return Settings({**self._values, **changes})
+
+    def changed_keys(self, other):
+        """Ключи, значения которых в other отличаются."""
+        keys = set(self._values) | set(other)
+        return {key for key in keys if self._values.get(key) != other.get(key)}
+
+
+class ConfigWatcher:
+    """
+    Следит за config.ini в AppData по mtime и размеру (без сторонних библиотек - один stat за проверку).
+    changed() - True, если файл изменился с прошлой проверки. Блокирующая функция.
+    """
+
+    def __init__(self, filename=CONFIG_FILE_NAME):
+        self.path = get_app_data_path(filename)
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self):
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+def _read_config_file(filename=CONFIG_FILE_NAME):
+    """
+    Читает config.ini: сначала измененный файл из AppData,
+    если его нет - из ресурсов. Возвращает ConfigParser или None.
     """
 
     config = configparser.ConfigParser()
@@ -31,11 +134,22 @@ def load_config(filename=CONFIG_FILE_NAME):
             config.read(resource_path(filename), encoding="utf-8") # Читаем из ресурсов.
         except configparser.Error as e:
             logger.error(f"Ошибка чтения файла конфигурации из ресурсов: {e}")
-            return {}  #  Возвращаем пустой словарь, если не удалось прочитать
+            return None
         except FileNotFoundError:
             logger.error("Файл config.ini не найден.") # Если файла нет
-            return {}
+            return None
 
+    return config
+
+def load_config(filename=CONFIG_FILE_NAME):
+    """
+    Загружает настройки из секции [Telegram].
+    Сначала пытается загрузить измененный файл из AppData,
+    если не находит - загружает из ресурсов.
+    """
+    config = _read_config_file(filename)
+    if config is None:
+        return {}  #  Возвращаем пустой словарь, если не удалось прочитать
 
     if "Telegram" not in config:
         logger.error(f"В файле конфигурации отсутствует секция [Telegram]!")
@@ -45,12 +159,63 @@ def load_config(filename=CONFIG_FILE_NAME):
         "BOT_TOKEN": config.get("Telegram", "BOT_TOKEN", fallback=None),
         "CHANNEL_ID": config.get("Telegram", "CHANNEL_ID", fallback=None),
         "DEFAULT_HASHTAGS": config.get("Telegram", "DEFAULT_HASHTAGS", fallback=""),
+        "PHRASES_FILE": config.get("Telegram", "PHRASES_FILE", fallback="phrases.txt"),
+        "PHRASES_MODE": config.get("Telegram", "PHRASES_MODE", fallback="random"),
         "FOLDER_PATH": config.get("Telegram", "FOLDER_PATH", fallback="C:\\"),
         "DELAY_MINUTES": config.getint("Telegram", "DELAY_MINUTES", fallback=60),
         "MIN_DELAY_MINUTES": config.getint("Telegram", "MIN_DELAY_MINUTES", fallback=10),
         "MAX_DELAY_MINUTES": config.getint("Telegram", "MAX_DELAY_MINUTES", fallback=120),
+        "POST_WINDOWS": config.get("Telegram", "POST_WINDOWS", fallback=""),
+        "POST_SLOTS": config.get("Telegram", "POST_SLOTS", fallback=""),
+        "DRAIN_MAX_POSTS_PER_HOUR": config.getint("Telegram", "DRAIN_MAX_POSTS_PER_HOUR", fallback=60),
+        "CONFIG_WATCH_SECONDS": config.getint("Telegram", "CONFIG_WATCH_SECONDS", fallback=CONFIG_WATCH_SECONDS),
         "WHITELIST_EXTENSIONS": config.get("Telegram", "WHITELIST_EXTENSIONS", fallback=".jpg,.jpeg,.png,.gif,.mp4,.webm,.webp"),
         "BLACKLIST_EXTENSIONS": config.get("Telegram", "BLACKLIST_EXTENSIONS", fallback=".txt,.ini,.log,.docx,.pdf,.zip,.rar,.exe,.7z"),
+        #  Адрес Bot API (пусто - api.telegram.org)
+        "BOT_API_URL": config.get("Telegram", "BOT_API_URL", fallback=""),
+        #  Пул HTTP-соединений сессии бота
+        "POOL_SIZE": config.getint("Telegram", "POOL_SIZE", fallback=8),
+        "POOL_KEEPALIVE_SECONDS": config.getint("Telegram", "POOL_KEEPALIVE_SECONDS", fallback=60),
+        "CONNECT_TIMEOUT": config.getint("Telegram", "CONNECT_TIMEOUT", fallback=20),
+        "READ_TIMEOUT": config.getint("Telegram", "READ_TIMEOUT", fallback=60),
+        "WRITE_TIMEOUT": config.getint("Telegram", "WRITE_TIMEOUT", fallback=60),
+        "POOL_TIMEOUT": config.getint("Telegram", "POOL_TIMEOUT", fallback=10),
+        #  Потоковая загрузка медиа
+        "UPLOAD_CHUNK_KB": config.getint("Telegram", "UPLOAD_CHUNK_KB", fallback=256),
+        "UPLOAD_MEMORY_LIMIT_MB": config.getint("Telegram", "UPLOAD_MEMORY_LIMIT_MB", fallback=4),
+        #  Лимиты загрузки Bot API (0 - по умолчанию: 50 МБ, со своим сервером BOT_API_URL - 2000 МБ)
+        "UPLOAD_MAX_FILE_MB": config.getint("Telegram", "UPLOAD_MAX_FILE_MB", fallback=0),
+        "UPLOAD_MAX_REQUEST_MB": config.getint("Telegram", "UPLOAD_MAX_REQUEST_MB", fallback=0),
+        #  Кеш file_id уже загруженных файлов
+        "FILE_ID_CACHE_MAX_ITEMS": config.getint("Telegram", "FILE_ID_CACHE_MAX_ITEMS", fallback=50000),
+        "FILE_ID_CACHE_MAX_AGE_DAYS": config.getint("Telegram", "FILE_ID_CACHE_MAX_AGE_DAYS", fallback=180),
+        #  Предобработка фото (нужен Pillow)
+        "IMAGE_PREP_ENABLED": config.get("Telegram", "IMAGE_PREP_ENABLED", fallback="0"),
+        "IMAGE_MAX_SIDE": config.getint("Telegram", "IMAGE_MAX_SIDE", fallback=2560),
+        "IMAGE_JPEG_QUALITY": config.getint("Telegram", "IMAGE_JPEG_QUALITY", fallback=87),
+        "VIDEO_FASTSTART_ENABLED": config.get("Telegram", "VIDEO_FASTSTART_ENABLED", fallback="1"),
+        #  Поиск дублей по перцептивному хешу (нужны numpy и Pillow, для видео - ffmpeg)
+        "DUPLICATE_CHECK_ENABLED": config.get("Telegram", "DUPLICATE_CHECK_ENABLED", fallback="1"),
+        "DUPLICATE_MAX_DISTANCE": config.getint("Telegram", "DUPLICATE_MAX_DISTANCE", fallback=6),
+        #  Сколько каналов-зеркал обслуживать одновременно (CHANNEL_ID через запятую)
+        "FANOUT_CONCURRENCY": config.getint("Telegram", "FANOUT_CONCURRENCY", fallback=3),
+        #  Архив отправленных файлов
+        "ARCHIVE_ENABLED": config.get("Telegram", "ARCHIVE_ENABLED", fallback="1"),
+        "ARCHIVE_DIR": config.get("Telegram", "ARCHIVE_DIR", fallback=""),
+        "ARCHIVE_RETENTION_DAYS": config.getint("Telegram", "ARCHIVE_RETENTION_DAYS", fallback=30),
+        "ARCHIVE_MAX_SIZE_MB": config.getint("Telegram", "ARCHIVE_MAX_SIZE_MB", fallback=5120),
+        #  Логи: строк в окне, размер и число файлов лога
+        "LOG_UI_MAX_LINES": config.getint("Telegram", "LOG_UI_MAX_LINES", fallback=2000),
+        "LOG_FILE_MAX_MB": config.getint("Telegram", "LOG_FILE_MAX_MB", fallback=5),
+        "LOG_FILE_BACKUPS": config.getint("Telegram", "LOG_FILE_BACKUPS", fallback=5),
+        #  Выгрузка метрик: prometheus, jsonl, both или off
+        "METRICS_EXPORT": config.get("Telegram", "METRICS_EXPORT", fallback="both"),
+        #  Ограничитель запросов к Bot API и повторы
+        "RATE_LIMIT_GLOBAL_PER_SECOND": config.getint("Telegram", "RATE_LIMIT_GLOBAL_PER_SECOND", fallback=30),
+        "RATE_LIMIT_CHAT_PER_MINUTE": config.getint("Telegram", "RATE_LIMIT_CHAT_PER_MINUTE", fallback=20),
+        "RATE_LIMIT_MAX_RETRIES": config.getint("Telegram", "RATE_LIMIT_MAX_RETRIES", fallback=3),
+        "BACKOFF_BASE_SECONDS": config.getint("Telegram", "BACKOFF_BASE_SECONDS", fallback=2),
+        "BACKOFF_MAX_SECONDS": config.getint("Telegram", "BACKOFF_MAX_SECONDS", fallback=60),
     }
 
     if settings["BOT_TOKEN"] is None or settings["CHANNEL_ID"] is None:
@@ -59,6 +224,40 @@ def load_config(filename=CONFIG_FILE_NAME):
 
     return settings
 
+def load_profiles(settings, filename=CONFIG_FILE_NAME):
+    """
+    Возвращает список профилей [(имя, настройки)].
+    Настройки профиля - общие settings, поверх которых наложены ключи секции [Profile:Имя].
+    Если профилей в config.ini нет, возвращается один профиль "default" с самим словарём settings.
+    """
+    config = _read_config_file(filename)
+    sections = [] if config is None else [s for s in config.sections() if s.startswith(PROFILE_SECTION_PREFIX)]
+    if not sections:
+        return [(DEFAULT_PROFILE_NAME, settings)]
+
+    profiles = []
+    for section in sections:
+        name = section[len(PROFILE_SECTION_PREFIX):].strip() or section
+        profile = dict(settings)
+        for key in PROFILE_KEYS:
+            if config.has_option(section, key):
+                profile[key] = config.get(section, key)
+        try:
+            for key in PROFILE_INT_KEYS:
+                if config.has_option(section, key):
+                    profile[key] = config.getint(section, key)
+        except ValueError as e:
+            logger.error(f"Профиль {name}: некорректная задержка ({e}), профиль пропущен.")
+            continue
+        if not profile.get("CHANNEL_ID") or not profile.get("FOLDER_PATH"):
+            logger.error(f"Профиль {name}: не указаны CHANNEL_ID или FOLDER_PATH, профиль пропущен.")
+            continue
+        profiles.append((name, profile))
+    if not profiles:
+        logger.error("Ни один профиль не настроен корректно, используются настройки [Telegram].")
+        return [(DEFAULT_PROFILE_NAME, settings)]
+    return profiles
+
 def save_config(settings, filename=CONFIG_FILE_NAME):
     """Сохраняет настройки в AppData."""
 
@@ -68,7 +267,8 @@ def save_config(settings, filename=CONFIG_FILE_NAME):
         logger.error(f"Недостаточно места на диске для сохранения конфигурации.")
         return
 
-    config = configparser.ConfigParser()
+    #  Остальные секции (профили) сохраняем как есть
+    config = _read_config_file(filename) or configparser.ConfigParser()
     config["Telegram"] = settings
     try:
         with open(config_path, "w", encoding="utf-8") as f:
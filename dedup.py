@@ -0,0 +1,383 @@
+import asyncio
+import itertools
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
+import time
+
+from config import parse_channel_ids
+from media_cache import MEDIA_CACHE_DB_FILE_NAME
+from media_types import KIND_PHOTO, KIND_VIDEO, KIND_ANIMATION
+from mp4 import Mp4Error, probe
+from utils import get_app_data_path, logger
+
+#  numpy и Pillow импортируются при первой проверке дублей (_load_libraries), а не при запуске программы
+np = None
+Image = None
+ImageOps = None
+
+#  Насколько (в битах из 64) хеш может отличаться, чтобы файл считался дублем
+DUPLICATE_MAX_DISTANCE = 6
+#  dHash 8x8: картинка сжимается до 9x8 в оттенках серого, бит - "левый пиксель ярче правого"
+_HASH_WIDTH = 9
+_HASH_HEIGHT = 8
+_VIDEO_FRAME_TIMEOUT = 30
+#  Кадр видео берём не с самого начала (там часто затемнение или заставка)
+_VIDEO_SEEK_FRACTION = 0.1
+_PHASH_MEMO_SIZE = 4096
+#  Ошибки, при которых файл просто не проверяется на дубли (к ним добавляется DecompressionBombError Pillow)
+_HASH_ERRORS = (OSError, ValueError, subprocess.SubprocessError)
+
+#  История - по каналам: файл, отправленный в один канал, не дубль для другого.
+#  channel = '' - записи из версии без каналов (канал неизвестен), учитываются для всех каналов.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posted_hashes (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    phash INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    posted_at REAL NOT NULL,
+    UNIQUE (channel, digest)
+);
+"""
+_LEGACY_CHANNEL = ""
+
+_phash_memo = {}
+_phash_memo_lock = threading.Lock()
+_warned_missing = False
+#  Файлы постов, которые сейчас отправляются: (канал, digest) -> (хеш, путь). В историю они попадут только
+#  после доставки, а следующий пост (догоняющая отправка) проверяется раньше - сверяем и с ними.
+_sending = {}
+_sending_lock = threading.Lock()
+_libraries_checked = False
+
+
+def is_enabled(settings):
+    return str(settings.get("DUPLICATE_CHECK_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _dhash(pixels):
+    """64-битный dHash по 9x8 пикселям в оттенках серого (bytes построчно)."""
+    value = 0
+    for row in range(_HASH_HEIGHT):
+        offset = row * _HASH_WIDTH
+        for col in range(_HASH_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def image_hash(path):
+    """dHash фото (для GIF - первого кадра). Блокирующая функция."""
+    _load_libraries()
+    with Image.open(path) as im:
+        im.draft("L", (_HASH_WIDTH * 8, _HASH_HEIGHT * 8))  #  JPEG декодируется сразу в уменьшенном виде
+        im = ImageOps.exif_transpose(im).convert("L").resize((_HASH_WIDTH, _HASH_HEIGHT), Image.BILINEAR)
+        return _dhash(im.tobytes())
+
+
+def video_hash(path):
+    """
+    dHash ключевого кадра видео. Кадр декодирует ffmpeg (если он есть в PATH) сразу в 9x8 серого,
+    без него видео не проверяются. Блокирующая функция.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return None
+    try:
+        seek = probe(path)["duration"] * _VIDEO_SEEK_FRACTION
+    except (Mp4Error, OSError, struct.error, KeyError, TypeError):
+        seek = 0
+    frame_size = _HASH_WIDTH * _HASH_HEIGHT
+    for offset in (seek, 0) if seek else (0,):
+        result = subprocess.run(
+            [ffmpeg, "-v", "error", "-ss", f"{offset:.2f}", "-skip_frame", "nokey", "-i", path,
+             "-frames:v", "1", "-vf", f"scale={_HASH_WIDTH}:{_HASH_HEIGHT},format=gray", "-f", "rawvideo", "-"],
+            capture_output=True, timeout=_VIDEO_FRAME_TIMEOUT,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),  #  Без мигающей консоли в сборке --noconsole
+        )
+        if result.returncode == 0 and len(result.stdout) >= frame_size:
+            return _dhash(result.stdout[:frame_size])
+    return None
+
+
+def media_hash(item):
+    """Перцептивный хеш файла поста или None (вид не поддерживается, файл не читается). Блокирующая функция."""
+    digest = item.get("digest")
+    with _phash_memo_lock:
+        if digest in _phash_memo:
+            return _phash_memo[digest]
+    try:
+        if item["kind"] in (KIND_PHOTO, KIND_ANIMATION):
+            value = image_hash(item["path"])
+        elif item["kind"] == KIND_VIDEO:
+            value = video_hash(item["path"])
+        else:
+            value = None
+    except _HASH_ERRORS as e:
+        logger.error(f"Не удалось посчитать хеш {item['path']}: {e}")
+        value = None
+    if digest is not None:
+        with _phash_memo_lock:
+            if len(_phash_memo) >= _PHASH_MEMO_SIZE:
+                _phash_memo.pop(next(iter(_phash_memo)))
+            _phash_memo[digest] = value
+    return value
+
+
+def _popcount(values):
+    """Число единичных битов в каждом элементе массива uint64."""
+    if hasattr(np, "bitwise_count"):  #  numpy >= 2.0
+        return np.bitwise_count(values)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+_POPCOUNT8 = None
+
+
+def _to_signed(value):
+    #  SQLite хранит INTEGER со знаком
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class _HashArray:
+    """Хеши одного канала в массиве uint64 (с запасом под добавление) и id их строк в базе."""
+
+    def __init__(self, ids, hashes):
+        count = len(ids)
+        capacity = max(1024, count * 2)
+        self.hashes = np.empty(capacity, dtype=np.uint64)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.ids[:count] = ids
+        self.hashes[:count] = hashes
+        self.size = count
+
+    def nearest(self, phash):
+        """(расстояние, id строки) ближайшего хеша или None, если хешей нет."""
+        if not self.size:
+            return None
+        distances = _popcount(self.hashes[:self.size] ^ np.uint64(phash))
+        i = int(distances.argmin())
+        return int(distances[i]), int(self.ids[i])
+
+    def append(self, row_id, phash):
+        if self.size == len(self.hashes):
+            self.hashes = np.resize(self.hashes, self.size * 2)
+            self.ids = np.resize(self.ids, self.size * 2)
+        self.hashes[self.size] = phash
+        self.ids[self.size] = row_id
+        self.size += 1
+
+
+class PerceptualIndex:
+    """
+    Перцептивные хеши отправленных фото и видео по каналам.
+    Хранятся в media_cache.db, для поиска загружаются в массивы uint64 (по одному на канал): расстояние
+    Хэмминга до всей истории канала считается одной векторной операцией (XOR + popcount) -
+    миллисекунды на 1 млн записей.
+    Методы блокирующие: из event loop их нужно вызывать через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path=None):
+        _load_libraries()
+        self.db_path = db_path or get_app_data_path(MEDIA_CACHE_DB_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate_legacy()
+        self._arrays = {}  #  канал -> _HashArray
+        rows = self._conn.execute("SELECT channel, id, phash FROM posted_hashes ORDER BY channel")
+        for channel, group in itertools.groupby(rows, key=lambda row: row[0]):
+            data = np.fromiter(((row_id, phash) for _, row_id, phash in group),
+                               dtype=np.dtype([("id", np.int64), ("phash", np.int64)]))
+            self._arrays[channel] = _HashArray(data["id"], data["phash"].view(np.uint64))
+
+    def _migrate_legacy(self):
+        """Переносит историю из таблицы без каналов (perceptual_hashes) с каналом ''."""
+        legacy = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'perceptual_hashes'"
+        ).fetchone()
+        if legacy is None:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO posted_hashes(channel, digest, phash, path, posted_at) "
+            "SELECT ?, digest, phash, path, posted_at FROM perceptual_hashes",
+            (_LEGACY_CHANNEL,),
+        )
+        self._conn.execute("DROP TABLE perceptual_hashes")
+        self._conn.execute("COMMIT")
+
+    def __len__(self):
+        return sum(array.size for array in self._arrays.values())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def find(self, phash, channels, max_distance=DUPLICATE_MAX_DISTANCE):
+        """
+        Ближайший файл, уже отправленный в один из channels, в пределах max_distance:
+        (расстояние, путь) или None.
+        """
+        with self._lock:
+            best = None
+            for channel in {*map(str, channels), _LEGACY_CHANNEL}:
+                array = self._arrays.get(channel)
+                match = array.nearest(phash) if array is not None else None
+                if match is not None and (best is None or match < best):
+                    best = match
+            if best is None or best[0] > max_distance:
+                return None
+            row = self._conn.execute("SELECT path FROM posted_hashes WHERE id = ?", (best[1],)).fetchone()
+        return best[0], row[0] if row else "?"
+
+    def add(self, digest, phash, path, channel):
+        """Запоминает файл, отправленный в channel (повтор того же содержимого не добавляется)."""
+        channel = str(channel)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO posted_hashes(channel, digest, phash, path, posted_at) VALUES (?, ?, ?, ?, ?)",
+                (channel, digest, _to_signed(phash), path, time.time()),
+            )
+            if not cursor.rowcount:
+                return
+            array = self._arrays.get(channel)
+            if array is None:
+                array = self._arrays[channel] = _HashArray(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint64))
+            array.append(cursor.lastrowid, phash)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_perceptual_index():
+    """Общий на процесс индекс хешей (загружается при первом обращении)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PerceptualIndex()
+            logger.info(f"Индекс дублей загружен: {len(_index)} файлов.")
+        return _index
+
+
+def _load_libraries():
+    global np, Image, ImageOps, _POPCOUNT8, _HASH_ERRORS, _libraries_checked
+    if _libraries_checked:
+        return
+    try:
+        import numpy as np
+        _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    except ImportError:  #  numpy нужен только для поиска дублей, без него бот работает как раньше
+        pass
+    try:
+        from PIL import Image, ImageOps
+        #  Огромная картинка не должна срывать подготовку всего поста
+        _HASH_ERRORS += (Image.DecompressionBombError,)
+    except ImportError:
+        pass
+    _libraries_checked = True  #  Хеши считаются в потоках: флаг - только когда всё уже импортировано
+
+
+def _available():
+    global _warned_missing
+    _load_libraries()
+    if np is not None and Image is not None:
+        return True
+    if not _warned_missing:
+        logger.warning("Поиск дублей выключен: нужны numpy и Pillow (pip install numpy pillow).")
+        _warned_missing = True
+    return False
+
+
+def _find_duplicates(items, max_distance, channels):
+    """
+    Считает хеши и делит файлы на новые и дубли [(item, причина)]. Дубль - файл, похожий
+    на отправленный (или отправляемый) хотя бы в один из channels. Блокирующая функция.
+    """
+    index = get_perceptual_index()
+    kept, duplicates = [], []
+    for item in items:
+        item["phash"] = media_hash(item)
+        if item["phash"] is None:
+            kept.append(item)
+            continue
+        match = index.find(item["phash"], channels, max_distance)
+        if match is not None:
+            duplicates.append((item, f"похож на отправленный {match[1]}, отличие {match[0]} бит"))
+            continue
+        match = _find_sending(item["phash"], channels, max_distance)
+        if match is not None:
+            duplicates.append((item, f"похож на отправляемый {match[1]}, отличие {match[0]} бит"))
+            continue
+        twin = next((k for k in kept if k.get("phash") is not None
+                     and bin(k["phash"] ^ item["phash"]).count("1") <= max_distance), None)
+        if twin is not None:
+            duplicates.append((item, f"повтор {twin['path']} в этом же посте"))
+            continue
+        kept.append(item)
+    return kept, duplicates
+
+
+def _find_sending(phash, channels, max_distance):
+    channels = set(map(str, channels))
+    with _sending_lock:
+        distances = [(bin(value ^ phash).count("1"), path)
+                     for (channel, _), (value, path) in _sending.items() if channel in channels]
+    match = min(distances, default=None)
+    return match if match is not None and match[0] <= max_distance else None
+
+
+def hold_sending(items, channels):
+    """Помечает файлы поста как отправляемые в channels: похожие файлы следующих постов будут дублями."""
+    with _sending_lock:
+        for item in items:
+            if item.get("phash") is not None and item.get("digest"):
+                for channel in channels:
+                    _sending[(str(channel), item["digest"])] = (item["phash"], item["path"])
+
+
+def release_sending(items, channels):
+    """Снимает пометку после отправки (доставленные файлы к этому времени уже в истории)."""
+    with _sending_lock:
+        for item in items:
+            for channel in channels:
+                _sending.pop((str(channel), item.get("digest")), None)
+
+
+async def drop_duplicates(items, settings, events):
+    """
+    Убирает из поста фото и видео, похожие (после пережатия, уменьшения) на уже отправленные
+    в каналы профиля (CHANNEL_ID) или на другой файл этого же поста. Возвращает оставшиеся файлы.
+    """
+    if not items or not is_enabled(settings) or not _available():
+        return items
+    max_distance = int(settings.get("DUPLICATE_MAX_DISTANCE", DUPLICATE_MAX_DISTANCE))
+    channels = parse_channel_ids(settings.get("CHANNEL_ID"))
+    kept, duplicates = await asyncio.to_thread(_find_duplicates, items, max_distance, channels)
+    for item, reason in duplicates:
+        events.log(f"♊ Файл {item['path']} пропущен (дубль: {reason}).")
+    return kept
+
+
+def _remember(items, delivered, channels):
+    index = get_perceptual_index()
+    for item in items:
+        if item.get("phash") is not None and item.get("digest") and item["path"] in delivered:
+            for channel in channels:
+                index.add(item["digest"], item["phash"], item["path"], channel)
+
+
+async def remember_posted(items, delivered, settings, channels):
+    """Добавляет хеши доставленных файлов в историю каналов channels (куда пост дошёл)."""
+    if not is_enabled(settings) or not _available() or not any(item.get("phash") is not None for item in items):
+        return
+    try:
+        await asyncio.to_thread(_remember, items, delivered, channels)
+    except sqlite3.Error as e:
+        logger.error(f"Не удалось сохранить хеши отправленных файлов: {e}")
@@ -0,0 +1,723 @@
+import asyncio
+import functools
+import os
+import signal
+import sys
+from datetime import datetime
+
+from archive import get_archiver
+from config import ConfigWatcher, Settings, load_config, load_profiles, CONFIG_WATCH_SECONDS
+from dedup import hold_sending, release_sending
+from image_prep import prune_prep_cache, shutdown_image_pool
+from metrics import get_metrics, Stopwatch, STAGE_SCAN, STAGE_PREPARE, STAGE_UPLOAD
+from mp4 import prune_faststart_cache
+from post_queue import PostQueue, DEFAULT_PROFILE
+from scanner import FolderIndex, list_group
+from utils import logger
+
+#  Через сколько секунд повторить попытку, если отправлять нечего или отправка не удалась
+IDLE_RETRY_SECONDS = 60
+#  Сколько раз пробовать отправить группу, прежде чем пометить её как failed
+MAX_POST_ATTEMPTS = 5
+#  Пауза перед повторной отправкой группы после неудачи (секунды)
+POST_RETRY_DELAY_SECONDS = 300
+#  Пустая очередь: папка перепроверяется всё реже (от IDLE_RETRY_SECONDS вдвое за раз), но не реже этого
+EMPTY_QUEUE_MAX_WAIT_SECONDS = 900
+#  Догоняющая отправка: потолок постов в час и сколько ошибок подряд её останавливают
+DRAIN_MAX_POSTS_PER_HOUR = 60
+DRAIN_MAX_FAILURES = 3
+#  Настройки расписания: подготовленный пост от них не зависит, их смена его (и фразу подписи) не выбрасывает
+SCHEDULE_KEYS = frozenset({
+    "DELAY_MINUTES", "MIN_DELAY_MINUTES", "MAX_DELAY_MINUTES", "POST_WINDOWS", "POST_SLOTS",
+    "DRAIN_MAX_POSTS_PER_HOUR", "CONFIG_WATCH_SECONDS",
+})
+
+
+def _telegram_bot():
+    """
+    Модуль отправки. Он тянет за собой PTB, httpx, numpy и Pillow - это большая часть времени запуска,
+    поэтому загружается при первом обращении (старт бота), а не при импорте движка.
+    """
+    import telegram_bot
+    return telegram_bot
+
+
+class EngineEvents:
+    """
+    Наблюдатель за движком. Все методы вызываются из потока event loop.
+    По умолчанию сообщения просто пишутся в лог - этого достаточно для headless-режима.
+    """
+
+    def log(self, message):
+        logger.info(message)
+
+    def progress(self, value):
+        pass
+
+    def running_changed(self, running):
+        pass
+
+    def auth_failed(self):
+        pass
+
+    def status(self, text):
+        """Краткое состояние профиля (для списка профилей в GUI)."""
+        pass
+
+
+class PrefixedEvents(EngineEvents):
+    """События профиля в headless-режиме: к сообщениям лога добавляется имя профиля."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def log(self, message):
+        logger.info(self.prefix + message)
+
+
+class PostEngine:
+    """
+    Ядро бота без Qt: проверка токена, расписание, сканирование папки и отправка постов.
+    Все корутины выполняются в одном event loop, о событиях сообщается через EngineEvents.
+    """
+
+    def __init__(self, settings, events=None, queue=None, name=DEFAULT_PROFILE):
+        self.name = name
+        self.settings = Settings.coerce(settings)  #  Неизменяемый снимок; новые настройки - apply_settings()
+        self.events = events or EngineEvents()
+        self._log_settings_errors(self.settings)
+        self.running = False
+        self.queue = queue or PostQueue(profile=name)
+        self.last_post_time = self.queue.last_post_time()
+        self._schedule_task = None
+        self._drain_task = None
+        self._drain_stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()  #  reschedule(): пересчитать срок, не дожидаясь таймера
+        self._announced_due = None
+        self._empty_checks = 0  #  Сколько раз подряд очередь оказалась пустой
+        self._send_lock = asyncio.Lock()
+        self._index = None
+        self._prefetched = None  #  (запись очереди, подготовленный пост) - готовится, пока ждём времени поста
+        self._settings_generation = 0  #  Растёт при смене настроек, от которых зависит подготовка поста
+
+    @property
+    def bot_token(self):
+        return self.settings.get("BOT_TOKEN")
+
+    @property
+    def channel_id(self):
+        return self.settings.channels
+
+    def _log_settings_errors(self, settings):
+        for error in settings.errors:
+            self.events.log(f"⚠️ Ошибка в настройках: {error}")
+
+    def apply_settings(self, settings):
+        """
+        Подменяет настройки работающего движка (config.ini изменён). Объект заменяется целиком,
+        поэтому корутины, уже взявшие self.settings, дорабатывают со старым снимком.
+        Индекс папки пересобирается, только если сменились папка или фильтр расширений. Очередь
+        сохраняется: группы из прежней FOLDER_PATH пропускаются (skipped), когда до них доходит очередь,
+        а у остальных файлы перечитываются с новым фильтром расширений.
+        Токен на ходу не меняется (сессия бота общая) - для него нужен перезапуск.
+        Возвращает множество изменившихся ключей.
+        """
+        settings = Settings.coerce(settings)
+        if settings.errors:
+            self._log_settings_errors(settings)
+            self.events.log("⚠️ Новые настройки не применены, работаем со старыми.")
+            return set()
+        changed = self.settings.changed_keys(settings)
+        if "BOT_TOKEN" in changed:
+            self.events.log("⚠️ BOT_TOKEN изменён - вступит в силу после перезапуска бота.")
+            settings = settings.replace(BOT_TOKEN=self.bot_token)
+            changed.discard("BOT_TOKEN")
+        if not changed:
+            return changed
+        self.settings = settings
+        if changed - SCHEDULE_KEYS:
+            #  Подпись и фильтр могли измениться - пост подготовится заново. Подготовка, которая идёт
+            #  сейчас (под _send_lock, а здесь его не взять), увидит новое поколение и результат не сохранит
+            self._settings_generation += 1
+            self._prefetched = None
+        self.reschedule()
+        self.events.log(f"🔄 Настройки обновлены: {', '.join(sorted(changed))}")
+        return changed
+
+    def _set_running(self, running):
+        self.running = running
+        self.events.running_changed(running)
+
+    async def start(self, verify=True):
+        """
+        Проверяет токен и запускает расписание. Возвращает True при успехе.
+        verify=False - токен уже проверен (ProfileRunner проверяет его один раз на все профили).
+        """
+        if self.running:
+            return True
+        if verify and not await _telegram_bot().start_telegram_bot(self.bot_token, self.settings, self.events):
+            self.events.auth_failed()
+            return False
+        await asyncio.to_thread(prune_prep_cache)
+        await asyncio.to_thread(prune_faststart_cache)
+        recovered = await asyncio.to_thread(self.queue.recover)
+        if recovered:
+            self.events.log(f"♻️ Возвращено в очередь прерванных постов: {recovered}")
+        self._set_running(True)
+        self.events.status("▶️ запущен")
+        self._schedule_task = asyncio.create_task(self._schedule_loop())
+        return True
+
+    async def stop(self, close_session=True):
+        """Останавливает расписание и (если close_session) закрывает сессию бота."""
+        await self.stop_drain()
+        if self._schedule_task is not None:
+            self._schedule_task.cancel()
+            try:
+                await self._schedule_task
+            except asyncio.CancelledError:
+                pass
+            self._schedule_task = None
+        self._prefetched = None
+        shutdown_image_pool()
+        await get_archiver().flush()  #  Отправленные файлы должны уйти в архив до выхода
+        if self.running and close_session:
+            await _telegram_bot().stop_telegram_bot(self.bot_token, self.events)
+        self._set_running(False)
+        self.events.status("⛔ остановлен")
+
+    def next_post_time(self):
+        """
+        Срок следующего поста. Считается один раз на пост и хранится в журнале очереди:
+        повторные проверки и перезапуск не перетягивают случайную задержку заново.
+        Пересчитывается, когда меняется время последнего поста или правила расписания.
+        Блокирующая функция (журнал).
+        """
+        schedule = self.settings.schedule
+        basis = self.last_post_time.timestamp() if self.last_post_time is not None else None
+        state = self.queue.next_post_state()
+        if state and state.get("basis") == basis and state.get("rule") == schedule.signature:
+            return datetime.fromtimestamp(state["due"])
+        due = schedule.next_due(self.last_post_time)
+        self.queue.save_next_post_state({"due": due.timestamp(), "basis": basis, "rule": schedule.signature})
+        return due
+
+    def reschedule(self):
+        """Будит цикл расписания: срок будет перепроверен (после внеочередного поста, смены настроек)."""
+        self._wakeup.set()
+
+    async def _wait(self, seconds):
+        """Ждёт seconds секунд на одном таймере. True, если разбудил reschedule()."""
+        if seconds <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _schedule_loop(self):
+        """
+        Ждёт срока следующего поста и отправляет его. Между постами процесс не просыпается:
+        срок известен заранее, ожидание - один таймер до него.
+        """
+        while True:
+            if self.draining:
+                #  Пока очередь догоняется, расписание стоит; срок потом считается от последнего поста
+                await asyncio.wait([self._drain_task])
+            self._wakeup.clear()
+            next_time = await asyncio.to_thread(self.next_post_time)
+            now = datetime.now()
+            if next_time <= now:
+                #  Срок прошёл (повтор после ошибки, сохранённый срок после простоя) - отправляем только в окне
+                next_time = self.settings.schedule.send_time(now)
+            if next_time > now:
+                if next_time != self._announced_due:
+                    self._announced_due = next_time
+                    self.events.log(f"⏰ Следующий пост: {next_time:%d.%m.%Y %H:%M}")
+                    pending = await asyncio.to_thread(self.queue.pending_count)
+                    self.events.status(f"⏰ следующий пост {next_time:%d.%m %H:%M}, в очереди: {pending}")
+                    #  Пока ждём, выбираем и готовим следующий пост - к сроку останется только отправка
+                    await self.prefetch()
+                #  После таймера срок перепроверяется: часы могли уйти (сон системы, смена времени)
+                await self._wait((next_time - datetime.now()).total_seconds())
+                continue
+            try:
+                sent = await self.send_next()
+            except Exception as e:
+                self.events.log(f"❌ Ошибка в расписании: {e}")
+                sent = False
+            if not sent:
+                #  Срок не меняется: через паузу повторяем тот же пост, а не тянем новую задержку
+                await self._wait(self._retry_delay())
+
+    def _retry_delay(self):
+        """Пауза перед повтором: после ошибки - IDLE_RETRY_SECONDS, при пустой очереди - с удвоением."""
+        if not self._empty_checks:
+            return IDLE_RETRY_SECONDS
+        return min(IDLE_RETRY_SECONDS * 2 ** (self._empty_checks - 1), EMPTY_QUEUE_MAX_WAIT_SECONDS)
+
+    def _get_index(self):
+        """Индекс папки; пересоздаётся, если сменили папку или фильтр расширений."""
+        folder_path = self.settings.get("FOLDER_PATH", "C:\\")
+        extensions = self.settings.classifier.extensions
+        if self._index is None or self._index.folder_path != folder_path or self._index.extensions != extensions:
+            self._index = FolderIndex(folder_path, extensions)
+        return self._index
+
+    def _refill_queue(self):
+        """Переносит новые группы из индекса папки в журнал очереди."""
+        archiver = get_archiver()
+        with Stopwatch() as sw:
+            #  Уже отправленные файлы, ещё не перенесённые в архив, в очередь не возвращаем
+            items = [
+                (path, group, ctime, is_dir) for path, group, ctime, is_dir in self._get_index().drain()
+                if not any(archiver.is_pending(file_path) for file_path in group)
+            ]
+            added = self.queue.enqueue_many(items) if items else 0
+        get_metrics().observe(STAGE_SCAN, sw.seconds)
+        return added
+
+    def _next_post(self):
+        """
+        Следующая группа из журнала. Папка сканируется, только если в журнале нет готовых групп,
+        поэтому после перезапуска отправка продолжается сразу.
+        """
+        post = self.queue.next_due()
+        if post is None:
+            self._refill_queue()
+            post = self.queue.next_due()
+        while post is not None:
+            if not self._in_folder(post["entry_path"]):
+                #  FOLDER_PATH сменился, пока группа ждала очереди: старую папку больше не публикуем
+                self.queue.mark_skipped(post["id"], "группа вне папки FOLDER_PATH")
+            else:
+                files = self._current_files(post)
+                if files:
+                    post["files"] = files
+                    return post
+                self.queue.mark_skipped(post["id"], "файлы не найдены")
+            post = self.queue.next_due()
+        return None
+
+    def _in_folder(self, path):
+        """Лежит ли путь внутри текущей FOLDER_PATH."""
+        root = os.path.normcase(os.path.abspath(self.settings.get("FOLDER_PATH", "C:\\")))
+        try:
+            return os.path.commonpath([root, os.path.normcase(os.path.abspath(path))]) == root
+        except ValueError:
+            return False  #  Другой диск (Windows)
+
+    def _current_files(self, post):
+        """Актуальный список файлов группы: подпапку перечитываем, одиночный файл проверяем."""
+        if not post["is_dir"]:
+            classifier = self.settings.classifier
+            return [path for path in post["files"] if classifier.accepts_name(path) and os.path.isfile(path)]
+        try:
+            return list_group(post["entry_path"], self.settings.classifier.extensions)
+        except OSError:
+            return []
+
+    def _is_fresh(self, post, prepared):
+        """Не изменились ли файлы подготовленного поста с момента подготовки."""
+        if sorted(self._current_files(post)) != sorted(post["files"]):
+            return False
+        for item in prepared["items"]:
+            try:
+                size = os.path.getsize(item["path"])
+            except OSError:
+                return False
+            if item.get("size") is not None and size != item["size"]:
+                return False
+        return True
+
+    async def _prepare_next(self, log_empty=True):
+        """Выбирает следующую группу из очереди и готовит пост. Возвращает (запись, пост) или None."""
+        try:
+            post = await asyncio.to_thread(self._next_post)
+        except OSError as e:
+            self.events.log(f"❌ Ошибка сканирования папки: {e}")
+            return None
+        if post is None:
+            #  О пустой очереди сообщаем один раз, а не при каждой перепроверке папки
+            if log_empty and not self._empty_checks:
+                self.events.log("❌ Нет файлов для отправки.")
+                self.events.status("📭 очередь пуста")
+            self._empty_checks += 1
+            return None
+        self._empty_checks = 0
+
+        with Stopwatch() as sw:
+            prepared = await _telegram_bot().prepare_post(post["files"], self.settings, self.events, self.settings.classifier)
+        get_metrics().observe(STAGE_PREPARE, sw.seconds)
+        if prepared is None:
+            await asyncio.to_thread(self.queue.mark_in_flight, post["id"], post["files"])
+            await asyncio.to_thread(
+                self.queue.mark_failed, post["id"], "нет медиафайлов для отправки", POST_RETRY_DELAY_SECONDS, MAX_POST_ATTEMPTS
+            )
+            return None
+        prepared["prepare_seconds"] = sw.seconds
+        return post, prepared
+
+    async def _record_metrics(self, post, prepared, progress, upload_seconds, success):
+        """Сохраняет метрики поста и выгружает их в файлы (METRICS_EXPORT)."""
+        metrics = get_metrics()
+        metrics.observe(STAGE_UPLOAD, upload_seconds)
+        record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "profile": self.name,
+            "post_id": post["id"],
+            "entry_path": post["entry_path"],
+            "success": success,
+            "files": len(prepared["items"]),
+            "prepare_seconds": round(prepared.get("prepare_seconds", 0.0), 3),
+            "upload_seconds": round(upload_seconds, 3),
+            "bytes_uploaded": progress.bytes_uploaded,
+            "throughput_bps": round(progress.bytes_uploaded / upload_seconds) if upload_seconds > 0 else 0,
+            "retries": progress.retries,
+            "queue_depth": await asyncio.to_thread(self.queue.pending_count),
+        }
+        metrics.record_post(record)
+        metrics.set_rate_limits(self.name, _telegram_bot().rate_limit_state(self.bot_token))
+        await asyncio.to_thread(metrics.export, self.settings, record)
+
+    async def prefetch(self):
+        """Готовит следующий пост заранее (подпись, фильтр, хеши), если он ещё не подготовлен."""
+        async with self._send_lock:
+            if self._prefetched is None:
+                generation = self._settings_generation
+                self._keep_prefetched(await self._prepare_next(log_empty=False), generation)
+                if self._prefetched is not None:
+                    self.events.log(f"📦 Следующий пост подготовлен: {self._prefetched[0]['entry_path']}")
+
+    def _keep_prefetched(self, prepared, generation):
+        """Сохраняет подготовленный заранее пост, если настройки не менялись с начала его подготовки."""
+        self._prefetched = prepared if generation == self._settings_generation else None
+
+    async def _take_prepared(self):
+        """Подготовленный заранее пост, если файлы не менялись, иначе готовит следующий. (запись, пост) или None."""
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and not await asyncio.to_thread(self._is_fresh, *prefetched):
+            prefetched = None  #  Файлы изменились после подготовки - готовим заново
+        if prefetched is None:
+            prefetched = await self._prepare_next()
+        return prefetched
+
+    async def _send_prepared(self, post, prepared):
+        """Отправляет подготовленный пост (запись уже помечена in_flight). Возвращает True, если пост ушёл."""
+        self.events.status("📤 отправка...")
+        #  Части, ушедшие в прошлых попытках, не отправляются повторно; новые сохраняются сразу
+        progress = _telegram_bot().SendProgress(
+            await asyncio.to_thread(self.queue.sent_chunks, post["id"]),
+            on_chunk=functools.partial(self.queue.record_chunk, post["id"]),
+        )
+        #  {канал: message_id или None} - статус каждого канала сохраняется в журнале
+        with Stopwatch() as sw:
+            results = await _telegram_bot().publish_post(self.bot_token, self.channel_id, prepared, self.settings, self.events, progress)
+        if results:
+            await asyncio.to_thread(self.queue.mark_sent, post["id"], results)
+            await self._record_metrics(post, prepared, progress, sw.seconds, True)
+            self.last_post_time = self.queue.last_post_time()
+            self.events.status(f"✅ отправлен {self.last_post_time:%d.%m %H:%M}")
+            return True
+
+        self.events.status("❌ ошибка отправки")
+        await asyncio.to_thread(
+            self.queue.mark_failed, post["id"], "отправка не удалась", POST_RETRY_DELAY_SECONDS, MAX_POST_ATTEMPTS
+        )
+        await self._record_metrics(post, prepared, progress, sw.seconds, False)
+        return False
+
+    async def send_next(self):
+        """Отправляет самую старую группу из очереди. Возвращает True, если пост ушёл."""
+        async with self._send_lock:
+            prefetched = await self._take_prepared()
+            if prefetched is None:
+                return False
+            post, prepared = prefetched
+            await asyncio.to_thread(self.queue.mark_in_flight, post["id"], post["files"])
+            return await self._send_prepared(post, prepared)
+
+    async def send_now(self):
+        """Внеочередная отправка (кнопка "Отправить сейчас")."""
+        if not self.running:
+            self.events.log("⚠️ Бот не запущен.")
+            return False
+        if self.draining:
+            self.events.log("⚠️ Идёт догоняющая отправка очереди.")
+            return False
+        self.events.log("🚀 Отправка поста...")
+        self._empty_checks = 0  #  Ручная отправка всегда сообщает о пустой очереди
+        sent = await self.send_next()
+        self.reschedule()  #  Следующий пост - от времени этого
+        return sent
+
+    @property
+    def draining(self):
+        return self._drain_task is not None and not self._drain_task.done()
+
+    def start_drain(self):
+        """Запускает догоняющую отправку очереди (см. _drain). Возвращает False, если она уже идёт или бот не запущен."""
+        if not self.running or self.draining:
+            return False
+        self._drain_stopping.clear()
+        self._drain_task = asyncio.create_task(self._drain())
+        self.reschedule()  #  Цикл расписания ждёт окончания догоняющей отправки
+        return True
+
+    async def stop_drain(self):
+        """
+        Останавливает догоняющую отправку между постами: пост, который уже загружается, дойдёт до конца.
+        Отмена посреди загрузки оставила бы его в состоянии "отправляется" до перезапуска.
+        """
+        if self.draining:
+            self._drain_stopping.set()
+            await asyncio.wait([self._drain_task])
+
+    async def _drain(self):
+        """
+        Публикует накопившуюся очередь подряд, без случайной задержки расписания.
+        Конвейер: пока загружается текущий пост, следующий уже выбирается и готовится (хеши, подпись, предобработка).
+        Темп - не выше DRAIN_MAX_POSTS_PER_HOUR; лимиты Telegram по-прежнему держит ограничитель сессии.
+        В статусе - прогресс и оценка оставшегося времени.
+        """
+        per_hour = max(1, int(self.settings.get("DRAIN_MAX_POSTS_PER_HOUR", DRAIN_MAX_POSTS_PER_HOUR)))
+        min_interval = 3600 / per_hour
+        loop = asyncio.get_running_loop()
+        async with self._send_lock:
+            await asyncio.to_thread(self._refill_queue)  #  Вся папка - в журнал, чтобы знать объём
+            total = await asyncio.to_thread(self.queue.pending_count)
+            if not total:
+                self.events.log("✅ Очередь пуста, догонять нечего.")
+                return
+            self.events.log(f"⏩ Догоняющая отправка: в очереди {total}, не больше {per_hour} постов в час.")
+            done = sent_total = failures = 0  #  done - обработано (с ошибками), sent_total - дошло
+            started = loop.time()
+            next_start = started
+            generation = self._settings_generation
+            current = await self._take_prepared()
+            upcoming = None
+            try:
+                while not self._drain_stopping.is_set():
+                    if current is None:
+                        #  Группа не подготовилась (только дубли, ошибка) - берём следующую, пока очередь не пуста
+                        if await asyncio.to_thread(self.queue.next_due) is None:
+                            break
+                        current = await self._prepare_next(log_empty=False)
+                        continue
+                    if await self._wait_drain(next_start - loop.time()):
+                        break
+                    next_start = loop.time() + min_interval
+                    post, prepared = current
+                    await asyncio.to_thread(self.queue.mark_in_flight, post["id"], post["files"])
+                    #  Следующий пост готовится, пока загружается текущий. Файлы текущего для него -
+                    #  уже отправленные: иначе два похожих поста подряд прошли бы проверку дублей оба
+                    hold_sending(prepared["items"], self.channel_id)
+                    upcoming = asyncio.create_task(self._prepare_next(log_empty=False))
+                    try:
+                        sent = await self._send_prepared(post, prepared)
+                    finally:
+                        release_sending(prepared["items"], self.channel_id)
+                    done += 1
+                    sent_total += bool(sent)
+                    failures = 0 if sent else failures + 1
+                    if failures >= DRAIN_MAX_FAILURES:
+                        self.events.log(f"❌ Догоняющая отправка остановлена: {failures} ошибки подряд.")
+                        break
+                    remaining = max(0, total - done)
+                    per_post = max(min_interval, (loop.time() - started) / done)
+                    self.events.progress(int(done / total * 100))
+                    self.events.status(f"⏩ {done}/{total}, осталось ~{_format_eta(remaining * per_post)}")
+                    current, upcoming = await upcoming, None
+            finally:
+                #  Подготовку следующего поста не отменяем: отмена между mark_in_flight и mark_failed
+                #  оставила бы группу "отправляется". Готовый, но не отправленный пост пригодится расписанию
+                if upcoming is not None:
+                    try:
+                        current = await asyncio.shield(upcoming)
+                    except Exception as e:
+                        current = None
+                        self.events.log(f"❌ Ошибка подготовки поста: {e}")
+                self._keep_prefetched(current, generation)
+                self.events.progress(0)
+            failed = f", ошибок {done - sent_total}" if done > sent_total else ""
+            if self._drain_stopping.is_set():
+                self.events.log(f"⏹ Догоняющая отправка остановлена: отправлено {sent_total} из {total}{failed}.")
+                return
+            self.events.log(
+                f"✅ Догоняющая отправка завершена: отправлено {sent_total}{failed} за {_format_eta(loop.time() - started)}."
+            )
+
+    async def _wait_drain(self, seconds):
+        """Пауза между постами догоняющей отправки. True, если за это время её остановили."""
+        if seconds > 0:
+            try:
+                await asyncio.wait_for(self._drain_stopping.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+        return self._drain_stopping.is_set()
+
+
+def _format_eta(seconds):
+    """Длительность в виде 1 ч 05 мин / 4 мин 10 с."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours} ч {minutes:02d} мин"
+    if minutes:
+        return f"{minutes} мин {secs:02d} с"
+    return f"{secs} с"
+
+
+class ProfileRunner:
+    """
+    Несколько профилей (папка -> каналы) в одном процессе.
+    Все движки работают в одном event loop и делят HTTP-сессию бота (одна на токен);
+    токен проверяется один раз на все профили.
+    """
+
+    def __init__(self, profiles, events=None, events_factory=None):
+        """
+        profiles - список (имя, настройки) из config.load_profiles.
+        events - события уровня процесса (токен, запуск/остановка);
+        events_factory(имя) - события конкретного профиля.
+        """
+        self.events = events or EngineEvents()
+        multi = len(profiles) > 1
+        self.engines = {}
+        for name, settings in profiles:
+            if events_factory is not None:
+                profile_events = events_factory(name)
+            else:
+                profile_events = PrefixedEvents(f"[{name}] ") if multi else self.events
+            self.engines[name] = PostEngine(settings, profile_events, name=name)
+        self._watch_task = None
+
+    @property
+    def running(self):
+        return any(engine.running for engine in self.engines.values())
+
+    def _sessions(self):
+        """Уникальные токены профилей: {токен: настройки первого профиля с этим токеном}."""
+        sessions = {}
+        for engine in self.engines.values():
+            sessions.setdefault(engine.bot_token, engine.settings)
+        return sessions
+
+    async def start(self):
+        """Проверяет токены и запускает все профили. Возвращает True, если запущен хотя бы один."""
+        verified = set()
+        for token, settings in self._sessions().items():
+            if await _telegram_bot().start_telegram_bot(token, settings, self.events):
+                verified.add(token)
+        if not verified:
+            self.events.auth_failed()
+            return False
+
+        started = 0
+        for engine in self.engines.values():
+            if engine.bot_token in verified and await engine.start(verify=False):
+                started += 1
+        if len(self.engines) > 1:
+            self.events.log(f"✅ Запущено профилей: {started} из {len(self.engines)}")
+        if started and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch_config())
+        return started > 0
+
+    async def stop(self):
+        """Останавливает все профили, затем закрывает общие сессии."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+        await asyncio.gather(*(engine.stop(close_session=False) for engine in self.engines.values()))
+        if "telegram_bot" in sys.modules:  #  Бот не запускался - сессий нет, PTB ради закрытия не грузим
+            for token in self._sessions():
+                await _telegram_bot().stop_telegram_bot(token, self.events)
+        self.events.running_changed(False)
+
+    async def send_now(self, name=None):
+        """Внеочередной пост профиля name (по умолчанию - первого)."""
+        engine = self.engines.get(name) or next(iter(self.engines.values()))
+        return await engine.send_now()
+
+    async def toggle_drain(self, name=None):
+        """Запускает или останавливает догоняющую отправку профиля name (по умолчанию - первого)."""
+        engine = self.engines.get(name) or next(iter(self.engines.values()))
+        if engine.draining:
+            await engine.stop_drain()
+            engine.reschedule()
+        elif not engine.start_drain():
+            engine.events.log("⚠️ Бот не запущен.")
+
+    async def reload_config(self):
+        """
+        Перечитывает config.ini и подменяет настройки работающих профилей без перезапуска и пересканирования.
+        Добавленные или удалённые профили вступают в силу после перезапуска бота.
+        """
+        settings = await asyncio.to_thread(load_config)
+        if not settings:
+            self.events.log("⚠️ config.ini не прочитан, настройки не изменены.")
+            return
+        profiles = dict(await asyncio.to_thread(load_profiles, settings))
+        if set(profiles) != set(self.engines):
+            self.events.log("⚠️ Список профилей изменился - перезапустите бота, чтобы применить.")
+        for name, engine in self.engines.items():
+            if name in profiles:
+                engine.apply_settings(profiles[name])
+
+    async def _watch_config(self):
+        """
+        Проверяет config.ini раз в CONFIG_WATCH_SECONDS (stat файла) и применяет изменения.
+        По умолчанию выключено: окно настроек применяет изменения само, в headless-режиме - SIGHUP.
+        """
+        settings = next(iter(self.engines.values())).settings
+        interval = int(settings.get("CONFIG_WATCH_SECONDS", CONFIG_WATCH_SECONDS))
+        if interval <= 0:
+            return
+        watcher = await asyncio.to_thread(ConfigWatcher)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(watcher.changed):
+                    await self.reload_config()
+            except Exception as e:
+                self.events.log(f"❌ Ошибка перезагрузки настроек: {e}")
+
+    def close(self):
+        """Закрывает журналы очередей. Вызывать после stop()."""
+        for engine in self.engines.values():
+            engine.queue.close()
+
+    async def run_forever(self, drain=False):
+        """
+        Запускает все профили и работает до SIGINT/SIGTERM (headless-режим). SIGHUP перечитывает config.ini.
+        drain=True - сразу после запуска догнать накопившиеся очереди всех профилей.
+        Возвращает False, если бота не удалось запустить.
+        """
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  #  Windows: остановка через KeyboardInterrupt
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.create_task(self.reload_config()))
+
+        if not await self.start():
+            self.close()
+            return False
+        if drain:
+            for engine in self.engines.values():
+                engine.start_drain()
+        try:
+            await stop_event.wait()
+        finally:
+            await self.stop()
+            self.close()
+        return True
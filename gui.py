@@ -1,19 +1,49 @@
 from PyQt6.QtWidgets import (
-    QWidget, QPushButton, QTextEdit, QLabel, QVBoxLayout,
-    QFileDialog, QListWidget, QLineEdit, QMessageBox, QDialog,
+    QWidget, QPushButton, QTextEdit, QPlainTextEdit, QLabel, QVBoxLayout,
+    QFileDialog, QListWidget, QListWidgetItem, QLineEdit, QMessageBox, QDialog,
     QHBoxLayout, QSystemTrayIcon, QMenu, QInputDialog, QProgressBar, QApplication
 )
 from PyQt6.QtCore import Qt, QTimer, QMetaObject, QSize, Q_ARG, pyqtSlot
 from PyQt6.QtGui import QIcon, QAction
 
-from config import load_config, save_config
-from utils import resource_path, generate_phrase_with_emoji, check_disk_space, load_phrases, logger
-from telegram_bot import send_telegram_post, start_telegram_bot, stop_telegram_bot
+from config import load_config, save_config, load_profiles
+from utils import resource_path, load_phrases, logger
+from engine import ProfileRunner, EngineEvents
+from log_sink import LogSink, install_file_log, LOG_UI_MAX_LINES
+from metrics import get_metrics
+from startup_profile import mark_startup, report_startup
 import asyncio
-import os
 import threading
-import json
-from datetime import datetime
+
+
+class GuiEvents(EngineEvents):
+    """
+    Передаёт события движка в виджеты. Вызывается из потока event loop, поэтому всё через очередь Qt.
+    profile - имя профиля (None - события уровня процесса); при нескольких профилях оно добавляется к логу.
+    """
+    def __init__(self, gui, profile=None, prefix=""):
+        self.gui = gui
+        self.profile = profile
+        self.prefix = prefix
+
+    def log(self, message):
+        #  В окно сообщение попадёт через LogSink - без вызовов Qt из чужого потока
+        super().log(self.prefix + message)
+
+    def progress(self, value):
+        QMetaObject.invokeMethod(self.gui.progress_bar, "setValue", Qt.ConnectionType.QueuedConnection, Q_ARG(int, value))
+
+    def running_changed(self, running):
+        QMetaObject.invokeMethod(self.gui, "set_bot_running", Qt.ConnectionType.QueuedConnection, Q_ARG(bool, running))
+
+    def auth_failed(self):
+        QMetaObject.invokeMethod(self.gui, "show_settings_dialog", Qt.ConnectionType.QueuedConnection)
+
+    def status(self, text):
+        if self.profile is not None:
+            QMetaObject.invokeMethod(self.gui, "set_profile_status", Qt.ConnectionType.QueuedConnection,
+                                     Q_ARG(str, self.profile), Q_ARG(str, text))
+
 
 
 class SettingsDialog(QDialog):
@@ -26,7 +56,7 @@ class SettingsDialog(QDialog):
         # Создаём поля ввода
         self.token_label = QLabel("BOT_TOKEN:")
         self.token_edit = QLineEdit(self.settings.get("BOT_TOKEN", ""))
-        self.channel_id_label = QLabel("CHANNEL_ID:")
+        self.channel_id_label = QLabel("CHANNEL_ID (несколько - через запятую):")
         self.channel_id_edit = QLineEdit(str(self.settings.get("CHANNEL_ID", "")))
         self.default_hashtags_label = QLabel("DEFAULT_HASHTAGS:")
         self.default_hashtags_edit = QLineEdit(self.settings.get("DEFAULT_HASHTAGS", ""))
@@ -71,7 +101,8 @@ class SettingsDialog(QDialog):
     @pyqtSlot()
     def save_settings(self):
         """Сохранение настроек в файл."""
-        new_settings = {
+        new_settings = dict(self.settings)  #  Сохраняем ключи, которых нет в диалоге (пул соединений и т.п.)
+        new_settings.update({
             "BOT_TOKEN": self.token_edit.text(),
             "CHANNEL_ID": self.channel_id_edit.text(),
             "DEFAULT_HASHTAGS": self.default_hashtags_edit.text(),
@@ -81,7 +112,7 @@ class SettingsDialog(QDialog):
             "MAX_DELAY_MINUTES": self.max_delay_input.text(),
             "WHITELIST_EXTENSIONS": self.whitelist_edit.text(),
             "BLACKLIST_EXTENSIONS": self.blacklist_edit.text(),
-        }
+        })
 
         if not new_settings["BOT_TOKEN"] or not new_settings["CHANNEL_ID"]:
             QMessageBox.critical(self, "Ошибка", "BOT_TOKEN и CHANNEL_ID не могут быть пустыми!")
@@ -147,41 +178,116 @@ class TelegramBotGUI(QWidget):
         self.delay_minutes = int(self.settings.get("DELAY_MINUTES", 60))  #  Удалить, если не используется
         self.bot_running = False
         self.loop = asyncio.new_event_loop()
-        self.phrases = load_phrases()
-        self.send_lock = threading.Lock()
+        self.phrases = None  #  Загружаются при первом открытии редактора фраз
+        self.runner = None
+        self.tray_icon = None
+        self._startup_finished = False
 
-        self.last_post_time = self.load_last_post_time()
+        #  Логи из любого потока копятся в LogSink, окно забирает их пачками по таймеру
+        install_file_log(self.settings)
+        self.log_sink = LogSink(int(self.settings.get("LOG_UI_MAX_LINES", LOG_UI_MAX_LINES))).install()
 
         self.initUI()
 
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(250)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self._startup_finished:
+            self._startup_finished = True
+            QTimer.singleShot(0, self.finish_startup)  #  Сначала окно отрисуется, потом остальное
+
+    @pyqtSlot()
+    def finish_startup(self):
+        """Всё, что не нужно для первого кадра окна: трей, движки профилей, event loop бота."""
+        self.init_tray()
+
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(5000)
+
+        #  Вся логика бота - в движках профилей, окно только наблюдает за ними
+        self.build_runner()
+        threading.Thread(target=self.start_loop, daemon=True).start()
+        mark_startup("отложенная инициализация")
+        report_startup()
+
         if not self.bot_token or not self.channel_id:
             QMessageBox.warning(self, "Внимание", "Пожалуйста, укажите BOT_TOKEN и CHANNEL_ID в настройках.")
             self.show_settings_dialog()
 
-        threading.Thread(target=self.start_loop, daemon=True).start()
+    @pyqtSlot()
+    def flush_log(self):
+        lines = self.log_sink.drain()
+        if lines:
+            self.log_output.appendPlainText("\n".join(lines))
+
+    @pyqtSlot()
+    def update_metrics(self):
+        """Сводка метрик под логом: квантили времени загрузки поста и средняя скорость."""
+        summary = get_metrics().summary()
+        if summary["upload_p50"] is None:
+            return
+        text = (
+            f"Загрузка p50/p95: {summary['upload_p50']:.1f} / {summary['upload_p95']:.1f} с"
+            f"  ·  постов: {summary['sent']} (ошибок {summary['failed']}, повторов {summary['retries']})"
+        )
+        if summary["throughput"]:
+            text += f"  ·  {summary['throughput'] / 1024 / 1024:.2f} МБ/с"
+        for bucket, rate, base_rate in summary["throttled"]:
+            name = "бот" if bucket == "global" else bucket
+            text += f"  ·  🐢 лимит {name}: {rate:g}/{base_rate:g} в мин"
+        self.metrics_label.setText(text)
 
     def start_loop(self):
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
 
+    def build_runner(self):
+        """Пересоздаёт движки по профилям из config.ini (вызывается, пока бот остановлен)."""
+        if self.runner is not None:
+            self.runner.close()
+        profiles = load_profiles(self.settings)
+        multi = len(profiles) > 1
+        self.runner = ProfileRunner(
+            profiles,
+            GuiEvents(self),
+            lambda name: GuiEvents(self, name, f"[{name}] " if multi else ""),
+        )
+        self.profiles_list.clear()
+        for name, profile_settings in profiles:
+            item = QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, name)
+            self.profiles_list.addItem(item)
+            self.set_profile_status(name, f"⏸ {profile_settings.get('FOLDER_PATH', '')}")
+        self.profiles_list.setCurrentRow(0)
+
+    @pyqtSlot(str, str)
+    def set_profile_status(self, name, text):
+        for row in range(self.profiles_list.count()):
+            item = self.profiles_list.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == name:
+                item.setText(f"{name}: {text}")
+
     def start_bot(self):
         if not self.bot_token or not self.channel_id:
             QMessageBox.warning(self, "Ошибка", "Необходимо указать BOT_TOKEN и CHANNEL_ID.")
             self.show_settings_dialog()
             return
-        self.loop.call_soon_threadsafe(asyncio.create_task, start_telegram_bot(self.bot_token, self))
+        if not self.bot_running:
+            self.build_runner()  #  Подхватываем изменения настроек и профилей
+        self.loop.call_soon_threadsafe(asyncio.create_task, self.runner.start())
 
     @pyqtSlot(bool)
     def set_bot_running(self, running):
         self.bot_running = running
         self.btn_start_bot.setEnabled(not running)
         self.btn_stop_bot.setEnabled(running)
-        self.btn_settings.setEnabled(not running)
 
     def stop_bot(self):
-        self.loop.call_soon_threadsafe(asyncio.create_task, stop_telegram_bot(self))
-        self.set_bot_running(False)
-        self.log_output.append("⛔ Бот остановлен")
+        self.loop.call_soon_threadsafe(asyncio.create_task, self.runner.stop())
 
     def initUI(self):
         self.setWindowTitle("Telegram Бот")
@@ -192,6 +298,12 @@ class TelegramBotGUI(QWidget):
         self.btn_send_now.setIcon(QIcon(resource_path("icons/send.png")))
         self.btn_send_now.setIconSize(QSize(24, 24))
 
+        self.btn_drain = QPushButton("Догнать очередь", self)
+        self.btn_drain.setToolTip("Отправить накопившиеся группы подряд (повторное нажатие - остановить)")
+        self.btn_drain.clicked.connect(self.toggle_drain)
+        self.btn_drain.setIcon(QIcon(resource_path("icons/send.png")))
+        self.btn_drain.setIconSize(QSize(24, 24))
+
         self.btn_start_bot = QPushButton("Запустить бота", self)
         self.btn_start_bot.setIcon(QIcon(resource_path("icons/start.png")))
         self.btn_start_bot.setIconSize(QSize(24, 24))
@@ -224,19 +336,28 @@ class TelegramBotGUI(QWidget):
         self.btn_reset_settings.setIconSize(QSize(24, 24))
 
         # Текстовые поля и метки
-        self.log_output = QTextEdit(self)
+        self.log_output = QPlainTextEdit(self)
         self.log_output.setReadOnly(True)
+        #  Кольцевой буфер: старые строки удаляются, документ не растёт бесконечно
+        self.log_output.setMaximumBlockCount(int(self.settings.get("LOG_UI_MAX_LINES", LOG_UI_MAX_LINES)))
         self.folder_label = QLabel(f"Папка: {self.folder_path}")
+        self.profiles_list = QListWidget(self)  #  Профили и их состояние
+        self.profiles_list.setMaximumHeight(110)
 
         #  Прогресс-бар
         self.progress_bar = QProgressBar(self)
         self.progress_bar.setValue(0)
+        self.metrics_label = QLabel("", self)
+        self.metrics_label.setWordWrap(True)
 
         # Размещение виджетов (Layout)
         left_layout = QVBoxLayout()
         left_layout.addWidget(self.btn_select_folder)
         left_layout.addWidget(self.folder_label)
+        left_layout.addWidget(QLabel("Профили:"))
+        left_layout.addWidget(self.profiles_list)
         left_layout.addWidget(self.btn_send_now)
+        left_layout.addWidget(self.btn_drain)
         left_layout.addWidget(self.btn_start_bot)
         left_layout.addWidget(self.btn_stop_bot)
         left_layout.addWidget(self.btn_settings)
@@ -245,6 +366,7 @@ class TelegramBotGUI(QWidget):
         left_layout.addWidget(QLabel("Логи:"))
         left_layout.addWidget(self.log_output)
         left_layout.addWidget(self.progress_bar)
+        left_layout.addWidget(self.metrics_label)
 
         main_layout = QHBoxLayout()
         main_layout.addLayout(left_layout)
@@ -258,7 +380,7 @@ class TelegramBotGUI(QWidget):
             QPushButton { background-color: #4a4a4a; border: 1px solid #6a6a6a; border-radius: 4px; padding: 5px; min-width: 80px;}
             QPushButton:hover { background-color: #5a5a5a; }
             QPushButton:pressed { background-color: #3a3a3a; }
-            QTextEdit, QListWidget, QLineEdit{ background-color: #3a3a3a; border: 1px solid #6a6a6a; border-radius: 4px; padding: 5px; }
+            QTextEdit, QPlainTextEdit, QListWidget, QLineEdit{ background-color: #3a3a3a; border: 1px solid #6a6a6a; border-radius: 4px; padding: 5px; }
             QLabel{ margin-bottom: 5px; }
             QListWidget { border: none; }
             QListWidget::item { padding: 5px; border-bottom: 1px solid #4a4a4a; }
@@ -267,7 +389,8 @@ class TelegramBotGUI(QWidget):
             QProgressBar::chunk {background-color: #4CAF50; }
         """)
 
-        # Иконка в трее
+    def init_tray(self):
+        """Иконка в трее."""
         self.tray_icon = QSystemTrayIcon(self)
         self.tray_icon.setIcon(QIcon(resource_path("icons/app_icon.ico")))
         self.tray_icon.setToolTip("Telegram Bot")
@@ -293,10 +416,12 @@ class TelegramBotGUI(QWidget):
     @pyqtSlot()
     def show_phrases_dialog(self):
         """Открывает диалог редактирования фраз."""
+        if self.phrases is None:
+            self.phrases = load_phrases()
         dialog = PhrasesEditDialog(self.phrases, self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.save_phrases()
-            self.log_output.append("📝 Фразы обновлены.")
+            logger.info("📝 Фразы обновлены.")
 
     def save_phrases(self):
         """Сохраняет фразы в файл."""
@@ -307,8 +432,7 @@ class TelegramBotGUI(QWidget):
                     f.write(phrase + "\n")
             logger.info("Фразы сохранены.")
         except Exception as e:
-            logger.error(f"Ошибка при сохранении фраз: {e}")
-            self.log_output.append(f"❌ Ошибка при сохранении фраз: {e}")
+            logger.error(f"❌ Ошибка при сохранении фраз: {e}")
 
     def select_folder(self):
         """Открывает диалог выбора папки и сохраняет путь."""
@@ -325,96 +449,19 @@ class TelegramBotGUI(QWidget):
         if not self.bot_running:
             QMessageBox.warning(self, "Предупреждение", "Бот не запущен.")
             return
-        self.log_output.append("🚀 Отправка поста...")
-        with self.send_lock:
-            groups = self.scan_folder()
-            if groups:
-                self.loop.call_soon_threadsafe(asyncio.create_task, send_telegram_post(self.bot_token, self.channel_id, groups[0], self))
-            else:
-                self.log_output.append("❌ Нет файлов для отправки.")
-
-    def check_queue(self):
-        """Проверяет очередь и отправляет пост, если пришло время."""
-        if not self.bot_running:
-            return
+        item = self.profiles_list.currentItem()
+        name = item.data(Qt.ItemDataRole.UserRole) if item is not None else None
+        self.loop.call_soon_threadsafe(asyncio.create_task, self.runner.send_now(name))
 
-        with self.send_lock:
-            now = datetime.now()
-            if self.last_post_time is None:
-                next_post_time = now
-            else:
-                min_delay = int(self.settings.get("MIN_DELAY_MINUTES", 10))
-                max_delay = int(self.settings.get("MAX_DELAY_MINUTES", 120))
-                random_delay = random.randint(min_delay, max_delay)
-                next_post_time = self.last_post_time + timedelta(minutes=random_delay)
-
-            if now >= next_post_time:
-                groups = self.scan_folder()
-                if groups:
-                    self.loop.call_soon_threadsafe(asyncio.create_task, send_telegram_post(self.bot_token, self.channel_id, groups[0], self))
-
-    def scan_folder(self):
-        """Сканирует папку и возвращает список *групп* файлов."""
-        groups = []
-        try:
-            entries = []
-            for entry_name in os.listdir(self.folder_path):
-                entry_path = os.path.join(self.folder_path, entry_name)
-                entries.append((entry_path, os.path.getctime(entry_path)))
-
-            entries.sort(key=lambda x: x[1])
-
-            for entry_path, _ in entries:
-                if os.path.isfile(entry_path):
-                    _, ext = os.path.splitext(entry_path)
-                    if ext.lower() in (".jpg", ".jpeg", ".png", ".mp4"):
-                        groups.append([entry_path])
-                elif os.path.isdir(entry_path):
-                    group = []
-                    for filename in os.listdir(entry_path):
-                        file_path = os.path.join(entry_path, filename)
-                        if os.path.isfile(file_path):
-                            _, ext = os.path.splitext(filename)
-                            if ext.lower() in (".jpg", ".jpeg", ".png", ".mp4"):
-                                group.append(file_path)
-                    if group:
-                        groups.append(group)
-
-        except OSError as e:
-            self.log_output.append(f"❌ Ошибка сканирования папки: {e}")
-            return []
-
-        return groups
-
-    def save_last_post_time(self):
-        """Сохранение времени последнего поста в файл."""
-        file_path = resource_path("last_post_time.json")
-        if not check_disk_space(os.path.dirname(file_path)):
-            QMetaObject.invokeMethod(
-                self.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                Q_ARG(str, "❌ Недостаточно места на диске для сохранения времени последнего поста.")
-            )
+    @pyqtSlot()
+    def toggle_drain(self):
+        """Догоняющая отправка очереди выбранного профиля (или её остановка)."""
+        if not self.bot_running:
+            QMessageBox.warning(self, "Предупреждение", "Бот не запущен.")
             return
-        try:
-            with open(file_path, "w") as f:
-                json.dump(self.last_post_time.timestamp(), f)
-        except Exception as e:
-            logger.error(f"Ошибка сохранения времени последнего поста: {e}")
-            QMetaObject.invokeMethod(
-                self.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                Q_ARG(str, f"❌ Ошибка сохранения времени последнего поста: {e}")
-            )
-
-    def load_last_post_time(self):
-        """Загрузка времени последнего поста из файла."""
-        file_path = resource_path("last_post_time.json")
-        try:
-            with open(file_path, "r") as f:
-                timestamp = json.load(f)
-                return datetime.fromtimestamp(timestamp)
-        except (FileNotFoundError, json.JSONDecodeError, OSError) as e:
-            logger.error(f"Ошибка загрузки времени последнего поста: {e}")
-            return None
+        item = self.profiles_list.currentItem()
+        name = item.data(Qt.ItemDataRole.UserRole) if item is not None else None
+        self.loop.call_soon_threadsafe(asyncio.create_task, self.runner.toggle_drain(name))
 
     @pyqtSlot()
     def show_settings_dialog(self):
@@ -426,9 +473,14 @@ class TelegramBotGUI(QWidget):
             self.channel_id = self.settings.get("CHANNEL_ID")
             self.default_hashtags = self.settings.get("DEFAULT_HASHTAGS")
             self.delay_minutes = int(self.settings.get("DELAY_MINUTES", 60))  #  Удалить, если не используется
+            if self.bot_running:  #  Работающие профили получают новые настройки сразу, без перезапуска
+                self.loop.call_soon_threadsafe(asyncio.create_task, self.runner.reload_config())
 
     def closeEvent(self, event):
         """Переопределяем обработчик закрытия окна."""
+        if self.tray_icon is None:  #  Окно закрыли раньше, чем появился трей - просто выходим
+            event.accept()
+            return
         event.ignore()
         self.hide()
         self.tray_icon.showMessage(
@@ -471,10 +523,16 @@ class TelegramBotGUI(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.settings.update(default_settings)
             save_config(self.settings)
-            self.log_output.append("⚙️ Настройки сброшены к значениям по умолчанию.")
-            self.folder_label.setText(f"Папка: {self.settings.get('FOLDER_PATH', 'C:\\')}")
+            logger.info("⚙️ Настройки сброшены к значениям по умолчанию.")
+            self.folder_label.setText(f"Папка: {self.settings['FOLDER_PATH']}")
 
 
     def quit_app(self):
+        #  Закрываем сессию бота, чтобы не оставлять открытые соединения
+        try:
+            asyncio.run_coroutine_threadsafe(self.runner.stop(), self.loop).result(timeout=5)
+            self.runner.close()
+        except Exception as e:
+            logger.error(f"Ошибка закрытия сессии бота: {e}")
         self.tray_icon.hide()
         QApplication.quit()
\ No newline at end of file
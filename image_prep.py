@@ -0,0 +1,151 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from media_types import KIND_PHOTO
+from utils import get_app_data_path, logger, prune_dir
+
+#  Pillow импортируется при первой предобработке (_load_pillow), а не при запуске программы
+Image = None
+ImageOps = None
+
+PREP_CACHE_DIR_NAME = "prep_cache"
+
+#  Telegram всё равно ужимает фото примерно до 2560 px по большей стороне
+IMAGE_MAX_SIDE = 2560
+IMAGE_JPEG_QUALITY = 87
+IMAGE_PREP_CACHE_DAYS = 7
+#  Лимит Telegram на фото, отправляемое как photo
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+_MIN_JPEG_QUALITY = 60
+
+_pool = None
+_warned_no_pillow = False
+_pillow_checked = False
+
+
+def _load_pillow():
+    """Импортирует Pillow при первом вызове. False - Pillow не установлен."""
+    global Image, ImageOps, _pillow_checked
+    if not _pillow_checked:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:  #  Pillow нужен только для предобработки, без него бот работает как раньше
+            pass
+        _pillow_checked = True
+    return Image is not None
+
+
+def _process_image(src, dst, max_side, quality):
+    """
+    Выполняется в отдельном процессе: уменьшает и перекодирует фото в JPEG.
+    Возвращает размер результата или None, если исходник и так подходит и выгоднее его.
+    """
+    _load_pillow()  #  Процесс пула импортирует модуль заново
+    src_size = os.path.getsize(src)
+    with Image.open(src) as original:
+        if (max(original.size) <= max_side and original.format == "JPEG"
+                and src_size <= PHOTO_MAX_BYTES):
+            return None
+        im = ImageOps.exif_transpose(original)  #  EXIF не сохраняем, поэтому поворот применяем сразу
+        if im.mode in ("RGBA", "LA", "P"):
+            im = im.convert("RGBA")
+            background = Image.new("RGB", im.size, (255, 255, 255))
+            background.paste(im, mask=im.getchannel("A"))
+            im = background
+        elif im.mode != "RGB":
+            im = im.convert("RGB")
+        if max(im.size) > max_side:
+            im.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        tmp = dst + ".tmp"
+        while True:
+            im.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+            if os.path.getsize(tmp) <= PHOTO_MAX_BYTES or quality <= _MIN_JPEG_QUALITY:
+                break
+            quality -= 10
+
+    result_size = os.path.getsize(tmp)
+    if result_size >= src_size and src_size <= PHOTO_MAX_BYTES:
+        os.remove(tmp)
+        return None
+    os.replace(tmp, dst)
+    return result_size
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _pool
+
+
+def shutdown_image_pool():
+    """Останавливает пул процессов предобработки (создаётся заново при следующем использовании)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def prune_prep_cache(max_age_days=IMAGE_PREP_CACHE_DAYS):
+    """Удаляет обработанные копии старше max_age_days. Блокирующая функция."""
+    return prune_dir(get_app_data_path(PREP_CACHE_DIR_NAME), max_age_days)
+
+
+def is_enabled(settings):
+    return str(settings.get("IMAGE_PREP_ENABLED", "0")).strip().lower() in ("1", "true", "yes", "on")
+
+
+async def preprocess_images(items, settings, events):
+    """
+    Уменьшает и перекодирует фото группы в пуле процессов (все ядра).
+    Результаты кешируются по хешу содержимого; путь к обработанной копии пишется в item["upload_path"].
+    Фото, уже известные Telegram по file_id, не обрабатываются. Без Pillow ничего не делает.
+    """
+    global _warned_no_pillow
+    if not is_enabled(settings):
+        return
+    if not _load_pillow():
+        if not _warned_no_pillow:
+            events.log("⚠️ Предобработка фото включена, но Pillow не установлен. Фото отправляются как есть.")
+            _warned_no_pillow = True
+        return
+
+    max_side = int(settings.get("IMAGE_MAX_SIDE", IMAGE_MAX_SIDE))
+    quality = int(settings.get("IMAGE_JPEG_QUALITY", IMAGE_JPEG_QUALITY))
+    cache_dir = get_app_data_path(PREP_CACHE_DIR_NAME)
+    await asyncio.to_thread(os.makedirs, cache_dir, exist_ok=True)
+
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    jobs = []
+    for item in items:
+        if item["kind"] != KIND_PHOTO or item.get("file_id") or not item.get("digest"):
+            continue
+        dst = os.path.join(cache_dir, f"{item['digest']}_{max_side}_{quality}.jpg")
+        if await asyncio.to_thread(os.path.exists, dst):
+            item["upload_path"] = dst  #  Уже обрабатывали это содержимое
+            continue
+        jobs.append((item, dst, loop.run_in_executor(pool, _process_image, item["path"], dst, max_side, quality)))
+
+    if not jobs:
+        return
+    results = await asyncio.gather(*(job for _, _, job in jobs), return_exceptions=True)
+
+    before = after = processed = 0
+    for (item, dst, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка предобработки {item['path']}: {result}")
+            events.log(f"⚠️ Не удалось обработать {item['path']}: {result}. Отправляем как есть.")
+            continue
+        if result is None:
+            continue
+        item["upload_path"] = dst
+        before += item.get("size", 0)
+        after += result
+        processed += 1
+
+    if processed:
+        saved_mb = (before - after) / (1024 * 1024)
+        events.log(f"🗜️ Обработано фото: {processed}, сэкономлено {saved_mb:.1f} МБ ({before // 1024} КБ → {after // 1024} КБ).")
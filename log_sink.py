@@ -0,0 +1,77 @@
+import logging
+import queue
+from logging.handlers import RotatingFileHandler
+
+from utils import get_app_data_path
+
+LOG_FILE_NAME = "bot.log"
+#  Ограничения по умолчанию
+LOG_FILE_MAX_MB = 5
+LOG_FILE_BACKUPS = 5
+LOG_UI_MAX_LINES = 2000
+#  Библиотеки, чьи INFO-сообщения (каждый HTTP-запрос и т.п.) в окно не выводим
+_NOISY_LOGGERS = ("httpx", "httpcore", "telegram", "asyncio")
+
+_file_handler = None
+
+
+def install_file_log(settings=None):
+    """Подключает полный лог в файл с ротацией (AppData/TelegramBot/bot.log). Повторный вызов ничего не делает."""
+    global _file_handler
+    if _file_handler is not None:
+        return _file_handler
+    settings = settings or {}
+    _file_handler = RotatingFileHandler(
+        get_app_data_path(LOG_FILE_NAME),
+        maxBytes=int(settings.get("LOG_FILE_MAX_MB", LOG_FILE_MAX_MB)) * 1024 * 1024,
+        backupCount=int(settings.get("LOG_FILE_BACKUPS", LOG_FILE_BACKUPS)),
+        encoding="utf-8",
+    )
+    _file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(_file_handler)
+    return _file_handler
+
+
+class LogSink(logging.Handler):
+    """
+    Приёмник логов для окна. Писать можно из любого потока: запись - это put в SimpleQueue
+    без блокировок на стороне Qt. Окно забирает накопленное пачкой по таймеру (drain).
+    Если окно долго не забирало строки, в пачку попадают только последние max_lines.
+    """
+
+    def __init__(self, max_lines=LOG_UI_MAX_LINES):
+        super().__init__(level=logging.INFO)
+        self.max_lines = max_lines
+        self._queue = queue.SimpleQueue()
+        self.setFormatter(logging.Formatter('%(asctime)s  %(message)s', datefmt='%H:%M:%S'))
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and record.name.split(".")[0] in _NOISY_LOGGERS:
+            return False
+        return super().filter(record)
+
+    def emit(self, record):
+        try:
+            self._queue.put(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def drain(self):
+        """Забирает все накопившиеся строки (не больше max_lines последних). Возвращает список."""
+        lines = []
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(lines) > self.max_lines:
+            dropped = len(lines) - self.max_lines
+            lines = [f"... пропущено строк: {dropped}"] + lines[-self.max_lines:]
+        return lines
+
+    def install(self):
+        logging.getLogger().addHandler(self)
+        return self
+
+    def uninstall(self):
+        logging.getLogger().removeHandler(self)
@@ -1,13 +1,63 @@
+import argparse
+import asyncio
+import multiprocessing
 import sys
-from PyQt6.QtWidgets import QApplication
-from gui import TelegramBotGUI  # Импортируем класс TelegramBotGUI из gui.py
 
+from startup_profile import enable_startup_profile, mark_startup, report_startup
 
-def main():
+
+def run_gui():
+    #  Qt импортируется только для оконного режима
+    from PyQt6.QtWidgets import QApplication
+    mark_startup("импорт Qt")
     app = QApplication(sys.argv)
+    mark_startup("QApplication")
+    from gui import TelegramBotGUI  # Импортируем класс TelegramBotGUI из gui.py
+    mark_startup("импорт gui")
+
     window = TelegramBotGUI()
-    window.show()
-    sys.exit(app.exec())
+    mark_startup("окно")
+    window.show()  #  Остальное (движки, трей, event loop бота) окно доделает после показа
+    mark_startup("показ окна")
+    return app.exec()
+
+
+def run_headless(drain=False):
+    """Запуск без GUI: один event loop, настройки из config.ini, логи в консоль и в файл."""
+    from config import load_config, load_profiles
+    from engine import ProfileRunner
+    from log_sink import install_file_log
+    from utils import logger
+
+    mark_startup("импорт модулей")
+    settings = load_config()
+    if not settings:
+        logger.error("Не удалось загрузить настройки, headless-режим невозможен.")
+        return 1
+    install_file_log(settings)
+    runner = ProfileRunner(load_profiles(settings))
+    mark_startup("настройки и профили")
+    report_startup()
+    try:
+        started = asyncio.run(runner.run_forever(drain))
+    except KeyboardInterrupt:
+        return 0
+    return 0 if started else 1
+
+
+def main():
+    multiprocessing.freeze_support()  #  Пул процессов предобработки фото в сборке PyInstaller
+    parser = argparse.ArgumentParser(description="Telegram Post Bot")
+    parser.add_argument("--headless", action="store_true", help="запуск без графического интерфейса (для серверов)")
+    parser.add_argument("--drain", action="store_true", help="headless: сразу догнать накопившуюся очередь")
+    parser.add_argument("--profile-startup", action="store_true", help="записать в лог, на что уходит время запуска")
+    args = parser.parse_args()
+    if args.profile_startup:
+        enable_startup_profile()
+
+    if args.headless:
+        sys.exit(run_headless(args.drain))
+    sys.exit(run_gui())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
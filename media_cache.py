@@ -0,0 +1,210 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from utils import get_app_data_path, logger
+
+MEDIA_CACHE_DB_FILE_NAME = "media_cache.db"
+
+#  Ограничения кеша file_id по умолчанию
+FILE_ID_CACHE_MAX_ITEMS = 50000
+FILE_ID_CACHE_MAX_AGE_DAYS = 180
+
+#  Сколько последних хешей держать в памяти (ключ - путь, размер и mtime)
+_DIGEST_MEMO_SIZE = 4096
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_ids (
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, kind)
+);
+CREATE INDEX IF NOT EXISTS idx_file_ids_last_used ON file_ids(last_used);
+"""
+
+_digest_memo = {}
+_digest_memo_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    BLAKE2b-хеш содержимого файла. Повторный вызов для неизменённого файла
+    (тот же размер и mtime) берёт результат из памяти. Блокирующая функция.
+    """
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _digest_memo_lock:
+        digest = _digest_memo.get(key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            h.update(block)
+    digest = h.hexdigest()
+
+    with _digest_memo_lock:
+        if len(_digest_memo) >= _DIGEST_MEMO_SIZE:
+            _digest_memo.pop(next(iter(_digest_memo)))
+        _digest_memo[key] = digest
+    return digest
+
+
+class FileIdCache:
+    """
+    Постоянный кеш "хеш содержимого -> file_id Telegram".
+    Уже загруженный файл отправляется по file_id, без повторной загрузки байтов.
+    Вытесняются давно не использованные записи (LRU) и записи старше max_age_days.
+    Методы блокирующие: из event loop их нужно вызывать через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path=None, max_items=FILE_ID_CACHE_MAX_ITEMS, max_age_days=FILE_ID_CACHE_MAX_AGE_DAYS):
+        self.db_path = db_path or get_app_data_path(MEDIA_CACHE_DB_FILE_NAME)
+        self.max_items = max_items
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._puts_since_evict = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, digest, kind):
+        """file_id для содержимого или None. Попадание продлевает жизнь записи."""
+        now = time.time()
+        min_created = now - self.max_age_days * 86400
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id FROM file_ids WHERE digest = ? AND kind = ? AND created_at >= ?",
+                (digest, kind, min_created),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE file_ids SET last_used = ? WHERE digest = ? AND kind = ?", (now, digest, kind)
+            )
+        return row[0]
+
+    def put(self, digest, kind, file_id, size):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO file_ids(digest, kind, file_id, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(digest, kind) DO UPDATE SET file_id = excluded.file_id, last_used = excluded.last_used
+                """,
+                (digest, kind, file_id, size, now, now),
+            )
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= 100:
+                self._evict_locked(now)
+
+    def invalidate(self, digest, kind):
+        """Удаляет запись, например если Telegram отклонил file_id."""
+        with self._lock:
+            self._conn.execute("DELETE FROM file_ids WHERE digest = ? AND kind = ?", (digest, kind))
+
+    def evict(self):
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def _evict_locked(self, now):
+        self._puts_since_evict = 0
+        self._conn.execute("DELETE FROM file_ids WHERE created_at < ?", (now - self.max_age_days * 86400,))
+        self._conn.execute(
+            """
+            DELETE FROM file_ids WHERE rowid IN (
+                SELECT rowid FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_items,),
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_file_id_cache(settings):
+    """Общий на процесс кеш file_id (создаётся при первом обращении)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FileIdCache(
+                max_items=int(settings.get("FILE_ID_CACHE_MAX_ITEMS", FILE_ID_CACHE_MAX_ITEMS)),
+                max_age_days=int(settings.get("FILE_ID_CACHE_MAX_AGE_DAYS", FILE_ID_CACHE_MAX_AGE_DAYS)),
+            )
+            logger.info("Кеш file_id открыт.")
+        return _cache
+
+
+def message_file_id(message):
+    """file_id медиа из отправленного сообщения (для фото - самый большой размер)."""
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.video:
+        return message.video.file_id
+    if message.animation:
+        return message.animation.file_id
+    if message.document:
+        return message.document.file_id
+    return None
+
+
+def resolve_file_ids(items, cache):
+    """
+    Считает хеши файлов группы и подставляет file_id из кеша.
+    items - список словарей с ключами path и kind; дописывает digest, size, file_id и from_cache.
+    Возвращает число попаданий. Блокирующая функция.
+    """
+    hits = 0
+    for item in items:
+        item["file_id"] = None
+        item["from_cache"] = False
+        try:
+            item["size"] = os.path.getsize(item["path"])
+            item["digest"] = file_digest(item["path"])
+        except OSError:
+            item["digest"] = None  #  Файл недоступен - его пропустит сборка медиагруппы
+            continue
+        file_id = cache.get(item["digest"], item["kind"])
+        if file_id is not None:
+            item["file_id"] = file_id
+            item["from_cache"] = True
+            hits += 1
+    return hits
+
+
+def remember_file_ids(items, messages, cache):
+    """Сохраняет file_id только что загруженных файлов (items и messages идут в одном порядке)."""
+    for item, message in zip(items, messages):
+        if item.get("file_id") or not item.get("digest"):
+            continue
+        file_id = message_file_id(message)
+        if file_id:
+            cache.put(item["digest"], item["kind"], file_id, item.get("size", 0))
+            item["file_id"] = file_id
+
+
+def forget_cached_file_ids(items, cache):
+    """Сбрасывает file_id, взятые из кеша, - если Telegram их отклонил. Возвращает их число."""
+    stale = 0
+    for item in items:
+        if item.get("from_cache"):
+            cache.invalidate(item["digest"], item["kind"])
+            item["file_id"] = None
+            item["from_cache"] = False
+            stale += 1
+    return stale
@@ -0,0 +1,120 @@
+import os
+import threading
+
+#  Виды медиа и метод Bot API, которым они отправляются
+KIND_PHOTO = "photo"          # sendMediaGroup / sendPhoto
+KIND_VIDEO = "video"          # sendMediaGroup / sendVideo
+KIND_ANIMATION = "animation"  # sendAnimation (GIF в альбом не кладётся)
+KIND_DOCUMENT = "document"    # sendDocument
+
+#  Форматы по сигнатуре содержимого -> вид медиа
+FORMAT_KINDS = {
+    "jpeg": KIND_PHOTO,
+    "png": KIND_PHOTO,
+    "webp": KIND_PHOTO,
+    "gif": KIND_ANIMATION,
+    "mp4": KIND_VIDEO,
+    "webm": KIND_DOCUMENT,
+}
+
+#  Расширение -> ожидаемый формат
+EXTENSION_FORMATS = {
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".png": "png",
+    ".webp": "webp",
+    ".gif": "gif",
+    ".mp4": "mp4",
+    ".webm": "webm",
+}
+
+DEFAULT_WHITELIST = ".jpg,.jpeg,.png,.gif,.mp4,.webm,.webp"
+
+_SNIFF_BYTES = 16
+_VERDICT_CACHE_SIZE = 16384
+
+
+def sniff_format(header):
+    """Формат файла по первым байтам или None, если сигнатура не распознана."""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp":
+        return "mp4"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    return None
+
+
+def _parse_extensions(value):
+    return frozenset(e.strip().lower() for e in (value or "").split(",") if e.strip())
+
+
+class MediaClassifier:
+    """
+    Единый фильтр медиафайлов для сканера и отправки.
+    Белый/чёрный списки разбираются один раз в frozenset. Для отправки тип подтверждается
+    сигнатурой в начале файла, вердикт кешируется по (устройство, inode, mtime, размер),
+    поэтому файлы с чужим расширением отсекаются до загрузки.
+    """
+
+    def __init__(self, whitelist=DEFAULT_WHITELIST, blacklist=""):
+        self.whitelist = _parse_extensions(whitelist)
+        self.blacklist = _parse_extensions(blacklist)
+        allowed = self.whitelist or frozenset(EXTENSION_FORMATS)
+        #  Только то, что бот умеет отправлять
+        self.extensions = frozenset(e for e in allowed if e in EXTENSION_FORMATS) - self.blacklist
+        self._verdicts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get("WHITELIST_EXTENSIONS", DEFAULT_WHITELIST), settings.get("BLACKLIST_EXTENSIONS", ""))
+
+    def accepts_name(self, name):
+        """Быстрая проверка по расширению (для сканера, без чтения файла)."""
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def classify(self, path):
+        """
+        Вид медиа (KIND_*) по расширению и сигнатуре содержимого.
+        Возвращает (вид, None) или (None, причина отказа). Блокирующая функция.
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in self.extensions:
+            return None, "фильтр расширений"
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return None, f"файл недоступен: {e}"
+
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            verdict = self._verdicts.get(key)
+        if verdict is None:
+            verdict = self._sniff(path, ext)
+            with self._lock:
+                if len(self._verdicts) >= _VERDICT_CACHE_SIZE:
+                    self._verdicts.pop(next(iter(self._verdicts)))
+                self._verdicts[key] = verdict
+        return verdict
+
+    @staticmethod
+    def _sniff(path, ext):
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_SNIFF_BYTES)
+        except OSError as e:
+            return None, f"ошибка чтения: {e}"
+        detected = sniff_format(header)
+        if detected is None:
+            return None, "содержимое не похоже на медиафайл"
+        expected_kind = FORMAT_KINDS[EXTENSION_FORMATS[ext]]
+        if FORMAT_KINDS[detected] != expected_kind:
+            return None, f"расширение {ext}, а по содержимому это {detected}"
+        return FORMAT_KINDS[detected], None
@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from utils import get_app_data_path, logger
+
+PROMETHEUS_FILE_NAME = "metrics.prom"
+JSONL_FILE_NAME = "metrics.jsonl"
+#  metrics.jsonl больше этого размера переименовывается в metrics.jsonl.1
+JSONL_MAX_BYTES = 10 * 1024 * 1024
+#  Сколько последних замеров каждой стадии держать для квантилей
+SAMPLE_WINDOW = 1000
+QUANTILES = (0.5, 0.95)
+METRIC_PREFIX = "telegram_bot"
+
+#  Стадии, длительность которых измеряется
+STAGE_SCAN = "scan"          # перенос новых групп из папки в очередь
+STAGE_PREPARE = "prepare"    # подготовка поста (хеши, подпись, предобработка)
+STAGE_UPLOAD = "upload"      # отправка поста во все каналы
+STAGE_ARCHIVE = "archive"    # перенос отправленных файлов в архив
+
+
+def export_formats(settings):
+    """METRICS_EXPORT: prometheus, jsonl, both или off."""
+    value = str(settings.get("METRICS_EXPORT", "both")).strip().lower()
+    if value == "both":
+        return {"prometheus", "jsonl"}
+    return {value} & {"prometheus", "jsonl"}
+
+
+def percentile(samples, q):
+    """Квантиль по методу ближайшего ранга. None, если замеров нет."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class _Stage:
+    def __init__(self):
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.total += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса: длительности стадий, байты, повторы, глубина очереди и итоги постов.
+    Пишут в него из event loop и из потоков, читает GUI - все методы под блокировкой.
+    Экспорт - текстовый формат Prometheus (metrics.prom, для textfile collector)
+    и/или JSON lines (metrics.jsonl, одна строка на пост).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._posts = {}         #  (профиль, результат) -> число постов
+        self._queue_depth = {}   #  профиль -> постов в очереди
+        self._rate_limits = {}   #  профиль -> снимок ограничителя запросов (AdaptiveRateLimiter.snapshot)
+        self.bytes_uploaded = 0
+        self.retries = 0
+        self._throughput = deque(maxlen=SAMPLE_WINDOW)  #  байт/с по постам с загрузкой
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._stages.setdefault(stage, _Stage()).observe(seconds)
+
+    def record_post(self, record):
+        """
+        Итог одного поста: словарь с profile, success, prepare_seconds, upload_seconds,
+        bytes_uploaded, retries (повторы после таймаутов и ошибок отправки) и queue_depth (см. PostEngine.send_next).
+        """
+        with self._lock:
+            key = (record["profile"], "sent" if record["success"] else "failed")
+            self._posts[key] = self._posts.get(key, 0) + 1
+            self._queue_depth[record["profile"]] = record["queue_depth"]
+            self.bytes_uploaded += record["bytes_uploaded"]
+            self.retries += record["retries"]
+            if record["bytes_uploaded"] and record["upload_seconds"] > 0:
+                self._throughput.append(record["bytes_uploaded"] / record["upload_seconds"])
+
+    def add_retries(self, count=1):
+        """Повторы запроса, которых нет в итогах постов (RetryAfter внутри ограничителя запросов)."""
+        with self._lock:
+            self.retries += count
+
+    def set_rate_limits(self, profile, snapshot):
+        """Текущие лимиты и состояние корзин ограничителя запросов профиля (None - сессии нет)."""
+        with self._lock:
+            if snapshot is None:
+                self._rate_limits.pop(profile, None)
+            else:
+                self._rate_limits[profile] = snapshot
+
+    def _buckets(self):
+        """[(профиль, корзина, состояние)]: "global" - общая корзина бота, иначе ID канала."""
+        buckets = []
+        for profile, snapshot in sorted(self._rate_limits.items()):
+            buckets.append((profile, "global", snapshot["global"]))
+            buckets += [(profile, chat, state) for chat, state in sorted(snapshot["chats"].items())]
+        return buckets
+
+    def summary(self):
+        """Короткая сводка для окна: квантили загрузки, средняя скорость, итоги."""
+        with self._lock:
+            upload = self._stages.get(STAGE_UPLOAD)
+            samples = list(upload.samples) if upload else []
+            throughput = list(self._throughput)
+            return {
+                "upload_p50": percentile(samples, 0.5),
+                "upload_p95": percentile(samples, 0.95),
+                "throughput": sum(throughput) / len(throughput) if throughput else None,
+                "sent": sum(n for (_, result), n in self._posts.items() if result == "sent"),
+                "failed": sum(n for (_, result), n in self._posts.items() if result == "failed"),
+                "retries": self.retries,
+                "bytes_uploaded": self.bytes_uploaded,
+                #  Корзины, где лимит снижен после "Too Many Requests": (канал, текущий и базовый лимит в минуту)
+                "throttled": sorted({
+                    (bucket, state["rate_per_minute"], state["base_rate_per_minute"])
+                    for _, bucket, state in self._buckets() if state["rate_per_minute"] < state["base_rate_per_minute"]
+                }),
+            }
+
+    def prometheus_text(self):
+        """Все метрики в текстовом формате Prometheus."""
+        p = METRIC_PREFIX
+        lines = []
+        with self._lock:
+            lines += [f"# HELP {p}_posts_total Posts by profile and result.", f"# TYPE {p}_posts_total counter"]
+            for (profile, result), n in sorted(self._posts.items()):
+                lines.append(f'{p}_posts_total{{profile="{_escape(profile)}",result="{result}"}} {n}')
+            lines += [f"# HELP {p}_queue_depth Posts waiting in the queue.", f"# TYPE {p}_queue_depth gauge"]
+            for profile, depth in sorted(self._queue_depth.items()):
+                lines.append(f'{p}_queue_depth{{profile="{_escape(profile)}"}} {depth}')
+            lines += [
+                f"# HELP {p}_uploaded_bytes_total Bytes uploaded to Telegram.", f"# TYPE {p}_uploaded_bytes_total counter",
+                f"{p}_uploaded_bytes_total {self.bytes_uploaded}",
+                f"# HELP {p}_retries_total Send retries after timeouts and flood waits.", f"# TYPE {p}_retries_total counter",
+                f"{p}_retries_total {self.retries}",
+            ]
+            buckets = self._buckets()
+            for name, key, kind, help_text in (
+                ("rate_limit_per_minute", "rate_per_minute", "gauge", "Current request limit of a token bucket."),
+                ("rate_limit_base_per_minute", "base_rate_per_minute", "gauge", "Configured request limit of a token bucket."),
+                ("rate_limit_tokens", "tokens", "gauge", "Tokens available in a token bucket."),
+                ("rate_limit_blocked_seconds", "blocked_for", "gauge", "Seconds a token bucket stays blocked after a flood wait."),
+                ("rate_limit_throttled_total", "throttled", "counter", "Flood waits (RetryAfter) per token bucket."),
+                ("rate_limit_wait_seconds_total", "waited_seconds", "counter", "Time requests spent waiting in a token bucket."),
+            ):
+                if not buckets:
+                    break
+                lines += [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} {kind}"]
+                for profile, bucket, state in buckets:
+                    lines.append(f'{p}_{name}{{profile="{_escape(profile)}",bucket="{_escape(bucket)}"}} {state[key]}')
+            lines += [f"# HELP {p}_stage_seconds Stage durations.", f"# TYPE {p}_stage_seconds summary"]
+            for stage, data in sorted(self._stages.items()):
+                for q in QUANTILES:
+                    lines.append(f'{p}_stage_seconds{{stage="{stage}",quantile="{q}"}} {percentile(data.samples, q):.6f}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {data.total:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {data.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, settings, record=None):
+        """Записывает метрики в файлы по настройке METRICS_EXPORT. Блокирующая функция."""
+        formats = export_formats(settings)
+        try:
+            if "prometheus" in formats:
+                path = get_app_data_path(PROMETHEUS_FILE_NAME)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(self.prometheus_text())
+                os.replace(path + ".tmp", path)  #  Сборщик не увидит наполовину записанный файл
+            if "jsonl" in formats and record is not None:
+                path = get_app_data_path(JSONL_FILE_NAME)
+                if os.path.exists(path) and os.path.getsize(path) > JSONL_MAX_BYTES:
+                    os.replace(path, path + ".1")
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"Ошибка записи метрик: {e}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class Stopwatch:
+    """with Stopwatch() as sw: ... -> sw.seconds"""
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.seconds = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        return False
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Общий на процесс реестр метрик."""
+    return _registry
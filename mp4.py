@@ -0,0 +1,265 @@
+import asyncio
+import os
+import struct
+
+from utils import get_app_data_path, logger, prune_dir
+
+FASTSTART_CACHE_DIR_NAME = "faststart_cache"
+FASTSTART_CACHE_DAYS = 7
+
+#  Контейнеры, внутри которых ищем trak/stco/co64
+_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+_COPY_BLOCK_SIZE = 1024 * 1024
+#  moov больше этого размера считаем повреждённым (обычно он занимает десятки-сотни КБ)
+_MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+class Mp4Error(Exception):
+    """Файл не похож на корректный MP4."""
+
+
+def _read_box_header(f, offset, file_size):
+    """Читает заголовок бокса по смещению. Возвращает (тип, размер, длина заголовка) или None в конце файла."""
+    f.seek(offset)
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            raise Mp4Error("обрезанный заголовок бокса")
+        size = struct.unpack(">Q", large)[0]
+        header_size = 16
+    elif size == 0:
+        size = file_size - offset  #  Бокс до конца файла
+    if size < header_size or offset + size > file_size:
+        raise Mp4Error(f"некорректный размер бокса {box_type!r}")
+    return box_type, size, header_size
+
+
+def top_level_boxes(f, file_size):
+    """Список (тип, смещение, размер) боксов верхнего уровня. Читаются только заголовки."""
+    boxes = []
+    offset = 0
+    while offset < file_size:
+        header = _read_box_header(f, offset, file_size)
+        if header is None:
+            break
+        box_type, size, _ = header
+        boxes.append((box_type, offset, size))
+        offset += size
+    return boxes
+
+
+def _iter_boxes(data, start, end):
+    """Дочерние боксы в буфере: (тип, начало содержимого, конец бокса)."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise Mp4Error(f"некорректный размер бокса {box_type!r}")
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _find_child(data, start, end, box_type):
+    for child_type, payload, child_end in _iter_boxes(data, start, end):
+        if child_type == box_type:
+            return payload, child_end
+    return None
+
+
+def _parse_mvhd(data, payload):
+    version = data[payload]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, payload + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, payload + 12)
+    return timescale, duration
+
+
+def _parse_tkhd(data, payload):
+    """(ширина, высота) дорожки с учётом поворота из матрицы."""
+    base = payload + (36 if data[payload] == 1 else 24)
+    a, b = struct.unpack_from(">ii", data, base + 16)
+    width, height = struct.unpack_from(">II", data, base + 52)
+    width, height = width >> 16, height >> 16
+    if a == 0 and b != 0:  #  Поворот на 90/270 градусов
+        width, height = height, width
+    return width, height
+
+
+def _parse_moov(data):
+    """Длительность (сек) и размеры первой видеодорожки из содержимого moov."""
+    info = {"duration": None, "width": None, "height": None}
+    mvhd = _find_child(data, 0, len(data), b"mvhd")
+    if mvhd:
+        timescale, duration = _parse_mvhd(data, mvhd[0])
+        if timescale:
+            info["duration"] = round(duration / timescale)
+
+    for box_type, payload, end in _iter_boxes(data, 0, len(data)):
+        if box_type != b"trak":
+            continue
+        mdia = _find_child(data, payload, end, b"mdia")
+        hdlr = _find_child(data, mdia[0], mdia[1], b"hdlr") if mdia else None
+        if not hdlr or data[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+            continue
+        tkhd = _find_child(data, payload, end, b"tkhd")
+        if tkhd:
+            info["width"], info["height"] = _parse_tkhd(data, tkhd[0])
+        break
+    return info
+
+
+def probe(path):
+    """
+    Читает метаданные MP4, перемещаясь по заголовкам боксов: в память читается только moov.
+    Возвращает словарь duration/width/height/faststart. При ошибке формата выбрасывает Mp4Error.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = top_level_boxes(f, file_size)
+        moov = next((b for b in boxes if b[0] == b"moov"), None)
+        if moov is None:
+            raise Mp4Error("нет бокса moov")
+        _, moov_offset, moov_size = moov
+        if moov_size > _MAX_MOOV_SIZE:
+            raise Mp4Error("слишком большой moov")
+        _, _, header_size = _read_box_header(f, moov_offset, file_size)
+        f.seek(moov_offset + header_size)
+        data = f.read(moov_size - header_size)
+
+    info = _parse_moov(data)
+    first_mdat = next((b[1] for b in boxes if b[0] == b"mdat"), None)
+    info["faststart"] = first_mdat is None or moov_offset < first_mdat
+    return info
+
+
+def _shift_chunk_offsets(data, start, end, delta, below):
+    """Сдвигает на delta байт смещения чанков (stco/co64) внутри moov, меньшие below."""
+    for box_type, payload, child_end in _iter_boxes(data, start, end):
+        if box_type in _CONTAINERS:
+            _shift_chunk_offsets(data, payload, child_end, delta, below)
+        elif box_type == b"stco":
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            for i in range(count):
+                pos = payload + 8 + i * 4
+                value = struct.unpack_from(">I", data, pos)[0]
+                if value >= below:
+                    continue
+                if value + delta > 0xFFFFFFFF:
+                    raise Mp4Error("смещение не помещается в stco")
+                struct.pack_into(">I", data, pos, value + delta)
+        elif box_type == b"co64":
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            for i in range(count):
+                pos = payload + 8 + i * 8
+                value = struct.unpack_from(">Q", data, pos)[0]
+                if value < below:
+                    struct.pack_into(">Q", data, pos, value + delta)
+
+
+def make_faststart(src, dst):
+    """
+    Переписывает MP4 так, чтобы moov стоял сразу после ftyp (fast-start).
+    Данные копируются блоками, без чтения файла в память целиком.
+    Возвращает True, если файл переписан, False - если он уже fast-start.
+    """
+    file_size = os.path.getsize(src)
+    with open(src, "rb") as f:
+        boxes = top_level_boxes(f, file_size)
+        moov = next((b for b in boxes if b[0] == b"moov"), None)
+        first_mdat = next((b for b in boxes if b[0] == b"mdat"), None)
+        if moov is None:
+            raise Mp4Error("нет бокса moov")
+        if first_mdat is None or moov[1] < first_mdat[1]:
+            return False
+        if moov[2] > _MAX_MOOV_SIZE:
+            raise Mp4Error("слишком большой moov")
+
+        f.seek(moov[1])
+        moov_data = bytearray(f.read(moov[2]))
+        _, _, header_size = _read_box_header(f, moov[1], file_size)
+        #  moov встаёт сразу за ftyp: данные, стоявшие до него, сдвигаются на его размер,
+        #  а данные после него (например, второй mdat) остаются на своих местах
+        _shift_chunk_offsets(moov_data, header_size, len(moov_data), moov[2], moov[1])
+
+        head = [b for b in boxes if b[0] == b"ftyp"]
+        rest = [b for b in boxes if b[0] not in (b"ftyp", b"moov")]
+        if head and head[0][1] != 0:
+            raise Mp4Error("ftyp не в начале файла")
+
+        tmp = dst + ".tmp"
+        with open(tmp, "wb") as out:
+            for _, offset, size in head:
+                _copy_range(f, out, offset, size)
+            out.write(moov_data)
+            for _, offset, size in rest:
+                _copy_range(f, out, offset, size)
+    os.replace(tmp, dst)
+    return True
+
+
+def _copy_range(src, dst, offset, size):
+    src.seek(offset)
+    remaining = size
+    while remaining:
+        block = src.read(min(_COPY_BLOCK_SIZE, remaining))
+        if not block:
+            raise Mp4Error("файл обрезан")
+        dst.write(block)
+        remaining -= len(block)
+
+
+def prune_faststart_cache(max_age_days=FASTSTART_CACHE_DAYS):
+    """Удаляет fast-start копии старше max_age_days. Блокирующая функция."""
+    return prune_dir(get_app_data_path(FASTSTART_CACHE_DIR_NAME), max_age_days)
+
+
+def _prepare_video(item, faststart_enabled):
+    """Метаданные видео и, при необходимости, fast-start копия в кеше. Блокирующая функция."""
+    info = probe(item["path"])
+    item["video_meta"] = {
+        "duration": info["duration"],
+        "width": info["width"],
+        "height": info["height"],
+        "supports_streaming": True,
+    }
+    if info["faststart"] or not faststart_enabled or item.get("file_id") or not item.get("digest"):
+        return False
+    cache_dir = get_app_data_path(FASTSTART_CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    dst = os.path.join(cache_dir, f"{item['digest']}.mp4")
+    if not os.path.exists(dst):
+        make_faststart(item["path"], dst)
+    item["upload_path"] = dst
+    return True
+
+
+async def prepare_videos(items, settings, events):
+    """
+    Для каждого MP4 группы читает длительность и размеры (они передаются в sendMediaGroup)
+    и переписывает файлы с moov в конце в fast-start копию. Всё - вне event loop.
+    """
+    faststart_enabled = str(settings.get("VIDEO_FASTSTART_ENABLED", "1")).strip().lower() in ("1", "true", "yes", "on")
+    rewritten = 0
+    for item in items:
+        if item["kind"] != "video":
+            continue
+        try:
+            if await asyncio.to_thread(_prepare_video, item, faststart_enabled):
+                rewritten += 1
+        except (Mp4Error, OSError, struct.error) as e:
+            logger.error(f"Не удалось разобрать MP4 {item['path']}: {e}")
+            events.log(f"⚠️ Не удалось разобрать видео {item['path']}: {e}. Отправляем как есть.")
+    if rewritten:
+        events.log(f"🎬 Видео переписано в fast-start: {rewritten}")
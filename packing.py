@@ -0,0 +1,141 @@
+import math
+import os
+
+from image_prep import PHOTO_MAX_BYTES
+from media_types import KIND_PHOTO, KIND_VIDEO, KIND_DOCUMENT
+
+#  Максимум элементов в одном альбоме
+ALBUM_MAX_ITEMS = 10
+#  Что Telegram объединяет в один альбом: фото с видео, документы - только с документами.
+#  GIF (animation) в альбом не кладётся вовсе.
+ALBUM_FAMILIES = {KIND_PHOTO: "media", KIND_VIDEO: "media", KIND_DOCUMENT: "document"}
+#  Лимиты облачного Bot API на загрузку: остальные файлы и весь запрос - 50 МБ (фото - PHOTO_MAX_BYTES)
+UPLOAD_MAX_FILE_MB = 50
+UPLOAD_MAX_REQUEST_MB = 50
+
+
+def upload_limits(settings):
+    """(лимит на файл, лимит на запрос) в байтах. Свой сервер Bot API (BOT_API_URL) принимает до 2000 МБ."""
+    local = bool(settings.get("BOT_API_URL"))
+    default = 2000 if local else UPLOAD_MAX_FILE_MB
+    file_limit = int(settings.get("UPLOAD_MAX_FILE_MB", default) or default)
+    request_limit = int(settings.get("UPLOAD_MAX_REQUEST_MB", default if local else UPLOAD_MAX_REQUEST_MB) or default)
+    return file_limit * 1024 * 1024, request_limit * 1024 * 1024
+
+
+def upload_bytes(item):
+    """Сколько байт уйдёт в запросе за этот файл (по file_id - ноль)."""
+    if item.get("file_id"):
+        return 0
+    if "upload_size" not in item:
+        try:
+            item["upload_size"] = os.path.getsize(item.get("upload_path") or item["path"])
+        except OSError:
+            item["upload_size"] = 0  #  Недоступный файл пропустит сборка запроса
+    return item["upload_size"]
+
+
+def fit_upload_limits(items, settings, events, cache=None):
+    """
+    Приводит файлы поста к лимитам Bot API до отправки, чтобы Telegram не отклонял загрузки:
+    фото больше 10 МБ (если предобработка не уменьшила его) уходит документом,
+    файл больше лимита на файл пропускается. Возвращает подходящие файлы.
+    cache (FileIdCache) - чтобы найти file_id уже загружавшегося документа. Блокирующая функция.
+    """
+    file_limit, _ = upload_limits(settings)
+    fitted = []
+    for item in items:
+        size = upload_bytes(item)
+        if item["kind"] == KIND_PHOTO and size > PHOTO_MAX_BYTES:
+            item["kind"] = KIND_DOCUMENT
+            item["file_id"] = cache.get(item["digest"], KIND_DOCUMENT) if cache and item.get("digest") else None
+            item["from_cache"] = bool(item["file_id"])
+            events.log(f"📄 Фото {item['path']} больше 10 МБ - отправляем документом.")
+            size = upload_bytes(item)
+        if size > file_limit:
+            events.log(
+                f"⚠️ Файл {item['path']} ({size / 1024 / 1024:.0f} МБ) больше лимита Bot API "
+                f"({file_limit // 1024 // 1024} МБ), пропущен."
+            )
+            continue
+        fitted.append(item)
+    return fitted
+
+
+def _fits(album, request_limit):
+    return len(album) == 1 or sum(upload_bytes(item) for item in album) <= request_limit
+
+
+def _split_evenly(items, count):
+    """Подряд идущие куски почти равной длины: 11 файлов на 2 альбома -> 6 + 5."""
+    size, extra = divmod(len(items), count)
+    albums, start = [], 0
+    for n in range(count):
+        end = start + size + (1 if n < extra else 0)
+        albums.append(items[start:end])
+        start = end
+    return albums
+
+
+def _pack_by_size(items, count, request_limit):
+    """
+    Раскладка по байтам, когда подряд идущие куски не влезают в лимит запроса: файлы от крупных
+    к мелким - в самый лёгкий подходящий альбом. None, если count альбомов мало.
+    """
+    bins = [[] for _ in range(count)]
+    loads = [0] * count
+    for i in sorted(range(len(items)), key=lambda i: -upload_bytes(items[i])):
+        size = upload_bytes(items[i])
+        #  Файл крупнее лимита запроса (возможно, только если он меньше лимита на файл) - отдельным запросом
+        fitting = [b for b in range(count)
+                   if len(bins[b]) < ALBUM_MAX_ITEMS and (loads[b] + size <= request_limit or not bins[b])]
+        if not fitting:
+            return None
+        b = min(fitting, key=lambda b: (len(bins[b]), loads[b]))
+        bins[b].append(i)
+        loads[b] += size
+    albums = sorted((sorted(b) for b in bins if b), key=lambda b: b[0])  #  Исходный порядок файлов
+    return [[items[i] for i in album] for album in albums]
+
+
+def _pack(items, request_limit):
+    """
+    Раскладывает файлы одного семейства по наименьшему числу альбомов (до 10 файлов и до request_limit байт).
+    Число альбомов начинаем с нижней оценки и увеличиваем, пока всё не поместится. Сначала пробуем
+    ровные подряд идущие куски (порядок файлов в канале не меняется), затем раскладку по байтам.
+    """
+    total = sum(upload_bytes(item) for item in items)
+    count = max(math.ceil(len(items) / ALBUM_MAX_ITEMS), math.ceil(total / request_limit) if request_limit else 1, 1)
+    #  Файлов больше лимита запроса может быть меньше, чем альбомов по оценке: больше альбомов, чем файлов, не бывает
+    count = min(count, len(items))
+    while True:
+        albums = _split_evenly(items, count)
+        if all(_fits(album, request_limit) for album in albums):
+            return [album for album in albums if album]
+        albums = _pack_by_size(items, count, request_limit)
+        if albums is not None:
+            return albums
+        count += 1
+
+
+def plan_requests(items, settings=None):
+    """
+    Раскладывает файлы поста по запросам к Bot API с наименьшим числом запросов:
+    фото и видео - общими альбомами, документы - альбомами документов, GIF - отдельными сообщениями.
+    Альбомы учитывают лимит элементов и байтов на запрос. Возвращает список (вид запроса, файлы).
+    """
+    _, request_limit = upload_limits(settings or {})
+    families = {}
+    for item in items:
+        family = ALBUM_FAMILIES.get(item["kind"])
+        if family is not None:
+            families.setdefault(family, []).append(item)
+
+    requests = []
+    for family in ("media", "document"):
+        if family not in families:
+            continue
+        for album in _pack(families[family], request_limit):
+            requests.append(("album", album) if len(album) > 1 else (album[0]["kind"], album))
+    requests += [(item["kind"], [item]) for item in items if item["kind"] not in ALBUM_FAMILIES]
+    return requests
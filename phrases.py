@@ -0,0 +1,181 @@
+import hashlib
+import json
+import mmap
+import os
+import random
+import re
+import threading
+from array import array
+
+from utils import get_app_data_path, resource_path, logger, DEFAULT_PHRASES, PHRASES_FILE_NAME
+
+#  Позиции мешка фраз по файлам: переживают перезапуск
+PHRASES_STATE_FILE_NAME = "phrases_state.json"
+MODE_RANDOM = "random"    # случайная строка, повторы возможны
+MODE_SHUFFLE = "shuffle"  # каждая строка по разу, пока не кончатся, затем новый порядок
+
+#  Непустая строка (пробелы вокруг обрезаются при чтении)
+_LINE = re.compile(rb"[^\r\n]*\S[^\r\n]*")
+_BOM = b"\xef\xbb\xbf"
+_FEISTEL_ROUNDS = 4
+
+
+class _LineIndex:
+    """
+    Смещения непустых строк файла. Строится один раз за проход по mmap (без загрузки файла в память
+    Python) и пересобирается, когда меняются mtime или размер файла. Саму строку читаем
+    seek+read по смещению - файл не держим открытым (на Windows это мешало бы его перезаписать).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.signature = [stat.st_mtime_ns, stat.st_size]
+        self.starts = array("q")
+        self.ends = array("q")
+        if stat.st_size == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for match in _LINE.finditer(mm, len(_BOM) if mm[:len(_BOM)] == _BOM else 0):
+                self.starts.append(match.start())
+                self.ends.append(match.end())
+
+    def __len__(self):
+        return len(self.starts)
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return [stat.st_mtime_ns, stat.st_size] != self.signature
+
+    def line(self, i):
+        with open(self.path, "rb") as f:
+            f.seek(self.starts[i])
+            data = f.read(self.ends[i] - self.starts[i])
+        return data.decode("utf-8", "replace").strip()
+
+
+def _feistel_round(seed, round_no, value):
+    digest = hashlib.blake2b(f"{seed}:{round_no}:{value}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shuffled_index(position, count, seed):
+    """
+    position-й элемент случайной перестановки 0..count-1, заданной seed, за O(1) памяти:
+    сеть Фейстеля на ближайшей чётной степени двойки + cycle walking до попадания в диапазон.
+    Хранить саму перестановку (сотни тысяч чисел) не нужно - достаточно seed и позиции.
+    """
+    bits = max(2, (count - 1).bit_length())
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+    x = position
+    while True:
+        left, right = x >> half, x & mask
+        for round_no in range(_FEISTEL_ROUNDS):
+            left, right = right, left ^ (_feistel_round(seed, round_no, right) & mask)
+        x = (left << half) | right
+        if x < count:
+            return x
+
+
+class PhraseStore:
+    """
+    Фразы для подписей без чтения всего файла на каждый пост.
+    Файл ищется как раньше: сначала AppData, затем ресурсы программы; если фраз нет нигде -
+    стандартные фразы. Режим shuffle ("без повторов, пока не кончатся") хранит seed и позицию
+    мешка в AppData/phrases_state.json; при изменении файла мешок начинается заново.
+    """
+
+    def __init__(self, filename=PHRASES_FILE_NAME, mode=MODE_RANDOM):
+        self.filename = filename
+        self.mode = mode
+        self._indexes = {}  #  путь -> _LineIndex
+        self._lock = threading.Lock()
+
+    def _candidates(self):
+        return (get_app_data_path(self.filename), resource_path(self.filename))
+
+    def _current_index(self):
+        """Индекс первого существующего непустого файла фраз (с пересборкой по mtime) или None."""
+        for path in self._candidates():
+            index = self._indexes.get(path)
+            if index is None or index.is_stale():
+                self._indexes.pop(path, None)
+                if not os.path.exists(path):
+                    continue
+                try:
+                    index = self._indexes[path] = _LineIndex(path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Ошибка при загрузке фраз из {path}: {e}")
+                    continue
+            if len(index):
+                return index
+        return None
+
+    def pick(self):
+        """Следующая фраза. Блокирующая функция (stat, чтение одной строки)."""
+        with self._lock:
+            index = self._current_index()
+            if index is None:
+                return random.choice(DEFAULT_PHRASES)
+            if self.mode == MODE_SHUFFLE:
+                return index.line(self._next_shuffled(index))
+            return index.line(random.randrange(len(index)))
+
+    def _next_shuffled(self, index):
+        with _states_lock:  #  Файл позиций общий для всех профилей
+            return self._advance_bag(index)
+
+    def _advance_bag(self, index):
+        states = _load_states()
+        state = states.get(index.path)
+        if not state or state.get("signature") != index.signature or state.get("position", 0) >= len(index):
+            state = {"signature": index.signature, "seed": random.getrandbits(64), "position": 0}
+        line_no = shuffled_index(state["position"], len(index), state["seed"])
+        state["position"] += 1
+        states[index.path] = state
+        _save_states(states)
+        return line_no
+
+
+def _load_states():
+    try:
+        with open(get_app_data_path(PHRASES_STATE_FILE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Не удалось прочитать позицию фраз: {e}")
+        return {}
+
+
+def _save_states(states):
+    path = get_app_data_path(PHRASES_STATE_FILE_NAME)
+    try:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(states, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.error(f"Не удалось сохранить позицию фраз: {e}")
+
+
+_states_lock = threading.Lock()
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_phrase_store(settings):
+    """Общее на процесс хранилище фраз профиля (по PHRASES_FILE и PHRASES_MODE)."""
+    filename = settings.get("PHRASES_FILE", PHRASES_FILE_NAME)
+    mode = str(settings.get("PHRASES_MODE", MODE_RANDOM)).strip().lower()
+    if mode not in (MODE_RANDOM, MODE_SHUFFLE):
+        mode = MODE_RANDOM
+    with _stores_lock:
+        store = _stores.get((filename, mode))
+        if store is None:
+            store = _stores[(filename, mode)] = PhraseStore(filename, mode)
+        return store
@@ -0,0 +1,315 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from utils import get_app_data_path, logger, LAST_POST_TIME_FILE_NAME
+
+QUEUE_DB_FILE_NAME = "post_queue.db"
+DEFAULT_PROFILE = "default"
+
+#  Состояния группы в журнале
+STATE_PENDING = "pending"      # ждёт отправки
+STATE_IN_FLIGHT = "in_flight"  # отправляется прямо сейчас
+STATE_SENT = "sent"            # отправлена
+STATE_FAILED = "failed"        # исчерпаны попытки
+STATE_SKIPPED = "skipped"      # файлы исчезли до отправки
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL DEFAULT 'default',
+    entry_path TEXT NOT NULL,
+    is_dir INTEGER NOT NULL DEFAULT 0,
+    files TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    message_ids TEXT,
+    last_error TEXT,
+    ctime REAL NOT NULL,
+    due_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS post_chunks (
+    post_id INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    files TEXT NOT NULL,
+    message_ids TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (post_id, channel, seq)
+);
+"""
+
+_INDEXES = """
+DROP INDEX IF EXISTS idx_posts_active;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_profile_active ON posts(profile, entry_path) WHERE state IN ('pending', 'in_flight');
+DROP INDEX IF EXISTS idx_posts_due;
+CREATE INDEX IF NOT EXISTS idx_posts_profile_due ON posts(profile, state, due_at, id);
+--  Проверка "группа с этим ctime уже отправлена или упала" при пополнении очереди
+CREATE INDEX IF NOT EXISTS idx_posts_profile_entry ON posts(profile, entry_path, ctime);
+"""
+
+
+class PostQueue:
+    """
+    Журнал очереди постов в SQLite (WAL).
+    Для каждой группы хранит состояние, число попыток, message_id из Telegram и отметки времени.
+    Все переходы состояний - отдельные транзакции, поэтому после падения работа продолжается
+    с того же места без повторного сканирования и повторной загрузки.
+    Несколько профилей делят один файл журнала, каждый PostQueue видит только свой profile.
+    Методы блокирующие: из event loop их нужно вызывать через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path=None, profile=DEFAULT_PROFILE):
+        self.db_path = db_path or get_app_data_path(QUEUE_DB_FILE_NAME)
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(posts)")]
+        if "profile" not in columns:  #  Журнал до появления профилей
+            self._conn.execute("ALTER TABLE posts ADD COLUMN profile TEXT NOT NULL DEFAULT 'default'")
+        self._conn.executescript(_INDEXES)
+        self._migrate_last_post_time()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self):
+        """Контекст транзакции (BEGIN IMMEDIATE ... COMMIT/ROLLBACK) под блокировкой."""
+        return _Transaction(self._conn, self._lock)
+
+    def _profile_key(self, name):
+        #  У профиля по умолчанию ключ без суффикса - совместимость с журналом до профилей
+        return name if self.profile == DEFAULT_PROFILE else f"{name}:{self.profile}"
+
+    @property
+    def _last_post_key(self):
+        return self._profile_key("last_post_time")
+
+    def _migrate_last_post_time(self):
+        """Однократно переносит время последнего поста из старого last_post_time.json."""
+        if self.profile != DEFAULT_PROFILE or self._get_meta(self._last_post_key) is not None:
+            return
+        legacy_file = get_app_data_path(LAST_POST_TIME_FILE_NAME)
+        try:
+            with open(legacy_file, "r") as f:
+                timestamp = float(json.load(f))
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError, TypeError, ValueError) as e:
+            logger.error(f"Не удалось перенести время последнего поста: {e}")
+            return
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (self._last_post_key, str(timestamp)))
+        logger.info("Время последнего поста перенесено в журнал очереди.")
+
+    def _get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key, default=None):
+        value = self._get_meta(key)
+        return default if value is None else value
+
+    @staticmethod
+    def _row_to_post(row):
+        post = dict(row)
+        post["files"] = json.loads(post["files"])
+        post["message_ids"] = json.loads(post["message_ids"]) if post["message_ids"] else {}
+        post["is_dir"] = bool(post["is_dir"])
+        return post
+
+    def recover(self):
+        """
+        Возвращает в очередь группы, отправка которых прервалась падением.
+        Возвращает их количество.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE posts SET state = ?, updated_at = ? WHERE profile = ? AND state = ?",
+                (STATE_PENDING, time.time(), self.profile, STATE_IN_FLIGHT),
+            )
+            return cursor.rowcount
+
+    def enqueue_many(self, items):
+        """
+        Добавляет группы в очередь: items - список (entry_path, files, ctime, is_dir).
+        Уже стоящие в очереди записи, а также отправленные и окончательно упавшие группы с тем же ctime
+        пропускаются: отправленная группа, которую не успели перенести в архив (падение, файл занят),
+        повторно не публикуется.
+        Возвращает число добавленных групп.
+        """
+        now = time.time()
+        added = 0
+        with self._transaction() as conn:
+            for entry_path, files, ctime, is_dir in items:
+                cursor = conn.execute(
+                    """
+                    INSERT OR IGNORE INTO posts(profile, entry_path, is_dir, files, state, ctime, due_at, created_at, updated_at)
+                    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM posts WHERE profile = ? AND entry_path = ? AND state IN (?, ?) AND ctime = ?
+                    )
+                    """,
+                    (self.profile, entry_path, int(is_dir), json.dumps(files), STATE_PENDING, ctime, ctime, now, now,
+                     self.profile, entry_path, STATE_SENT, STATE_FAILED, ctime),
+                )
+                added += cursor.rowcount
+        return added
+
+    def next_due(self, now=None):
+        """Самая старая группа, которую уже можно отправлять, или None."""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM posts WHERE profile = ? AND state = ? AND due_at <= ? ORDER BY due_at, id LIMIT 1",
+                (self.profile, STATE_PENDING, now),
+            ).fetchone()
+        return self._row_to_post(row) if row else None
+
+    def pending_count(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS n FROM posts WHERE profile = ? AND state IN (?, ?)",
+                (self.profile, STATE_PENDING, STATE_IN_FLIGHT),
+            ).fetchone()
+        return row["n"]
+
+    def mark_in_flight(self, post_id, files):
+        """Помечает группу как отправляемую и фиксирует актуальный список файлов."""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET state = ?, files = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (STATE_IN_FLIGHT, json.dumps(files), time.time(), post_id),
+            )
+
+    def mark_sent(self, post_id, message_ids):
+        """
+        Фиксирует успешную отправку и время последнего поста одной транзакцией.
+        message_ids - {канал: список message_id или None для канала, куда пост не ушёл}.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET state = ?, message_ids = ?, sent_at = ?, updated_at = ?, last_error = NULL WHERE id = ?",
+                (STATE_SENT, json.dumps(message_ids), now, now, post_id),
+            )
+            conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (self._last_post_key, str(now)))
+            conn.execute("DELETE FROM post_chunks WHERE post_id = ?", (post_id,))
+
+    def mark_failed(self, post_id, error, retry_delay, max_attempts):
+        """
+        Фиксирует неудачную попытку. Пока попытки не исчерпаны, группа возвращается
+        в очередь через retry_delay секунд, иначе переходит в failed.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                UPDATE posts SET
+                    state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    due_at = ?, last_error = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (max_attempts, STATE_FAILED, STATE_PENDING, now + retry_delay, error, now, post_id),
+            )
+            #  Отправленные части храним, пока группа может быть отправлена повторно
+            conn.execute(
+                "DELETE FROM post_chunks WHERE post_id = ? AND (SELECT state FROM posts WHERE id = ?) = ?",
+                (post_id, post_id, STATE_FAILED),
+            )
+
+    def sent_chunks(self, post_id):
+        """
+        Уже отправленные части группы: {канал: [(файлы, message_ids)]} в порядке отправки.
+        Пустой список message_ids - файл пропущен (Telegram его не принял).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT channel, files, message_ids FROM post_chunks WHERE post_id = ? ORDER BY channel, seq",
+                (post_id,),
+            ).fetchall()
+        chunks = {}
+        for row in rows:
+            chunks.setdefault(row["channel"], []).append((json.loads(row["files"]), json.loads(row["message_ids"])))
+        return chunks
+
+    def record_chunk(self, post_id, channel, files, message_ids):
+        """Сохраняет отправленную часть группы, чтобы повтор продолжился со следующей."""
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO post_chunks(post_id, channel, seq, files, message_ids, sent_at)
+                SELECT ?, ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ?
+                FROM post_chunks WHERE post_id = ? AND channel = ?
+                """,
+                (post_id, channel, json.dumps(files), json.dumps(message_ids), time.time(), post_id, channel),
+            )
+
+    def mark_skipped(self, post_id, reason):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE posts SET state = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (STATE_SKIPPED, reason, time.time(), post_id),
+            )
+
+    def last_post_time(self):
+        """Время последнего успешного поста (datetime) или None."""
+        value = self._get_meta(self._last_post_key)
+        return datetime.fromtimestamp(float(value)) if value is not None else None
+
+    def next_post_state(self):
+        """
+        Сохранённый срок следующего поста: {"due": timestamp, "basis": timestamp последнего поста
+        или None, "rule": отпечаток расписания} или None. Переживает перезапуск.
+        """
+        value = self._get_meta(self._profile_key("next_post"))
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+
+    def save_next_post_state(self, state):
+        self.set_meta(self._profile_key("next_post"), json.dumps(state))
+
+
+class _Transaction:
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+        return False
@@ -0,0 +1,178 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import get_metrics
+from utils import logger
+
+#  Лимиты Bot API по умолчанию: ~30 запросов в секунду на бота и ~20 сообщений в минуту в один канал
+DEFAULT_GLOBAL_PER_SECOND = 30
+DEFAULT_CHAT_PER_MINUTE = 20
+DEFAULT_MAX_RETRIES = 3
+#  После RetryAfter скорость корзины делится на 2, но не ниже base_rate / MIN_RATE_DIVISOR
+MIN_RATE_DIVISOR = 16
+#  Каждый успешный запрос возвращает скорости часть от базовой (аддитивное восстановление)
+RECOVERY_STEP = 0.05
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0):
+    """Экспоненциальная задержка с полным джиттером: случайное значение от 0 до min(cap, base * 2^attempt)."""
+    return random.uniform(0, min(cap, base * 2 ** max(attempt - 1, 0)))
+
+
+def retry_after_seconds(error):
+    """RetryAfter.retry_after - секунды (int) или timedelta в зависимости от версии PTB."""
+    value = error.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity про запас.
+    Запрос ждёт, пока наберётся нужное число токенов; ожидающие обслуживаются по очереди.
+    Скорость подстраивается: RetryAfter снижает её и блокирует корзину на указанное время,
+    успешные запросы понемногу возвращают её к базовой.
+    """
+
+    def __init__(self, rate, capacity):
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttled = 0  #  Сколько раз Telegram ответил RetryAfter
+        self.waited = 0.0  #  Суммарное время ожидания в корзине, секунд
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, cost=1):
+        """Ждёт и забирает cost токенов. Возвращает время ожидания в секундах."""
+        cost = min(float(cost), self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= cost:
+                        self.tokens -= cost
+                        waited = now - started
+                        self.waited += waited
+                        return waited
+                    wait = (cost - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def penalize(self, retry_after):
+        """Telegram попросил подождать: блокируем корзину и снижаем скорость."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.rate = max(self.base_rate / MIN_RATE_DIVISOR, self.rate / 2)
+        self.throttled += 1
+
+    def reward(self):
+        """Успешный запрос: скорость понемногу возвращается к базовой."""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_STEP)
+
+    def state(self):
+        """Текущее состояние корзины (для просмотра)."""
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate_per_minute": round(self.rate * 60, 2),
+            "base_rate_per_minute": round(self.base_rate * 60, 2),
+            "capacity": self.capacity,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(0.0, self.blocked_until - now), 2),
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited, 2),
+        }
+
+
+class AdaptiveRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель запросов для Application: общая корзина на бота и по корзине на каждый чат.
+    Альбом расходует столько токенов канала, сколько в нём файлов.
+    На RetryAfter корзина блокируется на указанное время, её скорость снижается,
+    и запрос повторяется (не больше max_retries раз).
+    """
+
+    def __init__(self, global_per_second=DEFAULT_GLOBAL_PER_SECOND, chat_per_minute=DEFAULT_CHAT_PER_MINUTE,
+                 max_retries=DEFAULT_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.chat_per_minute = chat_per_minute
+        self.max_retries = max_retries
+        self.chat_buckets = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            global_per_second=float(settings.get("RATE_LIMIT_GLOBAL_PER_SECOND", DEFAULT_GLOBAL_PER_SECOND)),
+            chat_per_minute=float(settings.get("RATE_LIMIT_CHAT_PER_MINUTE", DEFAULT_CHAT_PER_MINUTE)),
+            max_retries=int(settings.get("RATE_LIMIT_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+        )
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_per_minute / 60, self.chat_per_minute)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        chat_bucket = self._chat_bucket(str(chat_id)) if chat_id is not None else None
+        cost = len(data.get("media") or ()) or 1
+
+        retries = 0
+        while True:
+            #  Сначала корзина чата (ждать можно долго), потом общая (короткое ожидание)
+            if chat_bucket is not None:
+                await chat_bucket.acquire(cost)
+            await self.global_bucket.acquire()
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = retry_after_seconds(e)
+                bucket = chat_bucket or self.global_bucket
+                bucket.penalize(retry_after)
+                logger.warning(
+                    f"🐢 {endpoint}: Telegram просит подождать {retry_after:.0f} с"
+                    f"{f' (чат {chat_id})' if chat_id is not None else ''}. "
+                    f"Лимит снижен до {bucket.rate * 60:.1f}/мин."
+                )
+                if retries >= self.max_retries:
+                    raise
+                retries += 1
+                get_metrics().add_retries()  #  Повтор внутри ограничителя - тоже повтор отправки
+                continue
+            if chat_bucket is not None:
+                chat_bucket.reward()
+            self.global_bucket.reward()
+            return result
+
+    def snapshot(self):
+        """Лимиты и состояние всех корзин: {"global": {...}, "chats": {чат: {...}}}."""
+        return {
+            "global": self.global_bucket.state(),
+            "chats": {chat: bucket.state() for chat, bucket in self.chat_buckets.items()},
+        }
@@ -0,0 +1,186 @@
+import heapq
+import os
+
+from media_types import MediaClassifier
+
+#  Расширения, которые бот умеет отправлять (без учёта белого/чёрного списков)
+MEDIA_EXTENSIONS = MediaClassifier().extensions
+
+
+def scan_folder(folder_path, extensions=MEDIA_EXTENSIONS):
+    """
+    Сканирует папку и возвращает список *групп* файлов.
+    Отдельный файл в корне папки - группа из одного файла,
+    подпапка - группа из всех её медиафайлов. Группы отсортированы по времени создания.
+    При ошибке доступа к папке выбрасывает OSError.
+    """
+    groups = []
+    entries = []
+    for entry_name in os.listdir(folder_path):
+        entry_path = os.path.join(folder_path, entry_name)
+        entries.append((entry_path, os.path.getctime(entry_path)))
+
+    entries.sort(key=lambda x: x[1])
+
+    for entry_path, _ in entries:
+        if os.path.isfile(entry_path):
+            _, ext = os.path.splitext(entry_path)
+            if ext.lower() in extensions:
+                groups.append([entry_path])
+        elif os.path.isdir(entry_path):
+            group = []
+            for filename in os.listdir(entry_path):
+                file_path = os.path.join(entry_path, filename)
+                if os.path.isfile(file_path):
+                    _, ext = os.path.splitext(filename)
+                    if ext.lower() in extensions:
+                        group.append(file_path)
+            if group:
+                groups.append(group)
+
+    return groups
+
+
+def list_group(dir_path, extensions=MEDIA_EXTENSIONS):
+    """Медиафайлы подпапки-группы (без рекурсии). При ошибке доступа выбрасывает OSError."""
+    group = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                group.append(entry.path)
+    return group
+
+
+class FolderIndex:
+    """
+    Инкрементальный индекс папки с очередью групп, упорядоченной по времени создания.
+
+    Вместо полного сканирования на каждый пост индекс сравнивает mtime корневой папки:
+    если он не менялся, корень не перечитывается вовсе, а при изменении stat делается
+    только для новых записей. Следующая группа достаётся из кучи за O(log n).
+    Пустые подпапки "паркуются" и возвращаются в очередь, когда меняется их mtime.
+    Забранные drain() файлы остаются в индексе с отметкой "в очереди": после изменения
+    корня (например, перенос отправленного в архив) stat делается только для новых путей.
+    """
+
+    def __init__(self, folder_path, extensions=MEDIA_EXTENSIONS):
+        self.folder_path = folder_path
+        self.extensions = frozenset(extensions)
+        self._entries = {}   #  путь -> (ctime, это_папка)
+        self._heap = []      #  (ctime, путь); устаревшие элементы удаляются лениво
+        self._parked = {}    #  пустые подпапки: путь -> mtime_ns
+        self._enqueued = set()  #  файлы, уже переданные в очередь постов (drain)
+        self._root_mtime = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _push(self, path, ctime, is_dir):
+        self._entries[path] = (ctime, is_dir)
+        heapq.heappush(self._heap, (ctime, path))
+
+    def _sync_root(self, root_mtime):
+        """Сверяет содержимое корня с индексом: stat только для новых записей."""
+        seen = set()
+        with os.scandir(self.folder_path) as it:
+            for entry in it:
+                path = entry.path
+                seen.add(path)
+                if path in self._entries or path in self._parked:
+                    continue
+                try:
+                    if entry.is_file():
+                        if os.path.splitext(entry.name)[1].lower() in self.extensions:
+                            self._push(path, entry.stat().st_ctime, False)
+                    elif entry.is_dir():
+                        self._push(path, entry.stat().st_ctime, True)
+                except OSError:
+                    continue  #  Запись исчезла между scandir и stat
+
+        for path in [p for p in self._entries if p not in seen]:
+            del self._entries[path]
+            self._enqueued.discard(path)
+        for path in [p for p in self._parked if p not in seen]:
+            del self._parked[path]
+        self._root_mtime = root_mtime
+
+    def refresh(self):
+        """Подтягивает изменения папки. При ошибке доступа выбрасывает OSError."""
+        root_mtime = os.stat(self.folder_path).st_mtime_ns
+        if root_mtime != self._root_mtime:
+            self._sync_root(root_mtime)
+
+        for path, mtime in list(self._parked.items()):
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                del self._parked[path]
+                continue
+            if current.st_mtime_ns != mtime:
+                del self._parked[path]
+                self._push(path, current.st_ctime, True)
+
+    def _park(self, path):
+        self._entries.pop(path, None)
+        try:
+            self._parked[path] = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            pass
+
+    def peek(self):
+        """Возвращает (путь_записи, группа_файлов) самой старой группы или None."""
+        while self._heap:
+            ctime, path = self._heap[0]
+            if self._entries.get(path, (None,))[0] != ctime or path in self._enqueued:
+                heapq.heappop(self._heap)  #  Запись удалена или переиндексирована
+                continue
+            if not self._entries[path][1]:
+                if os.path.isfile(path):
+                    return path, [path]
+                del self._entries[path]
+                self._enqueued.discard(path)
+                heapq.heappop(self._heap)
+                continue
+            try:
+                group = list_group(path, self.extensions)
+            except OSError:
+                group = []
+            if group:
+                return path, group
+            heapq.heappop(self._heap)
+            self._park(path)
+        return None
+
+    def next_group(self):
+        """refresh() + peek(): самая старая группа с учётом последних изменений."""
+        self.refresh()
+        return self.peek()
+
+    def discard(self, path):
+        """
+        Убирает группу из очереди индекса. Подпапка паркуется (вернётся, когда изменится её mtime),
+        файл остаётся известным индексу, но больше не выдаётся, пока он не исчезнет из папки.
+        """
+        ctime, is_dir = self._entries.get(path, (None, False))
+        if is_dir and os.path.isdir(path):
+            self._park(path)
+        elif path in self._entries and not is_dir:
+            self._enqueued.add(path)
+        else:
+            self._entries.pop(path, None)
+
+    def drain(self):
+        """
+        Забирает из индекса все готовые группы по порядку ctime.
+        Возвращает список (путь_записи, группа_файлов, ctime, это_папка) - для переноса в очередь постов.
+        """
+        self.refresh()
+        items = []
+        while True:
+            head = self.peek()
+            if head is None:
+                return items
+            path, group = head
+            ctime, is_dir = self._entries[path]
+            items.append((path, group, ctime, is_dir))
+            self.discard(path)
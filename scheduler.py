@@ -0,0 +1,185 @@
+import random
+import re
+from datetime import datetime, timedelta, time as dtime
+
+#  Дни недели: английские и русские сокращения -> номер (пн = 0)
+WEEKDAYS = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+    "пн": 0, "вт": 1, "ср": 2, "чт": 3, "пт": 4, "сб": 5, "вс": 6,
+}
+ALL_DAYS = frozenset(range(7))
+#  Дальше этого горизонта окно/слот не ищем (например, окна не заданы ни на один день)
+_SEARCH_DAYS = 8
+
+_TIME = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+class ScheduleError(ValueError):
+    """Ошибка в POST_WINDOWS / POST_SLOTS."""
+
+
+def _parse_time(text):
+    match = _TIME.match(text)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ScheduleError(f"некорректное время: {text!r} (нужно ЧЧ:ММ)")
+    return dtime(int(match.group(1)), int(match.group(2)))
+
+
+def _parse_days(text):
+    """'mon-fri', 'sat,sun', 'пн-пт' -> множество номеров дней."""
+    days = set()
+    for part in text.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        if first not in WEEKDAYS or (last and last not in WEEKDAYS):
+            raise ScheduleError(f"неизвестный день недели: {part!r}")
+        start = WEEKDAYS[first]
+        end = WEEKDAYS[last] if last else start
+        day = start
+        while True:
+            days.add(day)
+            if day == end:
+                break
+            day = (day + 1) % 7
+    return frozenset(days)
+
+
+def _parse_entries(value):
+    """
+    'mon-fri 09:00-13:00 18:00-22:00; sat,sun 12:00-20:00' -> [(дни, [токены времени])].
+    Записи разделяются ';', дни можно не указывать (тогда - каждый день).
+    """
+    entries = []
+    for entry in str(value or "").split(";"):
+        tokens = entry.replace(",", " ").split()
+        if not tokens:
+            continue
+        days = ALL_DAYS
+        #  Дни - всё до первого токена с ':'
+        day_tokens = []
+        while tokens and ":" not in tokens[0]:
+            day_tokens.append(tokens.pop(0))
+        if day_tokens:
+            days = _parse_days(",".join(day_tokens))
+        if not tokens:
+            raise ScheduleError(f"не указано время: {entry.strip()!r}")
+        entries.append((days, tokens))
+    return entries
+
+
+def parse_windows(value):
+    """POST_WINDOWS -> [(дни, начало, конец)]. Окно может переходить через полночь (22:00-02:00)."""
+    windows = []
+    for days, tokens in _parse_entries(value):
+        for token in tokens:
+            start, sep, end = token.partition("-")
+            if not sep:
+                raise ScheduleError(f"окно должно быть вида ЧЧ:ММ-ЧЧ:ММ: {token!r}")
+            windows.append((days, _parse_time(start), _parse_time(end)))
+    return windows
+
+
+def parse_slots(value):
+    """POST_SLOTS -> [(дни, время)]."""
+    return [(days, _parse_time(token)) for days, tokens in _parse_entries(value) for token in tokens]
+
+
+class Schedule:
+    """
+    Правила расписания профиля.
+    - Без слотов: следующий пост = последний пост + случайная задержка [MIN, MAX];
+      если задано POST_WINDOWS, время сдвигается на начало ближайшего окна.
+    - Со слотами (POST_SLOTS): посты выходят в заданное время по дням недели;
+      пропущенный (пока бот был выключен) слот отрабатывается один раз сразу.
+    Срок считается один раз на каждый пост (next_due), а не при каждой проверке.
+    """
+
+    def __init__(self, min_delay=10, max_delay=120, windows=(), slots=()):
+        self.min_delay = min(min_delay, max_delay)
+        self.max_delay = max(min_delay, max_delay)
+        self.windows = list(windows)
+        self.slots = list(slots)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            min_delay=int(settings.get("MIN_DELAY_MINUTES", 10)),
+            max_delay=int(settings.get("MAX_DELAY_MINUTES", 120)),
+            windows=parse_windows(settings.get("POST_WINDOWS", "")),
+            slots=parse_slots(settings.get("POST_SLOTS", "")),
+        )
+
+    @property
+    def signature(self):
+        """Строка-отпечаток правил: при смене настроек сохранённый срок пересчитывается."""
+        windows = sorted((sorted(d), s.isoformat(), e.isoformat()) for d, s, e in self.windows)
+        slots = sorted((sorted(d), t.isoformat()) for d, t in self.slots)
+        return repr((self.min_delay, self.max_delay, windows, slots))
+
+    def in_window(self, moment):
+        if not self.windows:
+            return True
+        t = moment.time()
+        for days, start, end in self.windows:
+            if start <= end:
+                if moment.weekday() in days and start <= t < end:
+                    return True
+            else:
+                #  Через полночь: хвост после полуночи относится к окну предыдущего дня
+                if moment.weekday() in days and t >= start:
+                    return True
+                if (moment.weekday() - 1) % 7 in days and t < end:
+                    return True
+        return False
+
+    def next_window_start(self, moment):
+        """moment, если он внутри окна, иначе начало ближайшего окна после него."""
+        if self.in_window(moment):
+            return moment
+        best = None
+        for offset in range(_SEARCH_DAYS):
+            day = moment.date() + timedelta(days=offset)
+            for days, start, _ in self.windows:
+                if day.weekday() not in days:
+                    continue
+                candidate = datetime.combine(day, start)
+                if candidate > moment and (best is None or candidate < best):
+                    best = candidate
+            if best is not None:
+                return best
+        return moment  #  Окна не покрывают ни одного дня - не ограничиваем
+
+    def next_slot(self, after):
+        """Первый слот строго после after."""
+        for offset in range(_SEARCH_DAYS):
+            day = after.date() + timedelta(days=offset)
+            times = sorted(t for days, t in self.slots if day.weekday() in days)
+            for t in times:
+                candidate = datetime.combine(day, t)
+                if candidate > after:
+                    return candidate
+        return None
+
+    def next_due(self, last_post_time, now=None):
+        """Срок следующего поста (datetime)."""
+        now = now or datetime.now()
+        if self.slots:
+            due = self.next_slot(last_post_time or now)
+            #  Слот прошёл, пока бот был выключен - пост сразу; слотов нет вовсе - тоже сразу
+            return now if due is None else max(due, now)
+        if last_post_time is None:
+            base = now
+        else:
+            base = last_post_time + timedelta(minutes=random.randint(self.min_delay, self.max_delay))
+        #  Срок уже в прошлом (бот был выключен) - окно ищем от текущего момента, а не от старого срока
+        return self.next_window_start(max(base, now))
+
+    def send_time(self, now=None):
+        """
+        Когда можно отправить пост, срок которого уже наступил: внутри окна - сразу,
+        иначе - в начале следующего окна. Слоты окнами не ограничиваются.
+        """
+        now = now or datetime.now()
+        return now if self.slots else self.next_window_start(now)
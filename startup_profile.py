@@ -0,0 +1,115 @@
+import sys
+import threading
+import time
+
+#  Сколько самых тяжёлых модулей показывать в отчёте
+REPORT_TOP_MODULES = 15
+
+
+class _TimedLoader:
+    """Обёртка загрузчика: засекает выполнение модуля и сразу возвращает модулю настоящий загрузчик."""
+
+    def __init__(self, loader, profile):
+        self.loader = loader
+        self.profile = profile
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__spec__.loader = module.__loader__ = self.loader
+        self.profile.exec_timed(module.__name__, self.loader.exec_module, module)
+
+
+class StartupProfile:
+    """
+    Отчёт о холодном старте (--profile-startup): время этапов запуска и самые тяжёлые импорты.
+    Импорты засекаются, как в python -X importtime: "своё" время модуля - без вложенных импортов.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []    # [(этап, секунды, модулей загружено)]
+        self.imports = {}   # модуль -> (своё время, всего)
+        self._stack = []
+        self._modules = len(sys.modules)
+        self._thread = threading.get_ident()  #  Замеряем только главный поток: стек вложенности - один
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def exec_timed(self, name, exec_module, module):
+        if threading.get_ident() != self._thread:
+            exec_module(module)
+            return
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += total
+            self.imports[name] = (total - nested, total)
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def mark(self, phase):
+        """Закрывает этап запуска: время с конца предыдущего этапа."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last, len(sys.modules) - self._modules))
+        self._modules = len(sys.modules)
+        self.last = now
+
+    def report(self):
+        from utils import logger  #  Не раньше: utils тоже входит в замер
+        self.uninstall()
+        total = time.perf_counter() - self.started
+        lines = [f"⏱ Запуск: {total * 1000:.0f} мс"]
+        for phase, seconds, modules in self.phases:
+            lines.append(f"   {phase}: {seconds * 1000:.0f} мс (модулей: {modules})")
+        imports_total = sum(own for own, _ in self.imports.values())
+        lines.append(f"   импорт {len(self.imports)} модулей: {imports_total * 1000:.0f} мс, самые тяжёлые:")
+        heaviest = sorted(self.imports.items(), key=lambda item: -item[1][0])[:REPORT_TOP_MODULES]
+        for name, (own, cumulative) in heaviest:
+            lines.append(f"   {own * 1000:8.1f} | {cumulative * 1000:8.1f} мс | {name}")
+        logger.info("\n".join(lines))
+
+
+_profile = None
+
+
+def enable_startup_profile():
+    """Включает отчёт о запуске (вызывается до импорта остальных модулей программы)."""
+    global _profile
+    _profile = StartupProfile().install()
+    return _profile
+
+
+def mark_startup(phase):
+    if _profile is not None:
+        _profile.mark(phase)
+
+
+def report_startup():
+    """Пишет отчёт в лог один раз - когда программа полностью готова к работе."""
+    global _profile
+    if _profile is not None:
+        _profile.report()
+        _profile = None
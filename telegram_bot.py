@@ -1,146 +1,455 @@
 import asyncio
-import os
 import logging
+import os
 
+import httpx
 import telegram
-from telegram.ext import Application, AIORateLimiter
+from telegram.ext import Application
 from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
 
-from utils import generate_phrase_with_emoji, check_disk_space, load_phrases
-from PyQt6.QtCore import Qt, QMetaObject, Q_ARG # Добавить!
+from archive import get_archiver
+from config import parse_channel_ids
+from dedup import drop_duplicates, remember_posted
+from image_prep import preprocess_images
+from mp4 import prepare_videos
+from media_cache import get_file_id_cache, resolve_file_ids, remember_file_ids, forget_cached_file_ids
+from media_types import MediaClassifier, KIND_PHOTO, KIND_VIDEO, KIND_ANIMATION
+from packing import fit_upload_limits, plan_requests
+from phrases import get_phrase_store
+from rate_limit import AdaptiveRateLimiter, backoff_delay, retry_after_seconds
+from uploads import build_media_group, close_handles, open_single
+from utils import add_emojis, check_disk_space
 
 # Логирование
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def send_telegram_post(bot_token, channel_id, file_paths, gui_instance):
-    """Отправляет пост в Telegram."""
-    app = Application.builder().token(bot_token).rate_limiter(AIORateLimiter()).build()
+#  Ошибки BadRequest, которые относятся к каналу или подписи, а не к файлу: поиск "плохого" файла не поможет
+CHAT_ERROR_MARKERS = (
+    "chat not found", "not enough rights", "have no rights", "need administrator rights",
+    "bot was kicked", "caption is too long",
+)
+
+#  Живые сессии бота: токен -> инициализированный Application.
+#  Одна сессия (и один пул соединений + rate limiter) на токен на всё время работы бота.
+_sessions = {}
+_sessions_lock = asyncio.Lock()
+
+
+def build_request(settings):
+    """Создаёт HTTP-клиент бота с пулом соединений по настройкам."""
+    pool_size = int(settings.get("POOL_SIZE", 8))
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        #  Свои лимиты пула заменяют лимиты PTB: так задаётся keep-alive, которого нет среди параметров HTTPXRequest
+        httpx_kwargs={"limits": httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=float(settings.get("POOL_KEEPALIVE_SECONDS", 60)),
+        )},
+        connect_timeout=float(settings.get("CONNECT_TIMEOUT", 20)),
+        read_timeout=float(settings.get("READ_TIMEOUT", 60)),
+        write_timeout=float(settings.get("WRITE_TIMEOUT", 60)),
+        pool_timeout=float(settings.get("POOL_TIMEOUT", 10)),
+    )
+
+
+async def get_bot_session(bot_token, settings):
+    """
+    Возвращает сессию бота для токена.
+    Создаёт и инициализирует её при первом обращении, дальше переиспользует.
+    """
+    async with _sessions_lock:
+        app = _sessions.get(bot_token)
+        if app is None:
+            builder = (
+                Application.builder()
+                .token(bot_token)
+                .request(build_request(settings))
+                .rate_limiter(AdaptiveRateLimiter.from_settings(settings))
+            )
+            #  Свой Bot API сервер (telegram-bot-api) или локальная заглушка бенчмарков
+            api_url = str(settings.get("BOT_API_URL", "") or "").rstrip("/")
+            if api_url:
+                builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+            app = builder.build()
+            await app.initialize()
+            _sessions[bot_token] = app
+            logger.info("Сессия бота создана.")
+        return app
+
 
+def rate_limit_state(bot_token):
+    """Лимиты и состояние ограничителя запросов сессии бота (None, если сессии нет)."""
+    app = _sessions.get(bot_token)
+    if app is None or not isinstance(app.bot.rate_limiter, AdaptiveRateLimiter):
+        return None
+    return app.bot.rate_limiter.snapshot()
+
+
+async def close_bot_session(bot_token):
+    """Закрывает сессию бота и освобождает пул соединений."""
+    async with _sessions_lock:
+        app = _sessions.pop(bot_token, None)
+    if app is not None:
+        await app.shutdown()
+        logger.info("Сессия бота закрыта.")
+
+
+async def prepare_post(file_paths, settings, events, classifier=None):
+    """
+    Готовит пост без обращения к сети: фильтр файлов, подпись, хеши, file_id из кеша, отсев дублей,
+    предобработка фото и видео.
+    Вызывается заранее, пока бот ждёт времени поста, чтобы к отправке остался только сетевой вызов.
+    Возвращает подготовленный пост (словарь) или None, если отправлять нечего.
+    """
     try:
-        phrases = load_phrases()  # Загружаем фразы
-        text = generate_phrase_with_emoji(phrases) + "\n\n" + gui_instance.settings.get("DEFAULT_HASHTAGS", "")
+        #  Одна строка из индекса фраз профиля (диск - вне event loop), файл целиком не читается
+        phrase = await asyncio.to_thread(get_phrase_store(settings).pick)
+        text = add_emojis(phrase) + "\n\n" + settings.get("DEFAULT_HASHTAGS", "")
 
-        media_group = []
+        #  Тип каждого файла подтверждается сигнатурой - мусор с медийным расширением не загружаем
+        classifier = classifier or MediaClassifier.from_settings(settings)
+        verdicts = await asyncio.to_thread(lambda: [classifier.classify(path) for path in file_paths])
+
+        items = []  #  {path, kind} - файлы открываются только перед самой отправкой
         total_files = len(file_paths) # Общее количество файлов
-        for i, file_path in enumerate(file_paths):  # Добавляем индекс файла
-            _, ext = os.path.splitext(file_path)
-            ext = ext.lower()
+        for i, (file_path, (kind, reason)) in enumerate(zip(file_paths, verdicts)):
+            if kind is None:
+                events.log(f"⚠️ Файл {file_path} пропущен ({reason}).")
+                continue
+            items.append({"path": file_path, "kind": kind})
 
-            # Проверка на белый/черный список (дублируем логику, т.к. вызываем из другого модуля)
-            whitelist = [e.strip().lower() for e in gui_instance.settings.get("WHITELIST_EXTENSIONS", ".jpg,.jpeg,.png,.gif,.mp4").split(",")]
-            blacklist = [e.strip().lower() for e in gui_instance.settings.get("BLACKLIST_EXTENSIONS", "").split(",")]
+            # Обновляем прогресс *после* добавления файла в items
+            events.progress(int(((i + 1) / total_files) * 100))  # +1, т.к. индексы начинаются с 0
 
-            if (whitelist and ext not in whitelist) or (blacklist and ext in blacklist):
-                gui_instance.log_output.append(f"⚠️ Файл {file_path} пропущен (фильтр расширений).")
-                continue
+        if not items:
+            events.log("❌ Нет медиафайлов для отправки.")
+            return None
 
-            try:
-                if ext in (".jpg", ".jpeg", ".png"):
-                    with open(file_path, "rb") as file:
-                        media_group.append(telegram.InputMediaPhoto(file))
-                elif ext == ".mp4":
-                    with open(file_path, "rb") as file:
-                        media_group.append(telegram.InputMediaVideo(file))
-                else:
-                    gui_instance.log_output.append(f"⚠️ Неподдерживаемый тип файла: {file_path}. Пропускаем.")
-                    continue
-            except FileNotFoundError:
-                gui_instance.log_output.append(f"⚠️ Файл не найден: {file_path}. Пропускаем.")
-                continue
-            except OSError as e:
-                gui_instance.log_output.append(f"⚠️ Ошибка открытия файла: {file_path}. {e}. Пропускаем.")
-                continue
+        #  Уже загруженные ранее файлы отправляем по file_id, без повторной загрузки
+        cache = await asyncio.to_thread(get_file_id_cache, settings)
+        cached = await asyncio.to_thread(resolve_file_ids, items, cache)
+        if cached:
+            events.log(f"♻️ Из кеша file_id: {cached} из {len(items)} файлов.")
+
+        #  Пережатые/уменьшенные копии уже отправленных фото и видео не публикуем повторно
+        items = await drop_duplicates(items, settings, events)
+        if not items:
+            events.log("❌ Все файлы поста - дубли уже отправленных.")
+            return None
+
+        #  Крупные фото уменьшаем заранее (если включено) - меньше байтов на загрузку
+        await preprocess_images(items, settings, events)
+        #  Видео: длительность/размеры для Telegram и fast-start (moov в начале файла)
+        await prepare_videos(items, settings, events)
+        #  Лимиты Bot API проверяем до отправки: крупные фото - документами, слишком большие файлы - мимо
+        items = await asyncio.to_thread(fit_upload_limits, items, settings, events, cache)
+        if not items:
+            events.log("❌ Нет файлов, которые Bot API примет.")
+            return None
 
-            # Обновляем прогресс-бар *после* добавления файла в media_group
-            progress_value = int(((i + 1) / total_files) * 100)  # +1, т.к. индексы начинаются с 0
-            # используем QMetaObject.invokeMethod, так как мы в другом потоке
-            QMetaObject.invokeMethod(gui_instance.progress_bar, "setValue", Qt.ConnectionType.QueuedConnection, Q_ARG(int, progress_value))
+        return {"file_paths": list(file_paths), "items": items, "text": text}
 
+    except Exception as e:  # Общий Exception в конце
+        events.log(f"❌ Критическая ошибка при подготовке поста: {e}")
+        events.progress(0)
+        return None
+
+
+async def _send_request(app, channel_id, request_kind, request_items, caption, settings, events):
+    """Один запрос к Bot API. Возвращает (сообщения, отправленные файлы)."""
+    if request_kind == "album" and len(request_items) == 1:
+        request_kind = request_items[0]["kind"]  #  Альбом из одного файла Telegram не принимает
+    if request_kind == "album":
+        media_group, handles, included = await build_media_group(request_items, settings, events)
         if not media_group:
-            gui_instance.log_output.append("❌ Нет медиафайлов для отправки.")
+            return [], []
+        try:
+            #  Таймауты берутся из настроек пула (build_request)
+            messages = await app.bot.send_media_group(channel_id, media_group, caption=caption)
+        finally:
+            await asyncio.to_thread(close_handles, handles)
+        return list(messages), included
+
+    item = request_items[0]
+    try:
+        media, handles = await open_single(item, settings)
+    except OSError as e:
+        events.log(f"⚠️ Ошибка открытия файла: {item['path']}. {e}. Пропускаем.")
+        return [], []
+    try:
+        if request_kind == KIND_PHOTO:
+            message = await app.bot.send_photo(channel_id, media, caption=caption)
+        elif request_kind == KIND_VIDEO:
+            message = await app.bot.send_video(channel_id, media, caption=caption, **(item.get("video_meta") or {}))
+        elif request_kind == KIND_ANIMATION:
+            message = await app.bot.send_animation(channel_id, media, caption=caption)
+        else:
+            message = await app.bot.send_document(channel_id, media, caption=caption)
+    finally:
+        await asyncio.to_thread(close_handles, handles)
+    return [message], [item]
+
+
+class SendProgress:
+    """
+    Какие файлы поста уже отправлены в каждый канал: {канал: [(пути, message_ids)]}.
+    Пустой список message_ids - файл пропущен (Telegram его не принял).
+    Каждая отправленная часть сразу сохраняется через on_chunk(канал, пути, message_ids),
+    поэтому повтор (в том числе после перезапуска) продолжается с первой неотправленной части.
+    """
+
+    def __init__(self, chunks=None, on_chunk=None):
+        self.chunks = {channel: list(records) for channel, records in (chunks or {}).items()}
+        self.on_chunk = on_chunk
+        #  Для метрик: загружено байт (без отправленных по file_id) и число повторов
+        self.bytes_uploaded = 0
+        self.retries = 0
+
+    def done_paths(self, channel):
+        return {path for paths, _ in self.chunks.get(channel, ()) for path in paths}
+
+    def message_ids(self, channel):
+        return [message_id for _, ids in self.chunks.get(channel, ()) for message_id in ids]
+
+    def delivered_paths(self):
+        """Файлы, которые ушли хотя бы в один канал."""
+        return {path for records in self.chunks.values() for paths, ids in records if ids for path in paths}
+
+    async def record(self, channel, paths, message_ids):
+        self.chunks.setdefault(channel, []).append((list(paths), list(message_ids)))
+        if self.on_chunk is not None:
+            await asyncio.to_thread(self.on_chunk, channel, list(paths), list(message_ids))
+
+
+def _total_size(paths):
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+async def _send_isolating(app, channel_id, request_kind, request_items, caption, cache, settings, events, progress):
+    """
+    Отправляет один запрос и записывает его в progress.
+    Если Telegram не принял запрос из-за файла, запрос делится пополам, пока не останется
+    один проблемный файл: он пропускается, остальные файлы уходят.
+    """
+    upload_paths = [item.get("upload_path") or item["path"] for item in request_items if not item.get("file_id")]
+    try:
+        messages, included = await _send_request(app, channel_id, request_kind, request_items, caption, settings, events)
+    except telegram.error.BadRequest as e:
+        if any(marker in str(e).lower() for marker in CHAT_ERROR_MARKERS):
+            raise
+        #  Telegram мог отклонить устаревший file_id из кеша - тогда повторяем с загрузкой файлов
+        stale = await asyncio.to_thread(forget_cached_file_ids, request_items, cache)
+        if stale:
+            events.log(f"⚠️ Telegram отклонил {stale} file_id из кеша ({e}). Загружаем файлы заново.")
+            await _send_isolating(app, channel_id, request_kind, request_items, caption, cache, settings, events, progress)
+            return
+        if len(request_items) == 1:
+            events.log(f"⚠️ Telegram не принял файл {request_items[0]['path']} ({e}). Файл пропущен.")
+            await progress.record(channel_id, [request_items[0]["path"]], [])
             return
+        events.log(f"🔍 Telegram не принял часть поста ({e}). Ищем проблемный файл среди {len(request_items)}.")
+        half = len(request_items) // 2
+        for part in (request_items[:half], request_items[half:]):
+            part_caption = None if progress.message_ids(channel_id) else caption
+            await _send_isolating(app, channel_id, request_kind, part, part_caption, cache, settings, events, progress)
+        return
+
+    await asyncio.to_thread(remember_file_ids, included, messages, cache)
+    progress.bytes_uploaded += await asyncio.to_thread(_total_size, upload_paths)
+    await progress.record(channel_id, [item["path"] for item in request_items], [m.message_id for m in messages])
+
+
+class _ChannelEvents:
+    """Добавляет к сообщениям лога имя канала (при отправке в несколько каналов)."""
+
+    def __init__(self, events, channel_id):
+        self._events = events
+        self._prefix = f"[{channel_id}] "
+
+    def log(self, message):
+        self._events.log(self._prefix + message)
+
+    def __getattr__(self, name):
+        return getattr(self._events, name)
+
+
+async def _publish_to_channel(app, channel_id, items, text, cache, settings, events, progress):
+    """
+    Отправляет файлы поста в один канал с повторами при таймаутах.
+    Темп запросов задаёт ограничитель сессии (AdaptiveRateLimiter), здесь только повторы с backoff.
+    Уже отправленные части (progress) повторно не отправляются.
+    Возвращает список message_id или None, если пост не ушёл.
+    """
+    max_attempts = 3  # Максимальное количество попыток отправки
+    backoff_base = float(settings.get("BACKOFF_BASE_SECONDS", 2))
+    backoff_cap = float(settings.get("BACKOFF_MAX_SECONDS", 60))
+    attempt = 0
+    success = False
 
-        max_attempts = 3  # Максимальное количество попыток отправки
-        attempt = 0
-        success = False
+    while attempt < max_attempts and not success:
+        attempt += 1
+        #  Продолжаем с первой неотправленной части
+        done = progress.done_paths(channel_id)
+        pending = [item for item in items if item["path"] not in done]
+        if done and pending:
+            events.log(f"↪️ Продолжаем отправку: осталось {len(pending)} из {len(items)} файлов.")
+        requests = plan_requests(pending, settings)
+        if len(requests) > 1:
+            events.log(f"⚠️ Пост отправляется несколькими сообщениями: {len(requests)}.")
+        try:
+            #  Файлы открываются заново на каждую попытку: потоковая загрузка читает их один раз
+            for n, (request_kind, request_items) in enumerate(requests):
+                caption = None if progress.message_ids(channel_id) else text  #  Подпись - у первого отправленного сообщения
+                await _send_isolating(app, channel_id, request_kind, request_items, caption, cache, settings, events, progress)
+                if len(requests) > 1:
+                    #  Паузу между частями выдерживает ограничитель по лимиту канала
+                    events.log(f"✅ Отправлена часть {n + 1} поста.")
 
-        while attempt < max_attempts and not success:
-            attempt += 1
+            message_ids = progress.message_ids(channel_id)
+            if not message_ids:
+                events.log("❌ Нет медиафайлов для отправки.")
+                break
+            if len(requests) == 1:
+                events.log("✅ Пост успешно отправлен.")
+            success = True  # Успешно отправили
+
+        except telegram.error.TimedOut:
+            progress.retries += 1
+            delay = backoff_delay(attempt, backoff_base, backoff_cap)
+            events.log(f"❌ Ошибка отправки: Таймаут. Повторная попытка {attempt}/{max_attempts} через {delay:.1f} с.")
+            await asyncio.sleep(delay)  # Ждем перед повторной попыткой
+        except telegram.error.RetryAfter as e:
+            #  Ограничитель уже исчерпал свои повторы - ждём, сколько просит Telegram, и пробуем ещё раз
+            progress.retries += 1
+            delay = retry_after_seconds(e) + backoff_delay(attempt, backoff_base, backoff_cap)
+            events.log(f"🐢 Telegram ограничил частоту запросов. Повторная попытка {attempt}/{max_attempts} через {delay:.0f} с.")
+            await asyncio.sleep(delay)
+        except TelegramError as e:
+            events.log(f"❌ Ошибка отправки: {e}")
+            break  # Прерываем цикл при других ошибках Telegram API
+
+    return progress.message_ids(channel_id) if success else None
+
+
+async def publish_post(bot_token, channel_id, prepared, settings, events, progress=None):
+    """
+    Отправляет подготовленный prepare_post пост в один или несколько каналов.
+    Байты загружаются один раз: первый канал, принявший пост, получает файлы,
+    остальные обслуживаются параллельно (не больше FANOUT_CONCURRENCY) по полученным file_id.
+    progress (SendProgress) - уже отправленные части; новые части записываются в него.
+    Возвращает словарь {канал: список message_id или None} или None, если пост не ушёл никуда.
+    """
+    progress = progress or SendProgress()
+    try:
+        app = await get_bot_session(bot_token, settings)
+        cache = await asyncio.to_thread(get_file_id_cache, settings)
+        items = prepared["items"]
+        text = prepared["text"]
+        file_paths = prepared["file_paths"]
+        channels = parse_channel_ids(channel_id)
+        multi = len(channels) > 1
+
+        def channel_events(channel):
+            return _ChannelEvents(events, channel) if multi else events
+
+        async def publish(channel, channel_items):
+            #  Сбой одного канала (не только TelegramError) не должен мешать остальным
             try:
-                if len(media_group) > 10:
-                    gui_instance.log_output.append("⚠️ Группа содержит более 10 элементов. Разбиваем на части.")
-                    for i in range(0, len(media_group), 10):
-                        chunk = media_group[i:i + 10]
-                        #  Увеличиваем таймауты:
-                        await app.bot.send_media_group(channel_id, chunk, caption=text if i == 0 else None, read_timeout=60, write_timeout=60, connect_timeout=60)
-                        QMetaObject.invokeMethod(
-                            gui_instance.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                            Q_ARG(str, f"✅ Отправлена часть {i // 10 + 1} поста.")
-                        )
-                        await asyncio.sleep(30)  # Задержка между частями
-                else:
-                    #  Увеличиваем таймауты:
-                    await app.bot.send_media_group(channel_id, media_group, caption=text, read_timeout=60, write_timeout=60, connect_timeout=60)
-                    QMetaObject.invokeMethod(
-                        gui_instance.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                        Q_ARG(str, "✅ Пост успешно отправлен.")
-                    )
-
-                success = True  # Успешно отправили
-
-            except telegram.error.TimedOut:
-                gui_instance.log_output.append(f"❌ Ошибка отправки: Таймаут. Повторная попытка {attempt}/{max_attempts}.")
-                await asyncio.sleep(5)  # Ждем перед повторной попыткой
-            except TelegramError as e:
-                gui_instance.log_output.append(f"❌ Ошибка отправки: {e}")
-                break  # Прерываем цикл при других ошибках Telegram API
+                return await _publish_to_channel(
+                    app, channel, channel_items, text, cache, settings, channel_events(channel), progress
+                )
+            except Exception as e:
+                channel_events(channel).log(f"❌ Ошибка отправки: {e}")
+                return None
+
+        results = {}
+        remaining = list(channels)
+        while remaining:
+            #  Загружает файлы первый канал, принявший пост; при сбое загрузку берёт следующий
+            channel = remaining.pop(0)
+            results[channel] = await publish(channel, items)
+            if results[channel]:
+                break
+
+        if remaining:
+            semaphore = asyncio.Semaphore(max(1, int(settings.get("FANOUT_CONCURRENCY", 3))))
+
+            async def mirror(channel):
+                #  Своя копия: file_id из первого канала считаем "кешированными" - при отказе файл загрузится заново
+                mirror_items = [dict(item, from_cache=bool(item.get("file_id")) or item.get("from_cache", False)) for item in items]
+                async with semaphore:
+                    return channel, await publish(channel, mirror_items)
+
+            for channel, message_ids in await asyncio.gather(*(mirror(ch) for ch in remaining)):
+                results[channel] = message_ids
+
+        success = any(results.values())
+        if multi:
+            events.log(f"📡 Каналы: успешно {sum(1 for ids in results.values() if ids)} из {len(channels)}.")
 
         if success:
-            # Удаляем файлы *только* если отправка была успешной
+            # Убираем файлы *только* если отправка была успешной
+            #  Файлы, которые Telegram не принял ни в один канал, остаются на диске
+            delivered = progress.delivered_paths()
             for file_path in file_paths:
-                try:
-                    if os.path.exists(file_path):
-                        await asyncio.to_thread(os.remove, file_path)
-                        QMetaObject.invokeMethod(
-                            gui_instance.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                            Q_ARG(str, f"🗑️ Файл {file_path} удалён.")
-                        )
-                    else:
-                        QMetaObject.invokeMethod(
-                            gui_instance.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                            Q_ARG(str, f"⚠️ Файл {file_path} уже удалён.")
-                        )
-                except Exception as e:
-                    QMetaObject.invokeMethod(
-                        gui_instance.log_output, "append", Qt.ConnectionType.QueuedConnection,
-                        Q_ARG(str, f"❌ Ошибка удаления файла: {e}")
-                    )
-
-            # Сбрасываем прогресс-бар после успешной отправки
-            QMetaObject.invokeMethod(gui_instance.progress_bar, "setValue", Qt.ConnectionType.QueuedConnection, Q_ARG(int, 0))
+                if file_path not in delivered:
+                    events.log(f"⚠️ Файл {file_path} не отправлен и оставлен в папке.")
+            #  Перенос в архив идёт в фоне - отправка его не ждёт
+            get_archiver().submit([path for path in file_paths if path in delivered], settings, events)
+            await remember_posted(items, delivered, settings, [channel for channel, ids in results.items() if ids])
+
+            # Сбрасываем прогресс после успешной отправки
+            events.progress(0)
 
         else:
-            gui_instance.log_output.append("❌ Пост не был отправлен после нескольких попыток. Файлы сохранены.")
+            events.log("❌ Пост не был отправлен после нескольких попыток. Файлы сохранены.")
+
+        return results if success else None
 
     except Exception as e:  # Общий Exception в конце
-        gui_instance.log_output.append(f"❌ Критическая ошибка в send_post: {e}")
-        #  Сбрасываем прогресс-бар в случае критической ошибки:
-        QMetaObject.invokeMethod(gui_instance.progress_bar, "setValue", Qt.ConnectionType.QueuedConnection, Q_ARG(int, 0))
+        events.log(f"❌ Критическая ошибка в send_post: {e}")
+        #  Сбрасываем прогресс в случае критической ошибки:
+        events.progress(0)
+        return None
+
+
+async def send_telegram_post(bot_token, channel_id, file_paths, settings, events):
+    """
+    Отправляет пост в Telegram: prepare_post + publish_post.
+    О ходе отправки сообщает через events (log/progress), Qt здесь не используется.
+    Возвращает {канал: список message_id или None} или None, если пост не ушёл.
+    """
+    prepared = await prepare_post(file_paths, settings, events)
+    if prepared is None:
+        return None
+    return await publish_post(bot_token, channel_id, prepared, settings, events)
 
-async def start_telegram_bot(bot_token, gui_instance):
-    """Запускает бота."""
-    app = Application.builder().token(bot_token).rate_limiter(AIORateLimiter()).build()
+async def start_telegram_bot(bot_token, settings, events):
+    """
+    Запускает бота: создаёт долгоживущую сессию и проверяет токен.
+    Возвращает True, если токен рабочий.
+    """
     try:
+        app = await get_bot_session(bot_token, settings)
         me = await app.bot.get_me()
-        gui_instance.log_output.append(f"✅ Бот запущен.  Имя бота: {me.username}")
-        gui_instance.set_bot_running(True)  # Устанавливаем статус бота
+        events.log(f"✅ Бот запущен.  Имя бота: {me.username}")
+        return True
 
     except TelegramError as e:
-        gui_instance.log_output.append(f"❌ Ошибка при проверке токена: {e}")
-        gui_instance.show_settings_dialog()
+        await close_bot_session(bot_token)
+        events.log(f"❌ Ошибка при проверке токена: {e}")
+        return False
 
-async def stop_telegram_bot(gui_instance):
-    """Останавливает бота"""
-    gui_instance.set_bot_running(False)
-    gui_instance.log_output.append("⛔ Бот остановлен")
\ No newline at end of file
+async def stop_telegram_bot(bot_token, events):
+    """Останавливает бота и закрывает его сессию."""
+    await close_bot_session(bot_token)
+    events.log("⛔ Бот остановлен")
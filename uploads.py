@@ -0,0 +1,194 @@
+import asyncio
+import os
+import queue
+import threading
+
+import telegram
+
+#  Размер блока чтения файла при потоковой загрузке
+UPLOAD_CHUNK_KB = 256
+#  Потолок памяти под буфер чтения одной загрузки
+UPLOAD_MEMORY_LIMIT_MB = 4
+
+
+class ReadAheadFile:
+    """
+    Файл для потоковой загрузки: фоновый поток читает его блоками в очередь ограниченного размера,
+    а HTTP-клиент забирает готовые блоки. Диск читается вне event loop, а в памяти
+    одновременно лежит не больше max_chunks блоков, каким бы большим ни был файл.
+    """
+
+    def __init__(self, path, chunk_size, max_chunks):
+        self.name = path
+        self._fh = open(path, "rb")
+        self._chunk_size = chunk_size
+        self._max_chunks = max_chunks
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self._max_chunks)
+        self._stop = threading.Event()
+        self._thread = None
+        self._buffer = b""
+        self._eof = False
+        self._pos = 0
+
+    def _reader(self, fh, q, stop):
+        try:
+            while not stop.is_set():
+                data = fh.read(self._chunk_size)
+                while not stop.is_set():
+                    try:
+                        q.put(data, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+                if not data:
+                    return
+        except Exception as e:
+            q.put(e)
+
+    def _stop_reader(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()  #  Освобождаем место, если поток ждёт на put
+            except queue.Empty:
+                pass
+            self._thread.join(timeout=0.1)
+
+    def fileno(self):
+        #  Нужен HTTP-клиенту, чтобы узнать размер файла через fstat
+        return self._fh.fileno()
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("ReadAheadFile поддерживает только seek(0)")
+        if self._pos or self._thread is not None:
+            self._stop_reader()
+            self._fh.seek(0)
+            self._reset()
+        return 0
+
+    def read(self, size=-1):
+        if self._thread is None and not self._eof:
+            self._thread = threading.Thread(target=self._reader, args=(self._fh, self._queue, self._stop), daemon=True)
+            self._thread.start()
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self._queue.get()
+            if isinstance(data, Exception):
+                raise data
+            if not data:
+                self._eof = True
+                break
+            self._buffer += data
+        if size < 0:
+            size = len(self._buffer)
+        out, self._buffer = self._buffer[:size], self._buffer[size:]
+        self._pos += len(out)
+        return out
+
+    def close(self):
+        self._stop_reader()
+        self._fh.close()
+
+
+def upload_buffer_limits(settings):
+    """(размер блока, число блоков в буфере) по настройкам UPLOAD_CHUNK_KB и UPLOAD_MEMORY_LIMIT_MB."""
+    chunk_size = max(16, int(settings.get("UPLOAD_CHUNK_KB", UPLOAD_CHUNK_KB))) * 1024
+    memory_limit = max(1, int(settings.get("UPLOAD_MEMORY_LIMIT_MB", UPLOAD_MEMORY_LIMIT_MB))) * 1024 * 1024
+    return chunk_size, max(1, memory_limit // chunk_size)
+
+
+async def open_input_file(file_path, settings, filename=None, attach=False):
+    """
+    Открывает файл вне event loop для потоковой загрузки.
+    Возвращает (InputFile, открытый файл) - файл нужно закрыть после отправки.
+    """
+    chunk_size, max_chunks = upload_buffer_limits(settings)
+    fh = await asyncio.to_thread(ReadAheadFile, file_path, chunk_size, max_chunks)
+    #  read_file_handle=False: PTB не читает файл целиком, а отдаёт дескриптор HTTP-клиенту
+    input_file = telegram.InputFile(fh, filename=filename or os.path.basename(file_path), attach=attach, read_file_handle=False)
+    return input_file, fh
+
+
+async def open_media(file_path, kind, settings, filename=None, video_meta=None):
+    """
+    Открывает файл вне event loop и оборачивает в InputMedia для потоковой загрузки.
+    Возвращает (InputMedia, открытый файл) - файл нужно закрыть после отправки.
+    """
+    input_file, fh = await open_input_file(file_path, settings, filename=filename, attach=True)
+    if kind == "video":
+        return telegram.InputMediaVideo(input_file, **(video_meta or {})), fh
+    if kind == "document":
+        return telegram.InputMediaDocument(input_file), fh
+    return telegram.InputMediaPhoto(input_file), fh
+
+
+def media_by_file_id(file_id, kind, video_meta=None):
+    """InputMedia для уже загруженного в Telegram файла."""
+    if kind == "video":
+        return telegram.InputMediaVideo(file_id, **(video_meta or {}))
+    if kind == "document":
+        return telegram.InputMediaDocument(file_id)
+    return telegram.InputMediaPhoto(file_id)
+
+
+async def build_media_group(items, settings, events):
+    """
+    Готовит медиагруппу из списка словарей {path, kind[, file_id, upload_path]}.
+    Файлы с известным file_id отправляются по нему, остальные - потоковой загрузкой
+    (обработанная копия upload_path, если она есть).
+    Недоступные файлы пропускаются с записью в лог.
+    Возвращает (media_group, открытые файлы, вошедшие в группу items).
+    """
+    media_group = []
+    handles = []
+    included = []
+    for item in items:
+        file_path = item["path"]
+        if item.get("file_id"):
+            media_group.append(media_by_file_id(item["file_id"], item["kind"], item.get("video_meta")))
+            included.append(item)
+            continue
+        try:
+            upload_path = item.get("upload_path") or file_path
+            media, fh = await open_media(
+                upload_path, item["kind"], settings,
+                filename=os.path.basename(upload_path), video_meta=item.get("video_meta"),
+            )
+        except FileNotFoundError:
+            events.log(f"⚠️ Файл не найден: {file_path}. Пропускаем.")
+            continue
+        except OSError as e:
+            events.log(f"⚠️ Ошибка открытия файла: {file_path}. {e}. Пропускаем.")
+            continue
+        media_group.append(media)
+        handles.append(fh)
+        included.append(item)
+    return media_group, handles, included
+
+
+async def open_single(item, settings):
+    """
+    Файл для одиночной отправки (sendPhoto/sendVideo/sendAnimation/sendDocument): file_id или потоковый InputFile.
+    Возвращает (файл для Bot API, список открытых файлов).
+    """
+    if item.get("file_id"):
+        return item["file_id"], []
+    upload_path = item.get("upload_path") or item["path"]
+    input_file, fh = await open_input_file(upload_path, settings)
+    return input_file, [fh]
+
+
+def close_handles(handles):
+    for fh in handles:
+        try:
+            fh.close()
+        except OSError:
+            pass
@@ -4,6 +4,7 @@ import shutil
 import random
 import logging
 import configparser  #  Добавляем configparser сюда
+import time
 
 # Логирование
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -15,6 +16,8 @@ PHRASES_FILE_NAME = "phrases.txt"
 CONFIG_FILE_NAME = "config.ini"
 
 EMOJIS = ["🍆", "💦", "🔥", "😏", "✨", "🤗", "🎨", "👇"]
+#  Фразы, если файл фраз не найден или пуст
+DEFAULT_PHRASES = ["Вот это да!...", "Шикарно!..", "Огонь! 🔥"]
 
 def resource_path(relative_path):
     """
@@ -46,7 +49,10 @@ def check_disk_space(path, required_space_mb=10):
 
 def generate_phrase_with_emoji(phrases):
     """Генерирует фразу со случайными смайликами."""
-    phrase = random.choice(phrases)
+    return add_emojis(random.choice(phrases or DEFAULT_PHRASES))  #  Пустой список - стандартные фразы
+
+def add_emojis(phrase):
+    """Добавляет к фразе 1-3 случайных смайлика."""
     num_emojis = random.randint(1, 3)
     emojis = random.choices(EMOJIS, k=num_emojis)
     return phrase + " " + "".join(emojis)
@@ -78,7 +84,7 @@ def load_phrases(filename=PHRASES_FILE_NAME):
                     phrases.append(line.strip())
         except FileNotFoundError:
             logger.error(f"Файл с фразами '{filename}' не найден (ни в AppData, ни в ресурсах)!")
-            return ["Вот это да!...", "Шикарно!..", "Огонь! 🔥"]  # Стандартные фразы
+            return list(DEFAULT_PHRASES)  # Стандартные фразы
 
     return phrases
 
@@ -95,4 +101,21 @@ def save_phrases(phrases, filename=PHRASES_FILE_NAME):
                 f.write(phrase + "\n")
         logger.info("Фразы сохранены.")
     except Exception as e:
-        logger.error(f"Ошибка при сохранении фраз: {e}")
\ No newline at end of file
+        logger.error(f"Ошибка при сохранении фраз: {e}")
+
+
+def prune_dir(dir_path, max_age_days):
+    """Удаляет из папки кеша файлы старше max_age_days. Возвращает число удалённых. Блокирующая функция."""
+    if not os.path.isdir(dir_path):
+        return 0
+    deadline = time.time() - max_age_days * 86400
+    removed = 0
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed